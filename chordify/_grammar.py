@@ -0,0 +1,110 @@
+""" Lark grammar of chord notation, imported only when label is not handled by fast path of notation.parse """
+from lark.lark import Lark
+from lark.tree import Tree
+from lark.visitors import Transformer, v_args
+
+from .notation import _SHORTHANDS
+
+_Parser = Lark(r"""
+    chord: pitchname ":" shorthand components? bass?
+        | pitchname ":" components bass?
+        | pitchname bass?
+        | NONE
+    pitchname: NATURAL MODIFIER*
+    NATURAL: "A" | "B" | "C" | "D" | "E" | "F" | "G"
+    MODIFIER: "b" | "#"
+    components: "(" [STAR] interval ("," [STAR] interval)* ")"
+    bass: "/" interval
+    interval: (DIGIT+ | DIGIT+ ZERO) | MODIFIER* (DIGIT+ | DIGIT+ ZERO)
+    DIGIT: "1" | "2" | "3" | "4" | "5" | "6" | "7" | "8" | "9"
+    ZERO: "0"
+    !shorthand: "maj" | "min" | "dim" | "aug" | "maj7" | "min7" | "7" 
+                | "dim7" | "hdim7" | "minmaj7" | "maj6" | "min6" | "9" 
+                | "maj9" | "min9" | "sus2" | "sus4"
+    NONE: "N"
+    STAR: "*"
+""", start='chord', parser='lalr', cache=True)  # parser table is cached in temporary directory
+
+
+class _Notation(Transformer):
+
+    def __init__(self, visit_tokens=True):
+        super().__init__(visit_tokens)
+        self._shorthand = False
+        self._components = False
+        self._bass = False
+
+    @v_args(inline=True)
+    def chord(self, pitchname, shorthand=None, components=None, bass=None):
+        if not self._shorthand and self._components:
+            if self._bass:
+                bass = components
+            components = shorthand
+            shorthand = None
+        elif self._shorthand and not self._components and self._bass:
+            bass = components
+            components = None
+        elif not self._components and self._bass:
+            bass = shorthand
+            shorthand = None
+
+        def modify_shorthand(short=None, modifier=None, default_interval=('1', '3', '5')):
+            if short is not None and modifier is None:
+                return short
+            if short is None and modifier is not None:
+                short = default_interval + tuple(
+                    s for s in modifier if s[0] != '*')  # no shorthand, add default interval
+                modifier = tuple(s for s in modifier if s[0] == '*')
+            if short is not None and modifier is not None:
+                _short = ()
+
+                _remove = tuple(s[1:] for s in modifier if s[0] == '*')
+                for s in short:
+                    if s not in _remove:
+                        _short += (s,)
+                for s in tuple(s for s in modifier if s[0] != '*'):
+                    if s not in _short:
+                        _short += (s,)
+                return _short
+            return default_interval  # no shorthand or component, return default interval
+
+        _components = modify_shorthand(shorthand, components)
+        _components = _components if bool(_components) else None
+        if pitchname == 'N':
+            return 'N', _components, bass
+        return pitchname, _components, bass
+
+    def pitchname(self, children):
+        return ''.join(children)
+
+    @v_args(inline=True)
+    def shorthand(self, token):
+        self._shorthand = True
+        if token not in _SHORTHANDS:
+            raise ValueError
+        return _SHORTHANDS[token]
+
+    @v_args(inline=True)
+    def bass(self, tree):
+        self._bass = True
+        return ''.join(tree.children)
+
+    def components(self, children):
+        self._components = True
+        star = False
+        result = tuple()
+        for elm in children:
+            if isinstance(elm, Tree):
+                result += (('*' + ''.join(elm.children)) if star else ''.join(elm.children),)
+                star = False
+            else:  # star
+                if elm == '*':
+                    star = True
+                else:
+                    raise ValueError
+        return result
+
+
+def parse(string: str):
+    """ Returns pitchname, components, bass """
+    return _Notation().transform(_Parser.parse(string))
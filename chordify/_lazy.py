@@ -0,0 +1,34 @@
+import importlib
+import importlib.util
+import sys
+import threading
+from types import ModuleType
+
+_lock = threading.RLock()
+
+
+class _LazyModule(ModuleType):
+    """ Placeholder of module which is imported on first access of its attribute
+
+    importlib.util.LazyLoader is not thread safe before Python 3.12.3, thread which accessed module while other
+    thread executed it saw partly executed module. Placeholder imports module under lock instead, so concurrent first
+    accesses wait for one complete import.
+    """
+
+    def __getattr__(self, attr: str):
+        module = self.__dict__.get('_module')
+        if module is None:
+            with _lock:
+                module = importlib.import_module(self.__name__)
+            self._module = module
+        return getattr(module, attr)
+
+
+def lazy_import(name: str) -> ModuleType:
+    """ Returns module which is imported on first attribute access, so import cost is paid only if it is used """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    if importlib.util.find_spec(name) is None:
+        raise ModuleNotFoundError("No module named '%s'" % name, name=name)
+    return _LazyModule(name)
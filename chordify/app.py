@@ -1,27 +1,24 @@
 import logging
 import os
-import pickle
 import tempfile
 from abc import abstractmethod
 from collections import ChainMap
+from functools import lru_cache
 from itertools import product, tee
-from pickle import Pickler, Unpickler
-from typing import Iterable, Tuple, Mapping, runtime_checkable, Protocol, Sequence
-
-from joblib import delayed, Parallel
-from librosa import note_to_hz
+from typing import Iterable, Tuple, Mapping, runtime_checkable, Protocol, Sequence, Iterator
 
 from .audio_processing import _AudioProcessingFactory, PathLoadStrategyFactory, CQTExtractionStrategyFactory, \
     DefaultChromaStrategyFactory, DefaultSegmentationStrategyFactory, LoadStrategyFactory, ExtractionStrategyFactory, \
     ChromaStrategyFactory, SegmentationStrategyFactory, VectorSegmentationStrategyFactory
 from .chord_recognition import _ChordRecognizerFactory, TemplatePredictStrategyFactory, PredictStrategyFactory, \
     PredictStrategy
-from .learn import SVMClassifier
+from . import model, concurrency
 from .notation import Chord
 
 _logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=None)
 def _binary_templates() -> Sequence[Chord]:
     _key = ('C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B')
     _type = (':maj', ':min')
@@ -34,6 +31,11 @@ def _harmonic_templates() -> Sequence[Chord]:
     return tuple(Chord(''.join(s)) for s in product(_key, _type))
 
 
+def BinaryTemplatePredictStrategyFactory(config: dict) -> PredictStrategy:
+    """ Template predict strategy of major and minor chords, templates are built on first use """
+    return TemplatePredictStrategyFactory(_binary_templates())(config)
+
+
 default_config = {
 
     # 'DEBUG': True,
@@ -42,16 +44,57 @@ default_config = {
     'EXTRACTION_STRATEGY_FACTORY': CQTExtractionStrategyFactory,
     'CHROMA_STRATEGY_FACTORY': DefaultChromaStrategyFactory,
     'SEGMENTATION_STRATEGY_FACTORY': DefaultSegmentationStrategyFactory,
-    'PREDICT_STRATEGY_FACTORY': TemplatePredictStrategyFactory(_binary_templates()),
+    'PREDICT_STRATEGY_FACTORY': BinaryTemplatePredictStrategyFactory,
 
     'SAMPLING_FREQUENCY': 22100,
     'N_BINS': 36 * 7,
     'N_OCTAVES': 7,
     'BINS_PER_OCTAVE': 36,
-    'MIN_FREQ': note_to_hz('C1'),
+    'MIN_FREQ': 32.70319566257483,  # C1
     'HOP_LENGTH': 512,
-
-    'MODEL_OUTPUT_DIR': tempfile.gettempdir()
+    # audio is loaded at lowest sampling frequency which keeps CQT range, SAMPLING_FREQUENCY and HOP_LENGTH are
+    # divided by same power of 2, see chordify.audio_processing.minimal_sampling
+    'AUTO_SAMPLING_FREQUENCY': False,
+    # deviation from A440 in fractions of CQT bin, 'excerpt' estimates it from TUNING_EXCERPT seconds of every audio,
+    # 'cache' estimates it from whole audio once per content hash
+    'TUNING': 0.,
+    'TUNING_EXCERPT': 10.,
+    # regions whose RMS is below SILENCE_THRESHOLD dBFS for SILENCE_MIN_DURATION seconds are not extracted nor
+    # predicted and are recognized as N, None disables silence gate
+    'SILENCE_THRESHOLD': None,
+    'SILENCE_MIN_DURATION': 0.5,
+    # coarse to fine time resolution, coarse hop is HOP_LENGTH times ADAPTIVE_RESOLUTION, fine hop is HOP_LENGTH
+    # around harmonic changes of coarse chroma, see chordify.audio_processing._AdaptiveAudioProcessing, None disables
+    'ADAPTIVE_RESOLUTION': None,
+    # two pass recognition, frames are scored only against chords in estimated key of track unless fraction of frames
+    # which fit scale of key is below KEY_MIN_CONFIDENCE, see chordify.key, Transcript.iter_audio estimates key of
+    # every block (5 s doubling up to 60 s) separately, so key may change between blocks
+    'KEY_AWARE': False,
+    'KEY_MIN_CONFIDENCE': 0.6,
+    # predictions are cached by frames quantized to PREDICT_CACHE_LEVELS levels of pitch class, at most
+    # PREDICT_CACHE_SIZE frames, None disables cache, cache cannot be combined with KEY_AWARE,
+    # see chordify.chord_recognition.memoization_report
+    'PREDICT_CACHE_LEVELS': None,
+    'PREDICT_CACHE_SIZE': 65536,
+
+    'MODEL_OUTPUT_DIR': tempfile.gettempdir(),
+    # memory mapping of loaded model arrays, None loads them into memory
+    'MODEL_MMAP_MODE': 'r',
+
+    # hyper-parameter search of learned classifiers, see chordify.learn._CandidateSearch
+    'SEARCH': 'grid',
+    'SEARCH_MAX_FITS': None,
+    'SEARCH_MAX_TIME': None,
+    # number of CPUs of all pools and native thread pools, None uses all CPUs, see chordify.concurrency
+    'N_JOBS': None,
+    # number of samples whose features are extracted at once by learning
+    'LEARN_BATCH_SIZE': 64,
+
+    # online recognition, see chordify.online, in seconds: period of extraction, time constant of chroma smoothing
+    # and time for which new chord must win before change is reported
+    'ONLINE_BLOCK': 0.25,
+    'ONLINE_SMOOTHING': 0.25,
+    'ONLINE_HOLD': 0.1
 }
 
 
@@ -63,6 +106,10 @@ class Transcript(Protocol):
     def from_audio(self, audio_filepath: str) -> Sequence[Tuple[float, object]]:
         """ Transcript audio file. Returns sequence of timestamps and chords."""
 
+    def iter_audio(self, audio_filepath: str) -> Iterator[Sequence[Tuple[float, object]]]:
+        """ Transcript audio file block by block. Yields sequences of timestamps and chords as they are recognized."""
+        yield self.from_audio(audio_filepath)
+
 
 @runtime_checkable
 class LearnedStrategy(Protocol):
@@ -136,6 +183,14 @@ class _Transcript(Transcript):
 
         return chord_sequence
 
+    def iter_audio(self, audio_filepath: str):
+        _logger.info('Starting to analyze audio file in blocks: %s' % audio_filepath)
+
+        for frame, time in self.audio.process_blocks(audio_filepath):
+            yield self.recognize.apply(tuple(zip(time, frame.T)))
+
+        _logger.info('Analysis successfully done.')
+
 
 class TranscriptBuilder(_ConfigBuilder):
     """ Use for instantiate Transcript """
@@ -180,9 +235,18 @@ class _LearnedStrategy(LearnedStrategy):
 
         raise AttributeError
 
+    def predict_batch(self, frames):
+        """ Predict all frames of (T, 12) matrix, falls back to frame by frame prediction """
+        if hasattr(self._predict_strategy, 'predict_batch'):
+            return self._predict_strategy.predict_batch(frames)
+        return tuple(self._predict_strategy.predict(frame) for frame in frames)
+
+    def compile(self) -> LearnedStrategy:
+        """ Returns strategy evaluated by NumPy instead of scikit-learn """
+        return _LearnedStrategy(model.compile_strategy(self._predict_strategy), self._model_output_dir)
+
     def save(self, filename: str):
-        with open(os.path.join(self._model_output_dir, filename), 'wb') as file:
-            Pickler(file, pickle.DEFAULT_PROTOCOL).dump(self)
+        model.save(os.path.join(self._model_output_dir, filename), self._predict_strategy)
 
 
 class _Learner(Learner):
@@ -192,27 +256,44 @@ class _Learner(Learner):
 
         self.audio = _AudioProcessingFactory(config)
         self.model_output = config['MODEL_OUTPUT_DIR']
+        self.mmap_mode = config['MODEL_MMAP_MODE']
+        self.search = config['SEARCH']
+        self.search_max_fits = config['SEARCH_MAX_FITS']
+        self.search_max_time = config['SEARCH_MAX_TIME']
+        self.batch_size = config['LEARN_BATCH_SIZE']
+        self.n_jobs = config['N_JOBS']
 
     def from_samples(self, samples: Iterable[Tuple[str, str]]) -> LearnedStrategy:
+        # scikit-learn is imported only by learning, loaded models are evaluated by NumPy
+        from .learn import SVMClassifier
+
         _logger.info('Learning of chords has begun.')
 
         label_set, vector_time_set = tee(samples)
 
         label_set = tuple(label_filepath[0] for label_filepath in label_set)
-        vector_time_set = Parallel(n_jobs=2)(
-            delayed(self.audio.process)(label_filepath[1]) for label_filepath in vector_time_set
+        filepaths = tuple(label_filepath[1] for label_filepath in vector_time_set)
+        # features of batch are extracted at once, so fixed costs are paid once per batch
+        starts = range(0, len(filepaths), self.batch_size)
+        budget = concurrency.split(self.n_jobs, min(concurrency.cpu_budget(self.n_jobs), max(1, len(starts))))
+        vector_time_set = budget.parallel()(
+            budget.delayed(self.audio.process_batch)(filepaths[start:start + self.batch_size]) for start in starts
         )
-        vector_set = tuple(vector_time[0] for vector_time in vector_time_set)
+        vector_set = tuple(vector_time[0] for batch in vector_time_set for vector_time in batch)
 
         # TODO change classifier for argument or builder setter
-        strategy = _LearnedStrategy(SVMClassifier(vector_set, label_set), self.model_output)
+        strategy = _LearnedStrategy(SVMClassifier(vector_set, label_set,
+                                                  search=self.search,
+                                                  max_fits=self.search_max_fits,
+                                                  max_time=self.search_max_time,
+                                                  n_jobs=self.n_jobs), self.model_output)
 
         _logger.info('Learning of chords was successful.')
         return strategy
 
     def load(self, filename: str) -> LearnedStrategy:
-        with open(os.path.join(self.model_output, filename), 'rb') as file:
-            return Unpickler(file).load()
+        return _LearnedStrategy(model.load(os.path.join(self.model_output, filename), self.mmap_mode),
+                                self.model_output)
 
 
 class LearnerBuilder(_ConfigBuilder):
@@ -223,6 +304,13 @@ class LearnerBuilder(_ConfigBuilder):
         self._config['MODEL_OUTPUT_DIR'] = path
         return self
 
+    def setSearch(self, search: str, max_fits: int = None, max_time: float = None):
+        """ Hyper-parameter search: grid, random or halving with optional fit count or time (seconds) budget """
+        self._config['SEARCH'] = search
+        self._config['SEARCH_MAX_FITS'] = max_fits
+        self._config['SEARCH_MAX_TIME'] = max_time
+        return self
+
     @staticmethod
     def default() -> Learner:
         return _Learner(dict(ChainMap(
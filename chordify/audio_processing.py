@@ -1,15 +1,34 @@
+import hashlib
 import logging
+import math
+import threading
+import time
+from collections import OrderedDict
 from abc import abstractmethod
 from functools import lru_cache
-from typing import Any, Protocol, runtime_checkable, Union, Sequence
+from typing import Any, Protocol, runtime_checkable, Union, Sequence, Iterator, Tuple, NamedTuple
 
-import librosa
 import numpy
 
-from .hcdf import get_segments
+from ._lazy import lazy_import
+from .hcdf import get_segments, hcdf
+
+librosa = lazy_import('librosa')
+signal = lazy_import('scipy.signal')
+fft = lazy_import('scipy.fft')
+soxr = lazy_import('soxr')
 
 _logger = logging.getLogger(__name__)
 
+TUNING_ESTIMATES = ('excerpt', 'cache')
+# estimated tunings are rounded to this fraction of bin
+TUNING_RESOLUTION = 0.01
+
+# tuning estimates of whole audio by content hash
+_tuning_cache = OrderedDict()
+_tuning_lock = threading.Lock()
+_TUNING_CACHE_SIZE = 1024
+
 
 class LoadStrategy:
     """ Loads music file and returns y """
@@ -26,10 +45,32 @@ class ExtractionStrategy:
     def run(self, y: numpy.ndarray) -> numpy.ndarray:
         pass
 
+    def run_blocks(self, y: numpy.ndarray, first_block: float = 5., max_block: float = 60.) \
+            -> Iterator[Tuple[float, numpy.ndarray]]:
+        """ Yields offset in seconds and bins of consecutive blocks of y, whole y is one block by default """
+        yield 0., self.run(y)
+
+    def run_batch(self, ys: Sequence[numpy.ndarray]) -> Sequence[numpy.ndarray]:
+        """ Bins of every y, every y is extracted on its own by default """
+        return [self.run(y) for y in ys]
+
+    def run_frames(self, y: numpy.ndarray, start: int, stop: int, margin: float = 1.) -> numpy.ndarray:
+        """ Bins of frames from start to stop, whole y is extracted by default """
+        return self.run(y)[:, start:stop]
+
+    def run_windows(self, y: numpy.ndarray, windows: Sequence[Tuple[int, int]], margin: float = 1.) \
+            -> Sequence[numpy.ndarray]:
+        """ Bins of every window of frames from start to stop, whole y is extracted once by default """
+        bins = self.run(y)
+        return [bins[:, start:stop] for start, stop in windows]
+
 
 class ChromaStrategy:
     """ Unify furrier coefficients (bins) into frames (12-d vector)"""
 
+    # frame of chroma depends only on same frame of bins, so blocks of bins can be processed independently
+    frame_local = False
+
     @abstractmethod
     def run(self, bins: numpy.ndarray) -> numpy.ndarray:
         pass
@@ -38,6 +79,9 @@ class ChromaStrategy:
 class SegmentationStrategy:
     """ Join multiple frames into one by onset detection or HCDF """
 
+    # frame is not joined with other frames, so blocks of chroma can be processed independently
+    frame_local = False
+
     @abstractmethod
     def run(self, y: numpy.ndarray, chroma: numpy.ndarray) -> (numpy.ndarray, Any):
         pass
@@ -52,33 +96,397 @@ class _PathLoadStrategy(LoadStrategy):
 
     @lru_cache(maxsize=None)
     def run(self, absolute_path: str) -> numpy.ndarray:
-        y, sr = librosa.load(absolute_path, self._sr)
+        y, sr = librosa.load(absolute_path, sr=self._sr)
         return y
 
 
+class _CQTFilterBank(NamedTuple):
+    """ Frequency domain CQT filters of every octave, from highest one, as computed by librosa.cqt """
+    downsample: int  # factor of early downsampling
+    hop_length: int  # hop length after early downsampling
+    octaves: Sequence[Tuple[Any, int]]  # sparse FFT basis and FFT length
+    lengths: numpy.ndarray  # filter lengths of all bins, from lowest one
+
+
+@lru_cache(maxsize=16)
+def _cqt_filter_bank(sampling_frequency: int, hop_length: int, min_freq: float, n_bins: int,
+                     bins_per_octave: int) -> _CQTFilterBank:
+    """ Same filters as librosa.cqt with default arguments, built once per configuration """
+    freqs = librosa.cqt_frequencies(n_bins, fmin=min_freq, bins_per_octave=bins_per_octave)
+    alpha = numpy.full(n_bins, (2. ** (2. / bins_per_octave) - 1.) / (2. ** (2. / bins_per_octave) + 1.))
+    n_octaves, n_filters = int(math.ceil(n_bins / bins_per_octave)), min(bins_per_octave, n_bins)
+
+    _, cutoff = librosa.filters.wavelet_lengths(freqs=freqs, sr=sampling_frequency, alpha=alpha)
+    if cutoff > sampling_frequency / 2.:
+        raise ValueError("Highest CQT filter exceeds Nyquist frequency.")
+
+    # early downsampling while hop length allows halving in every octave
+    twos = (hop_length & -hop_length).bit_length() - 1
+    downsample = 2 ** min(max(0, int(math.ceil(math.log2(sampling_frequency / 2. / cutoff)) - 1) - 1),
+                          max(0, twos - n_octaves + 1))
+    sr, hop = sampling_frequency / downsample, hop_length // downsample
+
+    octaves, octave_sr, octave_hop = list(), sr, hop
+    for i in range(n_octaves):
+        bins = slice(n_bins - n_filters * (i + 1), n_bins - n_filters * i)
+        basis, lengths = librosa.filters.wavelet(freqs=freqs[bins], sr=octave_sr, norm=1, pad_fft=True,
+                                                 alpha=alpha[bins])
+        n_fft = basis.shape[1]
+        basis *= lengths[:, None] / float(n_fft)
+        fft_basis = librosa.util.sparsify_rows(numpy.fft.fft(basis, n=n_fft, axis=1)[:, :n_fft // 2 + 1],
+                                               quantile=0.01, dtype=numpy.complex64)
+        octaves.append((fft_basis * numpy.sqrt(sr / octave_sr), n_fft))
+        if octave_hop % 2 == 0:
+            octave_sr, octave_hop = octave_sr / 2., octave_hop // 2
+
+    lengths, _ = librosa.filters.wavelet_lengths(freqs=freqs, sr=sr, alpha=alpha)
+    return _CQTFilterBank(downsample, hop, octaves, lengths)
+
+
+def _frame(y: numpy.ndarray, frame_length: int, hop_length: int, frames: numpy.ndarray = None) -> numpy.ndarray:
+    """ (frame_length, n_frames) frames of y as librosa.util.frame, or only given frames which fit into y """
+    if frames is None:
+        return librosa.util.frame(y, frame_length=frame_length, hop_length=hop_length)
+    frames = frames[frames < 1 + (len(y) - frame_length) // hop_length]
+    return y[frames[None, :] * hop_length + numpy.arange(frame_length)[:, None]]
+
+
 class _CQTExtractionStrategy(ExtractionStrategy):
 
     def __init__(self, sampling_frequency: int, hop_length: int, min_freq: int, n_bins: int,
-                 bins_per_octave: int) -> None:
+                 bins_per_octave: int, tuning: Union[float, str] = 0., tuning_excerpt: float = 10.,
+                 silence_threshold: float = None, silence_min_duration: float = 0.5) -> None:
         super().__init__()
+
+        if isinstance(tuning, str) and tuning not in TUNING_ESTIMATES:
+            raise ValueError("Tuning must be number or one of %s." % ', '.join(TUNING_ESTIMATES))
+
         self._sr = sampling_frequency
         self._hop_length = hop_length
         self._bins_per_octave = bins_per_octave
         self._n_bins = n_bins
         self._min_freq = min_freq
-
-    def run(self, y: numpy.ndarray) -> numpy.ndarray:
-        return numpy.abs(librosa.cqt(y,
-                                     sr=self._sr,
-                                     hop_length=self._hop_length,
-                                     bins_per_octave=self._bins_per_octave,
-                                     n_bins=self._n_bins,
-                                     fmin=self._min_freq)
-                         )
+        self._tuning = tuning
+        self._tuning_excerpt = tuning_excerpt
+        self._silence_threshold = silence_threshold
+        self._silence_min_frames = max(1, int(round(silence_min_duration * sampling_frequency / hop_length)))
+
+    def _estimate_tuning(self, y: numpy.ndarray) -> float:
+        tuning = librosa.estimate_tuning(y=y, sr=self._sr, bins_per_octave=self._bins_per_octave)
+        return round(float(tuning) / TUNING_RESOLUTION) * TUNING_RESOLUTION
+
+    def tuning(self, y: numpy.ndarray) -> float:
+        """ Deviation of y from A440 in fractions of bin: fixed value of config, estimate of excerpt from middle of y
+        or estimate of whole y cached per content hash. Estimates are rounded to TUNING_RESOLUTION, so filter banks
+        of nearly same tunings are shared. """
+        if not isinstance(self._tuning, str):
+            return self._tuning
+
+        begin = time.perf_counter()
+        if self._tuning == 'excerpt':
+            length = int(self._tuning_excerpt * self._sr)
+            start = max(0, (len(y) - length) // 2)
+            tuning, source = self._estimate_tuning(y[start:start + length]), 'estimated from excerpt'
+        else:
+            key = (hashlib.blake2b(numpy.ascontiguousarray(y).tobytes(), digest_size=16).digest(), self._sr,
+                   self._bins_per_octave)
+            with _tuning_lock:
+                tuning = _tuning_cache.get(key)
+                if tuning is not None:
+                    _tuning_cache.move_to_end(key)
+            source = 'cached'
+            if tuning is None:
+                tuning, source = self._estimate_tuning(y), 'estimated'
+                with _tuning_lock:
+                    _tuning_cache[key] = tuning
+                    while len(_tuning_cache) > _TUNING_CACHE_SIZE:
+                        _tuning_cache.popitem(last=False)
+
+        _logger.info("Tuning = %.2f %s in %.3f s" % (tuning, source, time.perf_counter() - begin))
+        return tuning
+
+    def sounding(self, y: numpy.ndarray) -> Union[Sequence[Tuple[int, int]], None]:
+        """ Windows of frames between silent regions, None if silence gate is disabled or y has no silent region.
+        Region is silent if RMS of its frames is below silence threshold in dBFS for at least silence min frames. """
+        if self._silence_threshold is None:
+            return None
+        rms = librosa.feature.rms(y=y, frame_length=2 * self._hop_length, hop_length=self._hop_length)[0]
+        silent = numpy.concatenate(([False], rms < 10. ** (self._silence_threshold / 20.), [False]))
+        edges = numpy.flatnonzero(numpy.diff(silent.astype(numpy.int8)))
+        regions = [(start, stop) for start, stop in zip(edges[::2], edges[1::2])
+                   if stop - start >= self._silence_min_frames]
+        if not regions:
+            return None
+
+        windows, start = list(), 0
+        for silent_start, silent_stop in regions:
+            if silent_start > start:
+                windows.append((start, silent_start))
+            start = silent_stop
+        if start < len(rms):
+            windows.append((start, len(rms)))
+        return windows
+
+    def _extract(self, y: numpy.ndarray, tuning: float, frames: numpy.ndarray = None) -> numpy.ndarray:
+        return self._run_batch((y,), tuning, frames)[0]
+
+    def run(self, y: numpy.ndarray, tuning: float = None, start: int = 0, stop: int = None) -> numpy.ndarray:
+        """ Bins of frames start to stop of y, all frames by default, other frames are not transformed. Silent
+        regions of y are not extracted and their bins are zero. """
+        tuning = self.tuning(y) if tuning is None else tuning
+        n_frames = 1 + len(y) // self._hop_length
+        stop = n_frames if stop is None else min(stop, n_frames)
+        windows = self.sounding(y)
+        if windows is None:
+            return self._extract(y, tuning, None if (start, stop) == (0, n_frames) else numpy.arange(start, stop))
+
+        windows = [(max(a, start), min(b, stop)) for a, b in windows if a < stop and b > start]
+        bins = numpy.zeros((self._n_bins, stop - start), dtype=numpy.float32)
+        for (a, b), window_bins in zip(windows, self.run_windows(y, windows, tuning=tuning)):
+            bins[:, a - start:b - start] = window_bins
+        _logger.info("Silence gate skipped %d of %d frames" % (bins.shape[1] - sum(b - a for a, b in windows),
+                                                               bins.shape[1]))
+        return bins
+
+    def run_batch(self, ys: Sequence[numpy.ndarray], tunings: Sequence[float] = None) -> Sequence[numpy.ndarray]:
+        """ Clips of same tuning are extracted together. Unless tunings are given, one tuning is resolved from all
+        clips concatenated, so whole batch uses one filter bank. Clips are labelled samples, so silence gate does not
+        apply. """
+        if not len(ys):
+            return list()
+        if tunings is None:
+            tunings = [self.tuning(numpy.concatenate(ys))] * len(ys)
+        bins = [None] * len(ys)
+        for tuning in set(tunings):
+            indices = [index for index, clip_tuning in enumerate(tunings) if clip_tuning == tuning]
+            for index, clip_bins in zip(indices, self._run_batch([ys[index] for index in indices], tuning)):
+                bins[index] = clip_bins
+        return bins
+
+    def _run_batch(self, ys: Sequence[numpy.ndarray], tuning: float, frames: numpy.ndarray = None) \
+            -> Sequence[numpy.ndarray]:
+        """ Multi-rate CQT of librosa.cqt with filter bank built once per configuration. Frames of all clips are
+        transformed together, so every octave takes one FFT and one product with filter basis per batch. Only
+        ascending frames of every clip are transformed if given, octaves are still resampled whole. """
+        bank = _cqt_filter_bank(self._sr, self._hop_length, self._min_freq * 2. ** (tuning / self._bins_per_octave),
+                                self._n_bins, self._bins_per_octave)
+        ys = [numpy.asarray(y, dtype=numpy.float32) for y in ys]
+        if bank.downsample > 1:
+            ys = [librosa.resample(y, orig_sr=bank.downsample, target_sr=1, res_type='soxr_hq', scale=True)
+                  for y in ys]
+
+        responses, hop = list(), bank.hop_length
+        for basis, n_fft in bank.octaves:
+            # centered frames of STFT with rectangular window and zero padding
+            octave_frames = [_frame(numpy.pad(y, n_fft // 2), n_fft, hop, frames) for y in ys]
+            response = basis.dot(fft.rfft(numpy.concatenate(octave_frames, axis=1), axis=0))
+            responses.append(numpy.split(response, numpy.cumsum([f.shape[1] for f in octave_frames])[:-1], axis=1))
+            if hop % 2 == 0:
+                hop //= 2
+                ys = [librosa.resample(y, orig_sr=2, target_sr=1, res_type='soxr_hq', scale=True) for y in ys]
+
+        bins = list()
+        for octaves in zip(*responses):
+            n_frames = min(octave.shape[1] for octave in octaves)
+            stack = numpy.concatenate([octave[:, :n_frames] for octave in reversed(octaves)])[-self._n_bins:]
+            bins.append(numpy.abs(stack) / numpy.sqrt(bank.lengths)[:, None])
+        return bins
+
+    def _margin(self, fraction: float = 1.) -> int:
+        """ Fraction of length of longest filter in samples rounded up to multiple of hop length """
+        q = 1. / (2. ** (1. / self._bins_per_octave) - 1.)
+        return int(math.ceil(fraction * q * self._sr / self._min_freq / self._hop_length)) * self._hop_length
+
+    def run_frames(self, y: numpy.ndarray, start: int, stop: int, margin: float = 1., tuning: float = None) \
+            -> numpy.ndarray:
+        """ Only samples of frames extended by margin, fraction of longest filter, on both sides are extracted and
+        margin frames are trimmed. Bins are same as bins of whole y with margin 1. """
+        tuning = self.tuning(y) if tuning is None else tuning
+        margin = self._margin(margin)
+        begin, end = max(0, start * self._hop_length - margin), min(len(y), stop * self._hop_length + margin)
+        left = (start * self._hop_length - begin) // self._hop_length
+        return self.run(y[begin:end], tuning, left, left + stop - start)
+
+    def run_windows(self, y: numpy.ndarray, windows: Sequence[Tuple[int, int]], margin: float = 1.,
+                    tuning: float = None) -> Sequence[numpy.ndarray]:
+        """ Samples of windows extended by margin are concatenated and extracted at once. Pieces but last one are
+        padded to multiple of hop length, so frames of every window stay aligned. Filter of frame reaches half of its
+        length on both sides, so frames of window see only samples of their own piece if margin is at least 0.5,
+        lower margin lets lowest bins near window edges mix in samples of neighbouring pieces. """
+        if not windows:
+            return list()
+
+        margin = self._margin(margin)
+        pieces, offsets, frames = list(), list(), 0
+        for start, stop in windows:
+            begin, end = max(0, start * self._hop_length - margin), min(len(y), stop * self._hop_length + margin)
+            pieces.append(numpy.pad(y[begin:end], (0, -(end - begin) % self._hop_length)))
+            offsets.append(frames + (start * self._hop_length - begin) // self._hop_length)
+            frames += len(pieces[-1]) // self._hop_length
+        # end of y is not padded as in extraction of whole y
+        pieces[-1] = pieces[-1][:end - begin]
+
+        # margins of pieces may be silent, so pieces are not gated again, margin frames are not transformed
+        frames = numpy.concatenate([numpy.arange(offset, offset + stop - start)
+                                    for offset, (start, stop) in zip(offsets, windows)])
+        bins = self._extract(numpy.concatenate(pieces), self.tuning(y) if tuning is None else tuning, frames)
+        return numpy.split(bins, numpy.cumsum([stop - start for start, stop in windows])[:-1], axis=1)
+
+    def run_blocks(self, y: numpy.ndarray, first_block: float = 5., max_block: float = 60.) \
+            -> Iterator[Tuple[float, numpy.ndarray]]:
+        """ Block length doubles from first block up to max block """
+        n_frames = 1 + len(y) // self._hop_length
+        block = max(1, int(first_block * self._sr / self._hop_length))
+        max_frames = max(block, int(max_block * self._sr / self._hop_length))
+        tuning = self.tuning(y)
+
+        start = 0
+        while start < n_frames:
+            stop = min(n_frames, start + block)
+            yield start * self._hop_length / self._sr, self.run_frames(y, start, stop, tuning=tuning)
+            start, block = stop, min(2 * block, max_frames)
+
+    def stream(self, tuning: float) -> '_CQTStream':
+        """ Incremental extraction of samples pushed block by block, silence gate does not apply """
+        return _CQTStream(_cqt_filter_bank(self._sr, self._hop_length,
+                                           self._min_freq * 2. ** (tuning / self._bins_per_octave), self._n_bins,
+                                           self._bins_per_octave), self._n_bins)
+
+
+class _Resampler:
+    """ Streaming downsampling by integer ratio as librosa.resample of soxr_hq. Every chunk is resampled together with
+    context of previous samples and outputs nearer than guard to edges of chunk are held back, so emitted samples
+    are same as samples of whole signal resampled at once, up to error below 1e-4 of amplitude. """
+
+    GUARD = 64  # outputs at edge of chunk which depend on edge
+
+    def __init__(self, ratio: int) -> None:
+        super().__init__()
+        self.ratio = ratio
+        self._buffer = numpy.zeros(0, dtype=numpy.float32)
+        self._start = 0  # input index of first sample of buffer, multiple of ratio
+        self._received = 0
+        self._emitted = 0
+
+    def lag(self, index: int) -> int:
+        """ Input samples needed to emit output sample of index """
+        return (index + 1 + self.GUARD) * self.ratio
+
+    def push(self, y: numpy.ndarray, final: bool = False) -> numpy.ndarray:
+        """ Appends samples and returns next resampled samples, final push returns rest of signal """
+        self._buffer = numpy.concatenate((self._buffer, y))
+        self._received += len(y)
+        first = self._start // self.ratio
+        # soxr_hq of librosa.resample without its per call overhead, scaled as librosa scales it
+        resampled = soxr.resample(self._buffer, self.ratio, 1, quality='HQ') if len(self._buffer) else self._buffer
+        resampled /= numpy.sqrt(1. / self.ratio)
+        if final:
+            # length of whole signal resampled by librosa.resample
+            stop = -(-self._received // self.ratio)
+            resampled = librosa.util.fix_length(resampled, size=stop - first)
+        else:
+            stop = first + len(resampled) - self.GUARD
+        if stop <= self._emitted:
+            return numpy.zeros(0, dtype=numpy.float32)
+
+        emitted = resampled[self._emitted - first:stop - first]
+        self._emitted = stop
+        # next outputs are resampled with guard outputs of context
+        start = max(self._start, (self._emitted - self.GUARD) * self.ratio)
+        self._buffer, self._start = self._buffer[start - self._start:], start
+        return emitted
+
+
+class _CQTStream:
+    """ Incremental multi-rate CQT of _CQTExtractionStrategy. Signal of every octave is resampled once by streaming
+    resamplers and kept only while its frames need it. Frame is transformed once half of longest filter of bank
+    after it has arrived, so bins differ from bins of whole signal only as bins of run_frames with margin 0.5 do. """
+
+    def __init__(self, bank: _CQTFilterBank, n_bins: int) -> None:
+        super().__init__()
+        self._bank = bank
+        self._n_bins = n_bins
+        self._downsampler = _Resampler(bank.downsample) if bank.downsample > 1 else None
+
+        # level of signal, hop and half of frame of every octave, levels are halved as in _run_batch. Frame reaches
+        # half of longest filter of bank on both sides, as run_frames with margin 0.5, because sparse filter basis
+        # leaks beyond its own filter.
+        self._octaves, self._halvers, hop, level = list(), list(), bank.hop_length, 0
+        for i, (basis, n_fft) in enumerate(bank.octaves):
+            half = min(n_fft // 2, int(math.ceil(bank.lengths.max() / 2 ** level / 2.)))
+            self._octaves.append((basis, n_fft, hop, level, half))
+            if hop % 2 == 0 and i < len(bank.octaves) - 1:
+                hop, level = hop // 2, level + 1
+                self._halvers.append(_Resampler(2))
+
+        self._signals = [numpy.zeros(0, dtype=numpy.float32) for _ in range(level + 1)]
+        self._starts = [0] * (level + 1)  # index of first kept sample of every level
+        self._received = [0] * (level + 1)
+        self._next_frame = 0
+
+    def _needed(self, level: int, index: int) -> int:
+        """ Input samples needed for sample of index of level """
+        for resampler in reversed(self._halvers[:level]):
+            index = resampler.lag(index) - 1
+        return index + 1 if self._downsampler is None else self._downsampler.lag(index)
+
+    @property
+    def lookahead(self) -> int:
+        """ Input samples after first sample of frame which are needed to transform frame """
+        return max(self._needed(level, half - 1) for _, _, _, level, half in self._octaves)
+
+    def _available(self, final: bool) -> int:
+        """ Frames which can be transformed, all frames of whole signal when signal is final """
+        if final:
+            return min(1 + (self._received[level] + 2 * (n_fft // 2) - n_fft) // hop
+                       for _, n_fft, hop, level, _ in self._octaves)
+        return min(max(0, (self._received[level] - half) // hop + 1) for _, _, hop, level, half in self._octaves)
+
+    def _segment(self, level: int, begin: int, end: int) -> numpy.ndarray:
+        """ Samples begin to end of level, zero outside of signal """
+        signal, start = self._signals[level], self._starts[level]
+        left, right = max(begin, start), max(begin, min(end, start + len(signal)))
+        return numpy.pad(signal[left - start:right - start], (left - begin, end - right))
+
+    def push(self, y: numpy.ndarray, final: bool = False) -> numpy.ndarray:
+        """ Appends samples and returns bins of frames transformed since last push, final push transforms rest """
+        y = numpy.asarray(y, dtype=numpy.float32).reshape(-1)
+        if self._downsampler is not None:
+            y = self._downsampler.push(y, final)
+        for level in range(len(self._signals)):
+            if level > 0:
+                y = self._halvers[level - 1].push(y, final)
+            self._signals[level] = numpy.concatenate((self._signals[level], y))
+            self._received[level] += len(y)
+
+        start, stop = self._next_frame, self._available(final)
+        if stop <= start:
+            return numpy.zeros((self._n_bins, 0), dtype=numpy.float32)
+
+        responses = list()
+        for basis, n_fft, hop, level, half in self._octaves:
+            segment = self._segment(level, start * hop - half, (stop - 1) * hop + half)
+            frames = numpy.zeros((n_fft, stop - start), dtype=numpy.float32)
+            frames[n_fft // 2 - half:n_fft // 2 + half] = librosa.util.frame(segment, frame_length=2 * half,
+                                                                              hop_length=hop)
+            responses.append(basis.dot(fft.rfft(frames, axis=0)))
+        self._next_frame = stop
+
+        # samples of level are kept while next frames of its octaves need them
+        for level in range(len(self._signals)):
+            keep = min(stop * hop - half for _, _, hop, octave_level, half in self._octaves if octave_level == level)
+            if keep > self._starts[level]:
+                self._signals[level] = self._signals[level][keep - self._starts[level]:]
+                self._starts[level] = keep
+
+        stack = numpy.concatenate(list(reversed(responses)))[-self._n_bins:]
+        return numpy.abs(stack) / numpy.sqrt(self._bank.lengths)[:, None]
 
 
 class _DefaultChromaStrategy(ChromaStrategy):
 
+    frame_local = True
+
     def __init__(self, hop_length: int, min_freq: int, bins_per_octave: int, n_octaves: int) -> None:
         super().__init__()
         self._hop_length = hop_length
@@ -98,6 +506,8 @@ class _DefaultChromaStrategy(ChromaStrategy):
 
 class _SmoothingChromaStrategy(_DefaultChromaStrategy):
 
+    frame_local = False
+
     def run(self, bins: numpy.ndarray) -> numpy.ndarray:
         chroma = super().run(bins)
 
@@ -136,6 +546,8 @@ class _HPSSChromaStrategy(ChromaStrategy):
 
 class _DefaultSegmentationStrategy(SegmentationStrategy):
 
+    frame_local = True
+
     def __init__(self, sampling_frequency: int, hop_length: int) -> None:
         super().__init__()
 
@@ -220,6 +632,99 @@ class _AudioProcessing:
         chroma = self.chroma_strategy.run(bins)
         return self.segmentation_strategy.run(y, chroma)
 
+    def process_batch(self, absolute_paths: Sequence[str]) -> Sequence[Tuple[numpy.ndarray, Any]]:
+        """ Frames and times of every file, features of all files are extracted at once """
+        _logger.info("Processing batch of %d files" % len(absolute_paths))
+        ys = [self.load_strategy.run(absolute_path) for absolute_path in absolute_paths]
+        return [self.segmentation_strategy.run(y, self.chroma_strategy.run(bins))
+                for y, bins in zip(ys, self.extraction_strategy.run_batch(ys))]
+
+    def process_blocks(self, absolute_path: str) -> Iterator[Tuple[numpy.ndarray, Sequence[float]]]:
+        """ Yields frames and times of consecutive blocks, audio is processed in one block unless chroma and
+        segmentation strategies are frame local """
+        if not (self.chroma_strategy.frame_local and self.segmentation_strategy.frame_local):
+            yield self.process(absolute_path)
+            return
+
+        _logger.info("Processing in blocks = " + absolute_path)
+        y = self.load_strategy.run(absolute_path)
+        for offset, bins in self.extraction_strategy.run_blocks(y):
+            frame, time = self.segmentation_strategy.run(y, self.chroma_strategy.run(bins))
+            yield frame, numpy.asarray(time) + offset
+
+
+class _AdaptiveAudioProcessing(_AudioProcessing):
+    """ Coarse to fine time resolution. Chroma of coarse hop, factor times hop length, is computed for whole audio
+    and harmonic change detect function of coarse chroma finds candidate changes. Fine chroma is computed only in
+    windows around candidate changes and replaces coarse frames of windows in timeline. """
+
+    def __init__(self, load_strategy: LoadStrategy, extraction_strategy: ExtractionStrategy,
+                 chroma_strategy: ChromaStrategy, segmentation_strategy: SegmentationStrategy,
+                 coarse_extraction_strategy: ExtractionStrategy, sampling_frequency: int, hop_length: int,
+                 factor: int, prominence: float = 0.1, margin: float = 0.5) -> None:
+        super().__init__(load_strategy, extraction_strategy, chroma_strategy, segmentation_strategy)
+
+        if coarse_extraction_strategy is None:
+            raise NameError("Coarse extraction strategy cannot be None !")
+        if factor < 2:
+            raise ValueError("Factor of adaptive resolution must be at least 2.")
+
+        self.coarse_extraction_strategy = coarse_extraction_strategy
+        self._sr = sampling_frequency
+        self._hop_length = hop_length
+        self._factor = factor
+        self._prominence = prominence
+        self._margin = margin
+
+    def windows(self, coarse_chroma: numpy.ndarray) -> Sequence[Tuple[int, int]]:
+        """ Coarse frame windows around candidate changes, overlapping windows are merged """
+        peaks, _ = signal.find_peaks(hcdf(coarse_chroma), prominence=self._prominence)
+        windows = list()
+        # value of peak is distance of coarse frames peak and peak + 2, change is between them
+        for start, stop in zip(numpy.maximum(0, peaks - 1), numpy.minimum(coarse_chroma.shape[1], peaks + 4)):
+            if windows and start <= windows[-1][1]:
+                windows[-1] = (windows[-1][0], stop)
+            else:
+                windows.append((start, stop))
+        return windows
+
+    def process_samples(self, y: numpy.ndarray) -> (numpy.ndarray, Sequence[float]):
+        """ Chroma frames and their times of merged coarse and fine timeline """
+        coarse = self.chroma_strategy.run(self.coarse_extraction_strategy.run(y))
+        n_frames = 1 + len(y) // self._hop_length
+
+        windows = self.windows(coarse)
+        fine_windows = [(start * self._factor, min(n_frames, stop * self._factor)) for start, stop in windows]
+        fine_bins = self.extraction_strategy.run_windows(y, fine_windows, self._margin)
+
+        frames, times, coarse_start = list(), list(), 0
+        for (start, stop), (fine_start, fine_stop), bins in zip(windows, fine_windows, fine_bins):
+            frames.append(coarse[:, coarse_start:start])
+            times.append(numpy.arange(coarse_start, start) * self._factor)
+            frames.append(self.chroma_strategy.run(bins))
+            times.append(numpy.arange(fine_start, fine_stop))
+            coarse_start = stop
+        frames.append(coarse[:, coarse_start:])
+        times.append(numpy.arange(coarse_start, coarse.shape[1]) * self._factor)
+
+        return numpy.concatenate(frames, axis=1), numpy.concatenate(times) * self._hop_length / self._sr
+
+    def process(self, absolute_path: str) -> (numpy.ndarray, Union[Sequence[float], None]):
+        """ Audio is processed in fixed resolution unless chroma and segmentation strategies are frame local """
+        if not (self.chroma_strategy.frame_local and self.segmentation_strategy.frame_local):
+            return super().process(absolute_path)
+
+        _logger.info("Processing in adaptive resolution = " + absolute_path)
+        return self.process_samples(self.load_strategy.run(absolute_path))
+
+    def process_batch(self, absolute_paths: Sequence[str]) -> Sequence[Tuple[numpy.ndarray, Any]]:
+        """ Every file is processed on its own """
+        return [self.process(absolute_path) for absolute_path in absolute_paths]
+
+    def process_blocks(self, absolute_path: str) -> Iterator[Tuple[numpy.ndarray, Sequence[float]]]:
+        """ Audio is processed in one block """
+        yield self.process(absolute_path)
+
 
 def _apply_property(prop: str, value: Any = None):
     def decorate(obj):
@@ -269,7 +774,30 @@ class SegmentationStrategyFactory(Protocol):
     def __call__(self, config: dict) -> SegmentationStrategy: ...
 
 
+def minimal_sampling(config: dict, headroom: float = 0.9) -> Tuple[int, int]:
+    """ Sampling frequency and hop length of config divided by largest power of 2, such that cutoff of highest CQT
+    filter stays below headroom of Nyquist frequency and hop length stays multiple of 2 ** (octaves - 1), which CQT
+    halves in every octave. Frame times are same as with sampling frequency and hop length of config. """
+    sampling_frequency, hop_length = config['SAMPLING_FREQUENCY'], config['HOP_LENGTH']
+    bins_per_octave = config['BINS_PER_OCTAVE']
+    freqs = librosa.cqt_frequencies(config['N_BINS'], fmin=config['MIN_FREQ'], bins_per_octave=bins_per_octave)
+    alpha = (2. ** (2. / bins_per_octave) - 1.) / (2. ** (2. / bins_per_octave) + 1.)
+    _, cutoff = librosa.filters.wavelet_lengths(freqs=freqs, sr=sampling_frequency, alpha=alpha)
+    octave_hop = 2 ** (int(math.ceil(config['N_BINS'] / bins_per_octave)) - 1)
+
+    while sampling_frequency % 2 == 0 and hop_length % (2 * octave_hop) == 0 and \
+            cutoff < headroom * sampling_frequency / 4:
+        sampling_frequency, hop_length = sampling_frequency // 2, hop_length // 2
+    return sampling_frequency, hop_length
+
+
 def _AudioProcessingFactory(config: dict):
+    if config.get('AUTO_SAMPLING_FREQUENCY'):
+        config = dict(config)
+        config['SAMPLING_FREQUENCY'], config['HOP_LENGTH'] = minimal_sampling(config)
+        _logger.info("Sampling frequency = %d, hop length = %d" % (config['SAMPLING_FREQUENCY'],
+                                                                    config['HOP_LENGTH']))
+
     load_strategy_factory = config['LOAD_STRATEGY_FACTORY']
     extraction_strategy_factory = config['EXTRACTION_STRATEGY_FACTORY']
     chroma_strategy_factory = config['CHROMA_STRATEGY_FACTORY']
@@ -284,6 +812,19 @@ def _AudioProcessingFactory(config: dict):
     if not isinstance(segmentation_strategy_factory, SegmentationStrategyFactory):
         raise ValueError("Load strategy must obey SegmentationStrategyFactory Protocol.")
 
+    factor = config.get('ADAPTIVE_RESOLUTION')
+    if factor:
+        return _AdaptiveAudioProcessing(
+            load_strategy_factory(config),
+            extraction_strategy_factory(config),
+            chroma_strategy_factory(config),
+            segmentation_strategy_factory(config),
+            extraction_strategy_factory(dict(config, HOP_LENGTH=config['HOP_LENGTH'] * factor)),
+            config['SAMPLING_FREQUENCY'],
+            config['HOP_LENGTH'],
+            factor
+        )
+
     return _AudioProcessing(
         load_strategy_factory(config),
         extraction_strategy_factory(config),
@@ -303,7 +844,11 @@ def CQTExtractionStrategyFactory(config: dict) -> ExtractionStrategy:
                                   config["HOP_LENGTH"],
                                   config["MIN_FREQ"],
                                   config["N_BINS"],
-                                  config["BINS_PER_OCTAVE"])
+                                  config["BINS_PER_OCTAVE"],
+                                  config.get("TUNING", 0.),
+                                  config.get("TUNING_EXCERPT", 10.),
+                                  config.get("SILENCE_THRESHOLD", None),
+                                  config.get("SILENCE_MIN_DURATION", 0.5))
 
 
 @_chroma_strategy_factory
@@ -1,7 +1,12 @@
 import logging
+import threading
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import lru_cache
 from typing import Protocol, Sequence, List, Tuple, overload, Callable, runtime_checkable
 
+import numpy
+
 _logger = logging.getLogger(__name__)
 
 
@@ -49,6 +54,14 @@ class PredictStrategy(Protocol):
         ...
 
 
+@runtime_checkable
+class BatchPredictStrategy(PredictStrategy, Protocol):
+
+    def predict_batch(self, frames: numpy.ndarray) -> Sequence[_Vector]:
+        """ Predict all frames of (T, 12) matrix at once """
+        ...
+
+
 @runtime_checkable
 class PredictStrategyFactory(Protocol):
 
@@ -72,6 +85,17 @@ class _PredictStrategy(PredictStrategy, ABC):
 
         return self.templates[all_products.index(max(all_products))]
 
+    def template_matrix(self, dimension: int = 12) -> numpy.ndarray:
+        """ (n_templates, dimension) matrix of templates, its product with frames are their scores """
+        if '_matrix' not in self.__dict__ or self.__dict__['_matrix'].shape[1] != dimension:
+            self.__dict__['_matrix'] = numpy.array([template @ numpy.eye(dimension) for template in self.templates])
+        return self.__dict__['_matrix']
+
+    def predict_batch(self, frames: numpy.ndarray) -> Sequence[_Vector]:
+        frames = numpy.asarray(frames)
+        products = frames @ self.template_matrix(frames.shape[1]).T
+        return tuple(self.templates[i] for i in numpy.argmax(products, axis=1))
+
 
 class _TemplatePredictStrategy(_PredictStrategy):
 
@@ -95,6 +119,211 @@ def TemplatePredictStrategyFactory(templates: Sequence[_Vector]) -> PredictStrat
     return wrapper
 
 
+class _TemplateBank:
+    """ Chord qualities stored once at root C and scored in all 12 transpositions at once
+
+    Each quality vector is expanded into its circulant matrix, so correlation of every quality and root with frames
+    is one matrix product. Template vectors are normalized to unit length, so qualities with more notes are not
+    favoured. Inversions share pitch classes with root position and are not part of bank.
+    """
+
+    ROOTS = ('C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B')
+
+    def __init__(self, qualities: Sequence[str]) -> None:
+        super().__init__()
+        from .notation import Chord
+
+        self._qualities = tuple(qualities)
+        self._chords = numpy.empty((len(self._qualities), 12), dtype=object)
+        for q, quality in enumerate(self._qualities):
+            for r, root in enumerate(self.ROOTS):
+                self._chords[q, r] = Chord('%s:%s' % (root, quality))
+
+        vectors = numpy.array([chord @ numpy.eye(12) for chord in self._chords[:, 0]], dtype=numpy.float64)
+        self._vectors = vectors / numpy.linalg.norm(vectors, axis=1, keepdims=True)
+        # rows are quality major, root minor, row q * 12 + r is quality q rotated by r semitones
+        self._circulant = numpy.stack([numpy.roll(self._vectors, r, axis=1) for r in range(12)], axis=1) \
+            .reshape(-1, 12)
+
+    @property
+    def chords(self) -> Sequence[_Vector]:
+        """ Chords in order of scores, quality major and root minor """
+        return tuple(self._chords.ravel())
+
+    def scores(self, frames: numpy.ndarray) -> numpy.ndarray:
+        """ Scores of (T, 12) frames, (T, n_qualities * 12) """
+        return numpy.asarray(frames, dtype=numpy.float64) @ self._circulant.T
+
+    def best(self, frames: numpy.ndarray) -> Sequence[_Vector]:
+        return tuple(self._chords.ravel()[numpy.argmax(self.scores(frames), axis=1)])
+
+    def top_k(self, frames: numpy.ndarray, k: int) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """ Returns (T, k) chords and scores in descending order """
+        scores = self.scores(frames)
+        k = min(k, scores.shape[1])
+        candidates = numpy.argpartition(-scores, k - 1, axis=1)[:, :k]
+        candidate_scores = numpy.take_along_axis(scores, candidates, axis=1)
+        # descending scores, ties in order of bank like argmax
+        order = numpy.lexsort((candidates, -candidate_scores), axis=1)
+        return self._chords.ravel()[numpy.take_along_axis(candidates, order, axis=1)], \
+            numpy.take_along_axis(candidate_scores, order, axis=1)
+
+
+class _TemplateBankPredictStrategy(PredictStrategy):
+
+    def __init__(self, bank: _TemplateBank) -> None:
+        super().__init__()
+        self._bank = bank
+
+    @property
+    def templates(self) -> Sequence[_Vector]:
+        return self._bank.chords
+
+    def predict(self, frame: _Vector, threshold: Callable[[float], bool] = lambda t: t) -> _Vector:
+        return self._bank.best(numpy.asarray(frame).reshape(1, -1))[0]
+
+    def predict_batch(self, frames: numpy.ndarray) -> Sequence[_Vector]:
+        return self._bank.best(frames)
+
+    def template_matrix(self) -> numpy.ndarray:
+        """ (n_chords, 12) matrix of normalized templates in order of templates """
+        return self._bank._circulant
+
+    def top_k(self, frames: numpy.ndarray, k: int) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """ Returns (T, k) best chords and their scores for every frame """
+        return self._bank.top_k(frames, k)
+
+
+_HARTE_QUALITIES = ('maj', 'min', 'dim', 'aug', 'maj7', 'min7', '7', 'dim7', 'hdim7', 'minmaj7', 'maj6', 'min6',
+                    '9', 'maj9', 'min9', 'sus2', 'sus4')
+
+
+@lru_cache(maxsize=None)
+def _template_bank(qualities: Tuple[str, ...]) -> _TemplateBank:
+    return _TemplateBank(qualities)
+
+
+def TemplateBankPredictStrategyFactory(qualities: Sequence[str] = _HARTE_QUALITIES) -> PredictStrategyFactory:
+    """ Template bank of qualities in all roots, full Harte shorthand vocabulary by default """
+
+    def wrapper(config: dict) -> PredictStrategy:
+        # bank is built on first use and shared by all strategies with same qualities
+        return _TemplateBankPredictStrategy(_template_bank(tuple(qualities)))
+
+    return wrapper
+
+
+class _MemoizedPredictStrategy(PredictStrategy):
+    """ Predictions cached by quantized frame
+
+    Frame is scaled to maximum 1 and every pitch class is rounded to one of levels values, so nearly identical
+    neighbouring frames share key. Frame of key, dequantized key, is predicted once and its chord is reused by all
+    frames of key until key is least recently used over size. Fewer levels give more hits and coarser frames.
+    """
+
+    def __init__(self, strategy: PredictStrategy, levels: int = 8, size: int = 65536) -> None:
+        super().__init__()
+
+        if not 2 <= levels <= 32:
+            raise ValueError("Quantization levels must be from 2 to 32.")
+
+        self.strategy = strategy
+        self.levels = levels
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def hit_rate(self) -> float:
+        """ Fraction of frames whose chord was not predicted by strategy """
+        return self.hits / max(1, self.hits + self.misses)
+
+    def keys(self, frames: numpy.ndarray) -> numpy.ndarray:
+        """ Keys of (T, 12) frames, quantized pitch classes are digits of key in base levels """
+        frames = numpy.asarray(frames, dtype=numpy.float64).reshape(-1, 12)
+        peak = frames.max(axis=1, keepdims=True)
+        scaled = numpy.divide(frames, peak, out=numpy.zeros_like(frames), where=peak > 0)
+        digits = numpy.rint(numpy.clip(scaled, 0, 1) * (self.levels - 1)).astype(numpy.int64)
+        return digits @ self.levels ** numpy.arange(12, dtype=numpy.int64)
+
+    def _frames(self, keys: numpy.ndarray) -> numpy.ndarray:
+        """ Dequantized frames of keys """
+        return (keys[:, None] // self.levels ** numpy.arange(12, dtype=numpy.int64)) % self.levels / (self.levels - 1.)
+
+    def predict(self, frame: _Vector, threshold: Callable[[float], bool] = lambda t: t) -> _Vector:
+        return self.predict_batch(numpy.asarray(frame).reshape(1, -1))[0]
+
+    def predict_batch(self, frames: numpy.ndarray) -> Sequence[_Vector]:
+        keys, inverse = numpy.unique(self.keys(frames), return_inverse=True)
+        keys = keys.tolist()
+        chords, missing = [None] * len(keys), list()
+        with self._lock:
+            for index, key in enumerate(keys):
+                chords[index] = self._cache.get(key)
+                if chords[index] is None:
+                    missing.append(index)
+                else:
+                    self._cache.move_to_end(key)
+
+        if missing:
+            dequantized = self._frames(numpy.array([keys[index] for index in missing], dtype=numpy.int64))
+            if isinstance(self.strategy, BatchPredictStrategy):
+                predicted = self.strategy.predict_batch(dequantized)
+            else:
+                predicted = [self.strategy.predict(frame) for frame in dequantized]
+            with self._lock:
+                for index, chord in zip(missing, predicted):
+                    chords[index] = self._cache[keys[index]] = chord
+                while len(self._cache) > self.size:
+                    self._cache.popitem(last=False)
+
+        with self._lock:
+            self.misses += len(missing)
+            self.hits += len(frames) - len(missing)
+        return tuple(chords[index] for index in inverse.reshape(-1))
+
+
+def memoization_report(strategy: PredictStrategy, frames: numpy.ndarray,
+                       levels: Sequence[int] = (4, 8, 16, 32)) -> Sequence[Tuple[int, float, float]]:
+    """ Hit rate and agreement with predictions of strategy of (T, 12) frames for every quantization level """
+    frames = numpy.asarray(frames)
+    frames = frames[frames.any(axis=1)]
+    expected = [str(chord) for chord in predict_frames(strategy, frames)]
+    report = list()
+    for level in levels:
+        memoized = _MemoizedPredictStrategy(strategy, level)
+        chords = memoized.predict_batch(frames)
+        agreement = numpy.mean([str(chord) == label for chord, label in zip(chords, expected)]) if len(frames) else 1.
+        report.append((level, memoized.hit_rate, float(agreement)))
+    return report
+
+
+@lru_cache(maxsize=None)
+def _no_chord() -> _Vector:
+    from .notation import Chord
+    return Chord('N')
+
+
+def predict_frames(strategy: PredictStrategy, frames: numpy.ndarray,
+                   threshold: Callable[[float], bool] = lambda t: t, no_chord: bool = False) -> Sequence[_Vector]:
+    """ Chords of (T, 12) frames. If no_chord, frames without energy, like frames of silence gate, are no chord and
+    are not predicted, otherwise strategy predicts every frame """
+    frames = numpy.asarray(frames)
+    sounding = frames.any(axis=1)
+    if no_chord and not sounding.all():
+        chords = [_no_chord()] * len(frames)
+        if sounding.any():
+            for index, chord in zip(numpy.flatnonzero(sounding), predict_frames(strategy, frames[sounding], threshold)):
+                chords[index] = chord
+        return tuple(chords)
+
+    if isinstance(strategy, BatchPredictStrategy) and len(frames) > 0:
+        return strategy.predict_batch(frames)
+    return tuple(strategy.predict(frame, threshold) for frame in frames)
+
+
 class ChordRecognizer(Protocol):
 
     def apply(self, sequence: Sequence[Tuple[float, _Vector]],
@@ -103,19 +332,20 @@ class ChordRecognizer(Protocol):
 
 class _ChordRecognizer:
 
-    def __init__(self, strategy: PredictStrategy) -> None:
+    def __init__(self, strategy: PredictStrategy, no_chord: bool = False) -> None:
         super().__init__()
         self.strategy = strategy
+        self.no_chord = no_chord
 
     def apply(self, sequence: Sequence[Tuple[float, _Vector]],
               threshold: Callable[[float], bool] = lambda t: t) -> Sequence[Tuple[float, _Vector]]:
         frame_sequence = _FrameSequence(sequence)
+        if len(frame_sequence) == 0:
+            return list()
 
-        chord_sequence: List[Tuple[float, _Vector]] = list()
-        for stop, frame in frame_sequence:
-            chord_sequence.append((stop, self.strategy.predict(frame, threshold)))
-
-        return chord_sequence
+        chords = predict_frames(self.strategy, numpy.stack([numpy.asarray(frame) for _, frame in frame_sequence]),
+                                threshold, self.no_chord)
+        return [(stop, chord) for (stop, _), chord in zip(frame_sequence, chords)]
 
 
 def _ChordRecognizerFactory(config: dict) -> ChordRecognizer:
@@ -129,4 +359,17 @@ def _ChordRecognizerFactory(config: dict) -> ChordRecognizer:
     if not isinstance(predict_strategy, PredictStrategy):
         raise ValueError('PredictStrategy must obey protocol PredictStrategy.')
 
-    return _ChordRecognizer(predict_strategy)
+    if config.get('PREDICT_CACHE_LEVELS') and config.get('KEY_AWARE'):
+        # cached strategy has no templates, so key aware prediction would silently score whole vocabulary
+        raise ValueError('PREDICT_CACHE_LEVELS and KEY_AWARE cannot be used together.')
+
+    if config.get('PREDICT_CACHE_LEVELS'):
+        predict_strategy = _MemoizedPredictStrategy(predict_strategy, config['PREDICT_CACHE_LEVELS'],
+                                                    config.get('PREDICT_CACHE_SIZE', 65536))
+
+    if config.get('KEY_AWARE'):
+        from .key import _KeyAwarePredictStrategy
+        predict_strategy = _KeyAwarePredictStrategy(predict_strategy, config.get('KEY_MIN_CONFIDENCE', 0.6))
+
+    # frames without energy are no chord only with silence gate, otherwise strategy predicts them as before
+    return _ChordRecognizer(predict_strategy, config.get('SILENCE_THRESHOLD') is not None)
@@ -0,0 +1,171 @@
+""" Concurrency budget shared by every pool of the pipeline
+
+N_JOBS of config is number of CPUs which pipeline may use, None uses all CPUs available to the process and negative
+value leaves CPUs free as in joblib. Pool splits budget into workers and native thread pools (BLAS, OpenMP, numba)
+of every worker are limited to its share, so nested parallelism never runs more threads than budget.
+"""
+import logging
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import NamedTuple, Callable, Any
+
+from ._lazy import lazy_import
+
+# joblib is imported only by pools, so importing chordify.app stays light
+threadpoolctl = lazy_import('threadpoolctl')
+
+_logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_controller = None
+_controller_modules = 0
+
+# limits of native thread pools applied while tasks of executors run, restored when no task runs
+_task_lock = threading.Lock()
+_task_limiters = list()
+_running_tasks = 0
+
+
+def _threadpool_controller():
+    """ Controller of native thread pools of process, scanning loaded libraries is slow so they are scanned again
+    only after new modules were imported, which may have loaded new libraries """
+    global _controller, _controller_modules
+    n_modules = len(sys.modules)
+    if _controller is None or n_modules != _controller_modules:
+        _controller, _controller_modules = threadpoolctl.ThreadpoolController(), n_modules
+    return _controller
+
+
+def cpu_budget(n_jobs: int = None) -> int:
+    """ Number of CPUs of budget n_jobs, at least 1 """
+    from joblib import cpu_count
+    n_cpus = cpu_count()
+    if n_jobs is None:
+        return n_cpus
+    if n_jobs < 0:
+        return max(1, n_cpus + 1 + n_jobs)
+    return max(1, n_jobs)
+
+
+def _set_numba_threads(threads: int):
+    """ Numba thread count is set per calling thread, numba is not imported only for that """
+    try:
+        import numba
+    except ImportError:
+        return
+    numba.set_num_threads(max(1, min(threads, numba.config.NUMBA_NUM_THREADS)))
+
+
+def _launch_numba_threads():
+    """ Launches numba thread pool without changing thread count of calling thread """
+    try:
+        import numba
+    except ImportError:
+        return
+    numba.get_num_threads()
+
+
+@contextmanager
+def limit_threads(threads: int):
+    """ Limits native thread pools of calling thread to threads, BLAS and OpenMP limits are process wide """
+    previous = getattr(_local, 'threads', None)
+    if previous == threads:
+        yield
+        return
+    with _threadpool_controller().limit(limits=threads):
+        _set_numba_threads(threads)
+        _local.threads = threads
+        try:
+            yield
+        finally:
+            _local.threads = previous
+            if previous is not None:
+                _set_numba_threads(previous)
+
+
+class _Limited:
+    """ Function which runs with native thread pools limited to threads, picklable for process workers """
+
+    def __init__(self, function: Callable, threads: int) -> None:
+        super().__init__()
+        self.function = function
+        self.threads = threads
+
+    def __call__(self, *args, **kwargs) -> Any:
+        with limit_threads(self.threads):
+            return self.function(*args, **kwargs)
+
+
+class Budget(NamedTuple):
+    """ Workers of pool and native threads of every worker """
+    workers: int
+    threads: int
+
+    def parallel(self, **kwargs):
+        """ joblib.Parallel of workers of loky backend, whose processes start with native thread pools of threads """
+        from joblib import Parallel, parallel_config
+        if self.workers == 1:
+            # single worker runs tasks in calling process without starting pool
+            return Parallel(n_jobs=1, **kwargs)
+        with parallel_config(backend='loky', inner_max_num_threads=self.threads):
+            return Parallel(n_jobs=self.workers, **kwargs)
+
+    def delayed(self, function: Callable) -> Callable:
+        """ joblib.delayed of function limited to threads of worker """
+        from joblib import delayed
+        return delayed(_Limited(function, self.threads))
+
+    def executor(self, **kwargs) -> ThreadPoolExecutor:
+        """ Thread pool of workers, BLAS and OpenMP threads are limited while tasks run and numba threads per worker """
+        return _LimitedExecutor(self, **kwargs)
+
+
+@contextmanager
+def _task_limits(threads: int):
+    """ Limits BLAS and OpenMP thread pools of process to threads while task runs. Limits are process wide, so they
+    are applied when task starts, which limits also libraries loaded by earlier tasks, and original limits are
+    restored after last running task finished. """
+    global _running_tasks
+    with _task_lock:
+        _task_limiters.append(_threadpool_controller().limit(limits=threads))
+        _running_tasks += 1
+    try:
+        yield
+    finally:
+        with _task_lock:
+            _running_tasks -= 1
+            if _running_tasks == 0:
+                # later limiters saved limits of earlier ones, so they are restored in reverse order
+                while _task_limiters:
+                    _task_limiters.pop().restore_original_limits()
+
+
+class _LimitedExecutor(ThreadPoolExecutor):
+    """ Thread pool whose tasks run with native thread pools limited to threads of budget. BLAS and OpenMP limits
+    are applied only while tasks run and numba threads are limited per worker, so threads outside of pool keep
+    their limits. """
+
+    def __init__(self, budget: Budget, **kwargs) -> None:
+        # numba thread pool launched by worker thread blocks interpreter exit, so calling thread launches it
+        _launch_numba_threads()
+        super().__init__(max_workers=budget.workers, initializer=_set_numba_threads, initargs=(budget.threads,),
+                         **kwargs)
+        self.threads = budget.threads
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(self._run, fn, *args, **kwargs)
+
+    def _run(self, fn, *args, **kwargs):
+        with _task_limits(self.threads):
+            return fn(*args, **kwargs)
+
+
+def split(n_jobs: int = None, workers: int = None) -> Budget:
+    """ Budget of n_jobs split into workers, at most one worker per CPU, and native threads of every worker """
+    n_cpus = cpu_budget(n_jobs)
+    if workers is not None and workers > n_cpus:
+        _logger.warning("%d workers exceed budget of %d CPUs, using %d workers" % (workers, n_cpus, n_cpus))
+    workers = n_cpus if workers is None else max(1, min(workers, n_cpus))
+    return Budget(workers, max(1, n_cpus // workers))
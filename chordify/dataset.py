@@ -0,0 +1,160 @@
+""" Columnar dataset of many transcriptions
+
+Dataset is one .npz file with segment columns track, start, stop and chord. Track and chord columns are indices into
+tracks table of track ids and vocabulary table of chord labels, segments of one track are stored contiguously.
+Whole corpus is loaded with one read, strings are stored as fixed width unicode arrays, so nothing is pickled.
+
+Usage: python -m chordify.dataset OUTPUT.npz FILE.lab [FILE.lab ...]
+"""
+import argparse
+import os
+import sys
+from typing import NamedTuple, Iterable, Tuple, Iterator, Sequence, Dict
+
+import numpy
+
+from .format import get_formatter
+
+VERSION = 1
+
+
+class Dataset(NamedTuple):
+    tracks: numpy.ndarray  # track ids
+    vocabulary: numpy.ndarray  # chord labels
+    track: numpy.ndarray  # index into tracks for every segment
+    start: numpy.ndarray
+    stop: numpy.ndarray
+    chord: numpy.ndarray  # index into vocabulary for every segment
+
+    def _rows(self, track_id: str) -> slice:
+        index = numpy.flatnonzero(self.tracks == track_id)
+        if index.size == 0:
+            raise KeyError(track_id)
+        begin, end = numpy.searchsorted(self.track, (index[0], index[0] + 1))
+        return slice(begin, end)
+
+    def segments(self, track_id: str) -> Iterator[Tuple[float, float, str]]:
+        """ Start, stop and label segments of one track """
+        rows = self._rows(track_id)
+        return zip(self.start[rows].tolist(), self.stop[rows].tolist(), self.vocabulary[self.chord[rows]].tolist())
+
+    def to_dataframe(self):
+        """ Returns pandas data frame with categorical track and chord columns """
+        import pandas
+
+        return pandas.DataFrame({
+            'track': pandas.Categorical.from_codes(self.track, self.tracks),
+            'start': self.start,
+            'stop': self.stop,
+            'chord': pandas.Categorical.from_codes(self.chord, self.vocabulary)
+        })
+
+
+class _Writer(object):
+    """ Collects transcriptions track by track and writes dataset on close """
+
+    def __init__(self, path: str, compressed: bool = False) -> None:
+        super().__init__()
+        self._path = path
+        self._compressed = compressed
+        self._tracks: Dict[str, int] = dict()
+        self._vocabulary: Dict[str, int] = dict()
+        self._starts, self._stops, self._chords = list(), list(), list()
+
+    def _chord_ids(self, labels: Sequence[str]) -> numpy.ndarray:
+        labels, inverse = numpy.unique(numpy.asarray(labels, dtype=str), return_inverse=True)
+        ids = numpy.fromiter((self._vocabulary.setdefault(label, len(self._vocabulary)) for label in labels.tolist()),
+                             dtype=numpy.int32, count=len(labels))
+        return ids[inverse.reshape(-1)]
+
+    def add_arrays(self, track_id: str, starts: Sequence[float], stops: Sequence[float], labels: Sequence[str]):
+        """ Add transcription of track as start and stop arrays and labels """
+        starts = numpy.asarray(starts, dtype=numpy.float64).reshape(-1)
+        stops = numpy.asarray(stops, dtype=numpy.float64).reshape(-1)
+        if not len(starts) == len(stops) == len(labels):
+            raise ValueError('Starts, stops and labels of track %s differ in length.' % track_id)
+        if numpy.any(starts > stops):
+            raise ValueError('Segment of track %s starts after its stop.' % track_id)
+        if track_id in self._tracks:
+            raise ValueError('Track %s already added.' % track_id)
+
+        self._tracks[track_id] = len(self._tracks)
+        self._starts.append(starts)
+        self._stops.append(stops)
+        self._chords.append(self._chord_ids(labels))
+
+    def add(self, track_id: str, segments: Iterable[Tuple[float, float, object]]):
+        """ Add transcription of track as start, stop and label segments """
+        segments = tuple(segments)
+        self.add_arrays(track_id, [segment[0] for segment in segments], [segment[1] for segment in segments],
+                        [str(segment[2]) for segment in segments])
+
+    def close(self):
+        counts = [len(chords) for chords in self._chords]
+        columns = {
+            'version': numpy.array(VERSION),
+            'tracks': numpy.array(list(self._tracks), dtype=str),
+            'vocabulary': numpy.array(list(self._vocabulary), dtype=str),
+            'track': numpy.repeat(numpy.arange(len(counts), dtype=numpy.int32), counts),
+            'start': numpy.concatenate(self._starts) if counts else numpy.empty(0),
+            'stop': numpy.concatenate(self._stops) if counts else numpy.empty(0),
+            'chord': numpy.concatenate(self._chords) if counts else numpy.empty(0, dtype=numpy.int32)
+        }
+        with open(self._path, 'wb') as file:
+            (numpy.savez_compressed if self._compressed else numpy.savez)(file, **columns)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+
+
+def writer(path: str, compressed: bool = False) -> _Writer:
+    """ Returns writer of dataset, use as context manager, dataset is written when context exits without error """
+    return _Writer(path, compressed)
+
+
+def write(path: str, transcriptions: Iterable[Tuple[str, Iterable[Tuple[float, float, object]]]],
+          compressed: bool = False):
+    """ Write track ids with their start, stop and label segments to dataset """
+    with writer(path, compressed) as _writer:
+        for track_id, segments in transcriptions:
+            _writer.add(track_id, segments)
+
+
+def read(path: str) -> Dataset:
+    """ Read whole dataset from path """
+    with numpy.load(path, allow_pickle=False) as columns:
+        if int(columns['version']) > VERSION:
+            raise ValueError('Dataset version %d is not supported.' % int(columns['version']))
+        return Dataset(*(columns[name] for name in Dataset._fields))
+
+
+def from_files(path: str, files: Sequence[str], track_ids: Sequence[str] = None, compressed: bool = False):
+    """ Convert transcription files, e.g. .lab, into dataset, track id defaults to file name without extension """
+    if track_ids is None:
+        track_ids = [os.path.splitext(os.path.basename(file))[0] for file in files]
+    if len(track_ids) != len(files):
+        raise ValueError('Number of track ids differs from number of files.')
+
+    with writer(path, compressed) as _writer:
+        for track_id, filepath in zip(track_ids, files):
+            with open(filepath) as file:
+                _writer.add_arrays(track_id, *get_formatter(filepath).load_arrays(file))
+
+
+def main(argv: Sequence[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Convert transcription files into columnar dataset')
+    parser.add_argument('output')
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--compressed', action='store_true', help='compress columns')
+    args = parser.parse_args(argv)
+
+    from_files(args.output, args.files, compressed=args.compressed)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
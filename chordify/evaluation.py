@@ -0,0 +1,183 @@
+""" Evaluation of transcriptions against reference annotations
+
+Score is duration weighted chord symbol recall: reference and estimated timelines are merged into intervals between
+all boundaries of both, every interval is compared once and weighted by its duration. Timelines are sorted arrays,
+so intervals are found by numpy.union1d and numpy.searchsorted without per frame loops. Labels are parsed once per
+unique label into codes of every comparison:
+
+- root: pitch class of root
+- majmin: root with major or minor triad, other qualities, e.g. sus or dim, are excluded from reference
+- full: root with set of pitch classes
+
+No chord N matches only N. Unknown chord X of reference is excluded, reference time not covered by estimated
+timeline counts as mismatch.
+
+Usage: python -m chordify.evaluation REFERENCE_DIR ESTIMATED_DIR
+"""
+import argparse
+import os
+import sys
+from functools import lru_cache
+from typing import Tuple, Sequence, Dict, Iterable, NamedTuple, Mapping
+
+import numpy
+
+from .format import get_formatter
+from .notation import parse, _chord_vector
+
+COMPARISONS = ('root', 'majmin', 'full')
+
+_NO_CHORD = -1
+_EXCLUDED = -2
+_UNCOVERED = -3
+_PITCH_CLASSES = {'C': 0, 'D': 2, 'E': 4, 'F': 5, 'G': 7, 'A': 9, 'B': 11}
+
+Timeline = Tuple[numpy.ndarray, numpy.ndarray, Sequence[str]]  # starts, stops, labels
+
+
+class Scores(NamedTuple):
+    """ Matched and evaluated seconds of every comparison """
+    matched: Mapping[str, float]
+    evaluated: Mapping[str, float]
+
+    def __add__(self, other: 'Scores') -> 'Scores':
+        return Scores({c: self.matched[c] + other.matched[c] for c in COMPARISONS},
+                      {c: self.evaluated[c] + other.evaluated[c] for c in COMPARISONS})
+
+    def recall(self) -> Dict[str, float]:
+        """ Duration weighted chord symbol recall of every comparison """
+        return {c: self.matched[c] / self.evaluated[c] if self.evaluated[c] else 0. for c in COMPARISONS}
+
+
+def _empty() -> Scores:
+    return Scores(dict.fromkeys(COMPARISONS, 0.), dict.fromkeys(COMPARISONS, 0.))
+
+
+@lru_cache(maxsize=65536)
+def _label_codes(label: str) -> Tuple[int, int, int]:
+    """ Root, majmin and full code of label """
+    if label == 'N':
+        return _NO_CHORD, _NO_CHORD, _NO_CHORD
+    try:
+        pitchname, _, _ = parse(label)
+        root = (_PITCH_CLASSES[pitchname[0]] + pitchname.count('#') - pitchname.count('b')) % 12
+        vector = numpy.roll(_chord_vector(label), -root)
+    except Exception:
+        # X or label which cannot be parsed
+        return _EXCLUDED, _EXCLUDED, _EXCLUDED
+
+    mask = int(numpy.dot(vector, 1 << numpy.arange(12)))
+    third, minor_third, fifth = vector[4], vector[3], vector[7]
+    if fifth and third and not minor_third:
+        majmin = 2 * root
+    elif fifth and minor_third and not third:
+        majmin = 2 * root + 1
+    else:
+        majmin = _EXCLUDED
+    return root, majmin, root << 12 | mask
+
+
+def label_codes(labels: Sequence[str]) -> numpy.ndarray:
+    """ Codes of labels as (n, 3) array, every unique label is parsed once """
+    labels, inverse = numpy.unique(numpy.asarray(labels, dtype=str), return_inverse=True)
+    codes = numpy.array([_label_codes(label) for label in labels.tolist()], dtype=numpy.int64).reshape(-1, 3)
+    return codes[inverse.reshape(-1)]
+
+
+def _locate(starts: numpy.ndarray, stops: numpy.ndarray, times: numpy.ndarray) -> numpy.ndarray:
+    """ Index of segment which contains every time or -1 """
+    index = numpy.searchsorted(stops, times, side='right')
+    inside = index < len(stops)
+    inside[inside] = starts[index[inside]] <= times[inside]
+    return numpy.where(inside, index, -1)
+
+
+def compare_codes(reference: Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray],
+                  estimated: Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]) -> Scores:
+    """ Scores of timelines with codes of labels instead of labels """
+    ref_starts, ref_stops, ref_codes = reference
+    est_starts, est_stops, est_codes = estimated
+    if len(ref_starts) == 0:
+        return _empty()
+
+    boundaries = numpy.union1d(numpy.concatenate((ref_starts, ref_stops)), numpy.concatenate((est_starts, est_stops)))
+    boundaries = boundaries[(boundaries >= ref_starts[0]) & (boundaries <= ref_stops[-1])]
+    starts, durations = boundaries[:-1], numpy.diff(boundaries)
+
+    ref_index = _locate(ref_starts, ref_stops, starts)
+    est_index = _locate(est_starts, est_stops, starts)
+    covered = ref_index >= 0
+    durations, ref_index, est_index = durations[covered], ref_index[covered], est_index[covered]
+
+    ref = ref_codes[ref_index]
+    est = numpy.where((est_index >= 0)[:, None], est_codes[est_index], _UNCOVERED) if len(est_codes) else \
+        numpy.full_like(ref, _UNCOVERED)
+    evaluated = ref != _EXCLUDED
+    matched = evaluated & (ref == est)
+    return Scores(dict(zip(COMPARISONS, (durations @ matched).tolist())),
+                  dict(zip(COMPARISONS, (durations @ evaluated).tolist())))
+
+
+def compare(reference: Timeline, estimated: Timeline) -> Scores:
+    """ Scores of estimated timeline against reference timeline """
+    return compare_codes((numpy.asarray(reference[0], dtype=float), numpy.asarray(reference[1], dtype=float),
+                          label_codes(reference[2])),
+                         (numpy.asarray(estimated[0], dtype=float), numpy.asarray(estimated[1], dtype=float),
+                          label_codes(estimated[2])))
+
+
+def compare_datasets(reference, estimated) -> Dict[str, Scores]:
+    """ Scores of tracks of estimated chordify.dataset.Dataset which are in reference dataset, labels of both
+    vocabularies are parsed once """
+    ref_codes, est_codes = label_codes(reference.vocabulary), label_codes(estimated.vocabulary)
+    ref_bounds = numpy.searchsorted(reference.track, numpy.arange(len(reference.tracks) + 1))
+    est_bounds = numpy.searchsorted(estimated.track, numpy.arange(len(estimated.tracks) + 1))
+    ref_tracks = {track_id: index for index, track_id in enumerate(reference.tracks.tolist())}
+
+    scores = dict()
+    for index, track_id in enumerate(estimated.tracks.tolist()):
+        if track_id in ref_tracks:
+            ref_rows = slice(ref_bounds[ref_tracks[track_id]], ref_bounds[ref_tracks[track_id] + 1])
+            est_rows = slice(est_bounds[index], est_bounds[index + 1])
+            scores[track_id] = compare_codes(
+                (reference.start[ref_rows], reference.stop[ref_rows], ref_codes[reference.chord[ref_rows]]),
+                (estimated.start[est_rows], estimated.stop[est_rows], est_codes[estimated.chord[est_rows]]))
+    return scores
+
+
+def _load(path: str) -> Timeline:
+    with open(path) as file:
+        return get_formatter(path).load_arrays(file)
+
+
+def compare_files(pairs: Iterable[Tuple[str, str]]) -> Dict[str, Scores]:
+    """ Scores of pairs of reference and estimated transcription files, e.g. .lab """
+    return {estimated: compare(_load(reference), _load(estimated)) for reference, estimated in pairs}
+
+
+def total(scores: Iterable[Scores]) -> Scores:
+    """ Sum of scores, its recall is weighted by duration of tracks """
+    return sum(scores, _empty())
+
+
+def main(argv: Sequence[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Chord symbol recall of transcriptions against references')
+    parser.add_argument('reference', help='directory of reference transcription files')
+    parser.add_argument('estimated', help='directory of estimated transcription files of same names')
+    args = parser.parse_args(argv)
+
+    pairs = [(os.path.join(args.reference, name), os.path.join(args.estimated, name))
+             for name in sorted(os.listdir(args.estimated)) if os.path.exists(os.path.join(args.reference, name))]
+    scores = compare_files(pairs)
+
+    print('%-40s %s' % ('file', ' '.join('%8s' % c for c in COMPARISONS)))
+    for path, score in scores.items():
+        recall = score.recall()
+        print('%-40s %s' % (os.path.basename(path), ' '.join('%8.4f' % recall[c] for c in COMPARISONS)))
+    recall = total(scores.values()).recall()
+    print('%-40s %s' % ('total (%d files)' % len(scores), ' '.join('%8.4f' % recall[c] for c in COMPARISONS)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,18 +1,23 @@
+import io
+import json
 import os
-
 from abc import abstractmethod, ABC
-from typing import Sequence, overload, Iterable, Tuple
+from itertools import chain
+from typing import Sequence, overload, Iterable, Tuple, TextIO, Callable, Dict, Iterator
+
+import numpy
 
 
 class _LabIterable(tuple):
 
     def __new__(cls, iterable):
+        iterable = tuple(iterable)
         try:
             for t in iterable:
                 if not isinstance(t, tuple) or \
                         not isinstance(t[0], float) or \
                         not isinstance(t[1], float) or \
-                        not isinstance(t[1], str):
+                        not isinstance(t[2], str):
                     raise ValueError("Not valid values")
             _last = 0
             for t in iterable:
@@ -22,7 +27,7 @@ class _LabIterable(tuple):
         except IndexError:
             raise ValueError("Not valid values")
 
-        return super().__new__(tuple, iterable)
+        return super().__new__(cls, iterable)
 
     @overload
     @abstractmethod
@@ -33,6 +38,13 @@ class _LabIterable(tuple):
         return super().__getitem__(i)
 
 
+def to_segments(sequence: Iterable[Tuple[float, object]], start: float = 0.0) -> Iterator[Tuple[float, float, str]]:
+    """ Converts transcription, sequence of stop times and chords, into start, stop, label segments """
+    for stop, chord in sequence:
+        yield float(start), float(stop), str(chord)
+        start = stop
+
+
 class Format(ABC):
 
     @abstractmethod
@@ -43,29 +55,128 @@ class Format(ABC):
     def decode(self, string: str) -> Iterable:
         pass
 
+    def dump(self, iterable: Iterable, file: TextIO):
+        """ Write iterable into text file """
+        file.write(self.encode(iterable))
+
+    def load(self, file: TextIO) -> Iterable:
+        """ Read iterable from text file """
+        return self.decode(file.read())
+
+
+class _SegmentFormat(Format, ABC):
+    """ Format of start, stop, label segments written and read line by line """
 
-class _LabFormat(Format):
+    CHUNK_SIZE = 1 << 20  # characters read at once by load_arrays
 
-    def encode(self, iterable: Iterable[Tuple[float, float, str]]) -> str:
-        _result = ""
-        for sequence in iter(iterable):
-            for start, stop, chord in sequence:
-                _result += '%s %s %s\n' % (start, stop, chord)
+    def __init__(self, precision: int = None) -> None:
+        super().__init__()
+        self._float = '%s' if precision is None else '%%.%df' % precision
 
-        return _result[:-1]  # remove last newline character
+    @abstractmethod
+    def _encode_line(self, start: float, stop: float, label: str) -> str:
+        pass
+
+    @abstractmethod
+    def _split_line(self, line: str) -> Tuple[str, str, str]:
+        pass
+
+    def dump(self, iterable: Iterable[Tuple[float, float, object]], file: TextIO):
+        file.writelines(self._encode_line(float(start), float(stop), str(label)) + '\n'
+                        for start, stop, label in iterable)
+
+    def iter_load(self, file: TextIO) -> Iterator[Tuple[float, float, str]]:
+        """ Read segments one line at a time """
+        for line in file:
+            if line.strip():
+                start, stop, label = self._split_line(line)
+                yield float(start), float(stop), label
+
+    def _split_lines(self, lines: Sequence[str]) -> Tuple[Sequence[str], Sequence[str], Sequence[str]]:
+        columns = tuple(zip(*(self._split_line(line) for line in lines if line.strip())))
+        return columns if columns else ((), (), ())
+
+    def load_arrays(self, file: TextIO) -> Tuple[numpy.ndarray, numpy.ndarray, Sequence[str]]:
+        """ Read all segments into start and stop arrays and labels, file is read in chunks of lines and times
+        of every chunk are converted at once """
+        starts, stops, labels = list(), list(), list()
+        for lines in iter(lambda: file.readlines(self.CHUNK_SIZE), []):
+            _starts, _stops, _labels = self._split_lines(lines)
+            starts.append(numpy.array(_starts, dtype=numpy.float64))
+            stops.append(numpy.array(_stops, dtype=numpy.float64))
+            labels.extend(_labels)
+        if not labels:
+            return numpy.empty(0), numpy.empty(0), labels
+        return numpy.concatenate(starts), numpy.concatenate(stops), labels
+
+    def load(self, file: TextIO) -> Iterable[Tuple[float, float, str]]:
+        return _LabIterable(self.iter_load(file))
+
+    def encode(self, iterable: Iterable[Tuple[float, float, object]]) -> str:
+        buffer = io.StringIO()
+        self.dump(iterable, buffer)
+        return buffer.getvalue()[:-1]  # remove last newline character
 
     def decode(self, string: str) -> Iterable[Tuple[float, float, str]]:
-        _lines = string.split('\n')
-        _iterable = _LabIterable(())
-        for line in _lines:
-            _iterable += _LabIterable(line.split(""))
-        return _iterable
+        return self.load(io.StringIO(string))
+
 
+class _LabFormat(_SegmentFormat):
+    """ Whitespace separated start, stop and label on every line """
 
-# TODO register_formatter()
+    def _encode_line(self, start: float, stop: float, label: str) -> str:
+        return ' '.join((self._float % start, self._float % stop, label))
 
-def get_formatter(path: str) -> Format:
+    def _split_line(self, line: str) -> Tuple[str, str, str]:
+        try:
+            start, stop, label = line.split(None, 2)
+        except ValueError:
+            raise ValueError('Line "%s" is not start, stop and label.' % line.rstrip())
+        return start, stop, label.strip()
+
+    def _split_lines(self, lines: Sequence[str]) -> Tuple[Sequence[str], Sequence[str], Sequence[str]]:
+        # whole chunk is split at once, end of every line is marked by NUL token, so chunk is split fast only if
+        # every line has exactly three columns, that is every fourth token and no other token is NUL, otherwise
+        # lines are split one by one
+        chunk = ''.join(lines)
+        if '\0' in chunk:
+            return super()._split_lines(lines)
+        tokens = (chunk if chunk.endswith('\n') else chunk + '\n').replace('\n', ' \0 ').split()
+        n_lines = len(tokens) // 4
+        if len(tokens) != 4 * n_lines or tokens[3::4].count('\0') != n_lines or tokens.count('\0') != n_lines:
+            return super()._split_lines(lines)
+        return tokens[0::4], tokens[1::4], tokens[2::4]
+
+
+class _JSONLinesFormat(_SegmentFormat):
+    """ JSON object with start, stop and chord on every line """
+
+    def _encode_line(self, start: float, stop: float, label: str) -> str:
+        return '{"start": %s, "stop": %s, "chord": %s}' % (self._float % start, self._float % stop, json.dumps(label))
+
+    def _split_line(self, line: str) -> Tuple[str, str, str]:
+        segment = json.loads(line)
+        return segment['start'], segment['stop'], segment['chord']
+
+
+_FORMATTERS: Dict[str, Callable[..., Format]] = dict()
+
+
+def register_formatter(extension: str, factory: Callable[..., Format]):
+    """ Register factory of format for file extension, factory receives keyword arguments of get_formatter """
+    if not extension.startswith('.'):
+        raise ValueError('Extension must start with dot.')
+    _FORMATTERS[extension.lower()] = factory
+
+
+def get_formatter(path: str, default: str = None, **kwargs) -> Format:
+    """ Returns format by extension of path, or by default extension if path extension is not registered """
     filename, file_extension = os.path.splitext(path)
-    if file_extension == '.lab':
-        return _LabFormat()
+    for extension in chain((file_extension.lower(),), () if default is None else (default,)):
+        if extension in _FORMATTERS:
+            return _FORMATTERS[extension](**kwargs)
     raise NotImplementedError("Not supported file format")
+
+
+register_formatter('.lab', _LabFormat)
+register_formatter('.jsonl', _JSONLinesFormat)
@@ -1,9 +1,12 @@
 from itertools import tee
 
-import librosa
 import numpy as np
 from numpy.linalg import norm
-from scipy.signal import find_peaks
+
+from ._lazy import lazy_import
+
+librosa = lazy_import('librosa')
+signal = lazy_import('scipy.signal')
 
 
 def _pairwise(iterable):
@@ -27,6 +30,6 @@ def hcdf(frames: np.ndarray):
 
 def get_segments(frames: np.ndarray, prominence=None):
     _hcdf = hcdf(frames)
-    _peaks, _ = find_peaks(_hcdf, prominence)
+    _peaks, _ = signal.find_peaks(_hcdf, prominence)
     return np.array_split(frames, _peaks, axis=1), \
            np.asarray(tuple(_peaks) + (np.size(frames, axis=1) - 1,))
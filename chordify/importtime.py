@@ -0,0 +1,77 @@
+""" Import time report of chordify modules
+
+Usage: python -m chordify.importtime [--budget SECONDS] [--top N] [module ...]
+
+Every module is imported in fresh interpreter with -X importtime, report lists total time and slowest imports.
+Exit status is 1 if any module exceeds budget.
+"""
+import argparse
+import subprocess
+import sys
+from typing import Sequence, Tuple, NamedTuple
+
+DEFAULT_MODULES = ('chordify.app', 'chordify.model', 'chordify.notation')
+DEFAULT_BUDGET = 0.5  # seconds
+
+
+class ImportTime(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def measure(module: str) -> Sequence[ImportTime]:
+    """ Import module in fresh interpreter and returns import times in order of completion """
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import %s' % module],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    if process.returncode != 0:
+        raise ImportError('Module %s cannot be imported:\n%s' % (module, process.stderr))
+
+    result = list()
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        result.append(ImportTime(name.strip(), int(self_us), int(cumulative_us), depth))
+    return result
+
+
+def total(times: Sequence[ImportTime], module: str) -> float:
+    """ Seconds spent by import of module including its dependencies """
+    return sum(time.cumulative_us for time in times if time.depth == 0 and
+               (time.module == module or module.startswith(time.module + '.'))) / 1e6
+
+
+def report(module: str, top: int = 15) -> Tuple[str, float]:
+    """ Returns text report and total seconds of module import """
+    times = measure(module)
+    seconds = total(times, module)
+
+    lines = ['%s: %.3f s' % (module, seconds)]
+    for time in sorted(times, key=lambda t: t.cumulative_us, reverse=True)[:top]:
+        lines.append('  %9.1f ms %9.1f ms  %s%s' % (time.cumulative_us / 1e3, time.self_us / 1e3,
+                                                   '  ' * time.depth, time.module))
+    return '\n'.join(lines), seconds
+
+
+def main(argv: Sequence[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Import time report of chordify modules')
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES)
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET, help='seconds allowed for each module')
+    parser.add_argument('--top', type=int, default=15, help='number of slowest imports listed')
+    args = parser.parse_args(argv)
+
+    status = 0
+    for module in args.modules:
+        text, seconds = report(module, args.top)
+        print(text)
+        if seconds > args.budget:
+            print('%s exceeds budget of %.3f s' % (module, args.budget))
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
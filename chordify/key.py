@@ -0,0 +1,139 @@
+""" Key estimation and key aware chord prediction
+
+Key of frames is estimated from their aggregate chroma, median of frames as in _VectorSegmentationStrategy, by
+correlation with Krumhansl-Kessler profiles of all 24 major and minor keys. Correlation picks key but it is high even
+for music which changes keys, so confidence of key is fraction of frames whose three strongest pitch classes are all
+in scale of key. Chords plausible in key are chords whose pitch classes are all in scale of key, minor keys allow both
+natural and harmonic minor scale, so dominant chord of minor key is plausible. Template strategies then score frames
+only against plausible chords, or against whole vocabulary when confidence is below threshold.
+
+Key is estimated from frames of one predict_batch call. Transcript.from_audio predicts whole track at once, while
+Transcript.iter_audio predicts block by block, so streamed transcription estimates key of every block and key may
+change between blocks.
+"""
+import logging
+from typing import NamedTuple, Sequence, Callable, Tuple, Dict
+
+import numpy
+
+from .chord_recognition import PredictStrategy, BatchPredictStrategy, _Vector, _TemplateBankPredictStrategy, \
+    _PredictStrategy
+
+_logger = logging.getLogger(__name__)
+
+PITCH_CLASSES = ('C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B')
+
+# Krumhansl and Kessler probe tone profiles of C major and C minor
+MAJOR_PROFILE = numpy.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_PROFILE = numpy.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+# pitch classes of scales of C major and C minor, natural and harmonic
+_MAJOR_SCALE = (0, 2, 4, 5, 7, 9, 11)
+_MINOR_SCALE = (0, 2, 3, 5, 7, 8, 10, 11)
+
+
+def _profiles() -> numpy.ndarray:
+    """ (24, 12) standardized profiles, rows 0-11 are major and 12-23 minor keys of tonics C to B """
+    profiles = numpy.array([numpy.roll(profile, tonic) for profile in (MAJOR_PROFILE, MINOR_PROFILE)
+                            for tonic in range(12)])
+    return (profiles - profiles.mean(axis=1, keepdims=True)) / profiles.std(axis=1, keepdims=True)
+
+
+_PROFILES = _profiles()
+
+
+class Key(NamedTuple):
+    tonic: int
+    minor: bool
+    correlation: float
+    confidence: float
+
+    def __str__(self):
+        return '%s:%s' % (PITCH_CLASSES[self.tonic], 'min' if self.minor else 'maj')
+
+    @property
+    def scale(self) -> numpy.ndarray:
+        """ Mask of 12 pitch classes of scale of key """
+        mask = numpy.zeros(12, dtype=bool)
+        mask[(numpy.array(_MINOR_SCALE if self.minor else _MAJOR_SCALE) + self.tonic) % 12] = True
+        return mask
+
+
+def estimate(frames: numpy.ndarray, max_frames: int = 4096) -> Key:
+    """ Key of (T, 12) frames by correlation of their aggregate chroma with key profiles, key of long sequences is
+    estimated from max_frames evenly spaced frames """
+    frames = numpy.asarray(frames, dtype=numpy.float64).reshape(-1, 12)
+    frames = frames[::max(1, -(-len(frames) // max_frames))]
+    aggregate = numpy.median(frames, axis=0)
+    deviation = aggregate.std()
+    if not numpy.isfinite(deviation) or deviation == 0:
+        # silence or flat chroma has no key
+        return Key(0, False, 0., 0.)
+    correlations = _PROFILES @ ((aggregate - aggregate.mean()) / deviation) / 12
+    best = int(numpy.argmax(correlations))
+    key = Key(best % 12, best >= 12, float(correlations[best]), 0.)
+
+    # three strongest pitch classes are in scale when three in scale are stronger than every other, silent frames
+    # neither support nor contradict key
+    scale = key.scale
+    sounding = frames[frames.sum(axis=1) > 0]
+    if len(sounding):
+        outside = sounding[:, ~scale].max(axis=1)
+        fits = (sounding[:, scale] > outside[:, None]).sum(axis=1) >= 3
+        key = key._replace(confidence=float(numpy.mean(fits)))
+    return key
+
+
+def _vocabulary(strategy: PredictStrategy) -> Tuple[Sequence[_Vector], numpy.ndarray]:
+    """ Chords of template strategy and (n_chords, 12) matrix whose product with frames are their scores """
+    if isinstance(strategy, (_TemplateBankPredictStrategy, _PredictStrategy)):
+        return strategy.templates, strategy.template_matrix()
+    raise ValueError("Key aware prediction needs template predict strategy.")
+
+
+class _KeyAwarePredictStrategy(PredictStrategy):
+    """ Two pass prediction of frames, first pass estimates key of all frames and second scores frames only against
+    chords plausible in key. Strategies without templates, like learned classifiers, always score whole vocabulary. """
+
+    def __init__(self, strategy: PredictStrategy, min_confidence: float = 0.6) -> None:
+        super().__init__()
+        self.strategy = strategy
+        self.min_confidence = min_confidence
+        try:
+            self._chords, self._matrix = _vocabulary(strategy)
+        except ValueError:
+            self._chords, self._matrix = None, None
+        self._pitch_classes = None if self._matrix is None else self._matrix > 0
+        self._candidates: Dict[Tuple[int, bool], numpy.ndarray] = dict()
+
+    def candidates(self, key: Key) -> numpy.ndarray:
+        """ Indices of chords of vocabulary plausible in key """
+        if (key.tonic, key.minor) not in self._candidates:
+            outside = self._pitch_classes & ~key.scale
+            self._candidates[key.tonic, key.minor] = numpy.flatnonzero(~outside.any(axis=1))
+        return self._candidates[key.tonic, key.minor]
+
+    def predict(self, frame: _Vector, threshold: Callable[[float], bool] = lambda t: t) -> _Vector:
+        # single frame has no key
+        return self.strategy.predict(frame, threshold)
+
+    def _predict_all(self, frames: numpy.ndarray) -> Sequence[_Vector]:
+        if isinstance(self.strategy, BatchPredictStrategy):
+            return self.strategy.predict_batch(frames)
+        return tuple(self.strategy.predict(frame) for frame in frames)
+
+    def predict_batch(self, frames: numpy.ndarray) -> Sequence[_Vector]:
+        frames = numpy.asarray(frames)
+        if self._matrix is None:
+            return self._predict_all(frames)
+
+        key = estimate(frames)
+        candidates = self.candidates(key)
+        if key.confidence < self.min_confidence or len(candidates) == 0:
+            _logger.info("Key %s of confidence %.2f, scoring whole vocabulary" % (key, key.confidence))
+            return self._predict_all(frames)
+
+        _logger.info("Key %s of confidence %.2f, scoring %d of %d chords" % (key, key.confidence, len(candidates),
+                                                                              len(self._chords)))
+        best = candidates[numpy.argmax(frames @ self._matrix[candidates].T, axis=1)]
+        return tuple(self._chords[i] for i in best)
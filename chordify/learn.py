@@ -1,14 +1,25 @@
+import logging
+import math
+import time
+from collections import OrderedDict
 from functools import partial
-from typing import Protocol, Any, runtime_checkable
+from typing import Protocol, Any, runtime_checkable, Mapping, Sequence, Union
 
 import numpy
+from sklearn.base import clone
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import GridSearchCV
+from sklearn.metrics.pairwise import linear_kernel, rbf_kernel, polynomial_kernel, sigmoid_kernel
+from sklearn.model_selection import ParameterGrid, ParameterSampler, StratifiedKFold
 from sklearn.neighbors import KNeighborsClassifier
 from sklearn.preprocessing import LabelEncoder
 from sklearn.svm import SVC
 from sklearn.tree import DecisionTreeClassifier
 
+from . import concurrency
+from .model import export_estimator
+
+_logger = logging.getLogger(__name__)
+
 
 @runtime_checkable
 class BaseTransformer(Protocol):
@@ -58,15 +69,31 @@ class _Estimator(PredictStrategy):
         y = self._estimator.predict(numpy.asarray(frame).reshape(1, -1))
         return self._label_transformer.inverse_transform(y)[0]
 
+    def predict_batch(self, frames: Any) -> Any:
+        """ Predict all frames of (T, 12) matrix by one estimator call """
+        frames = numpy.asarray(frames)
+        y = self._estimator.predict(frames.reshape(len(frames), -1))
+        return self._label_transformer.inverse_transform(y)
+
+    def export(self):
+        """ Returns kind, params and arrays for chordify.model """
+        return export_estimator(self._estimator, numpy.asarray(self._label_transformer.classes_, dtype=str))
+
 
 class _ObjectEncoder(LabelEncoder):
     """ Encode objects instead of numbers or strings """
     _classes = None
+    _lookup = None
 
     def fit(self, y):
         self._classes = dict(map(lambda obj: (str(obj), obj), y))
         keys = tuple(map(lambda obj: str(obj), y))
-        return super().fit(keys)
+        super().fit(keys)
+
+        # objects ordered by encoded label
+        self._lookup = numpy.empty(len(self.classes_), dtype=object)
+        self._lookup[:] = [self._classes[key] for key in self.classes_]
+        return self
 
     def transform(self, y):
         keys = tuple(map(lambda obj: str(obj), y))
@@ -77,31 +104,277 @@ class _ObjectEncoder(LabelEncoder):
         return self.transform(y)
 
     def inverse_transform(self, y):
-        keys = super().inverse_transform(y)
-        values = tuple(map(lambda obj: self._classes[obj], keys))
+        y = numpy.asarray(y, dtype=numpy.int64)
+        if y.size and (y.min() < 0 or y.max() >= len(self._lookup)):
+            raise ValueError('y contains previously unseen labels')
+        return tuple(self._lookup[y])
+
+
+def _gamma(gamma: Union[str, float], X: numpy.ndarray) -> float:
+    """ Resolve gamma the same way SVC does for the whole training set """
+    if gamma == 'scale':
+        variance = X.var()
+        return 1.0 / (X.shape[1] * variance) if variance != 0 else 1.0
+    if gamma == 'auto':
+        return 1.0 / X.shape[1]
+    return gamma
+
+
+def _kernel_key(params: Mapping, X: numpy.ndarray):
+    """ Parameters which determine SVC kernel matrix, None if kernel cannot be precomputed """
+    kernel = params['kernel']
+    if kernel == 'linear':
+        return 'linear',
+    if kernel == 'rbf':
+        return 'rbf', _gamma(params['gamma'], X)
+    if kernel == 'poly':
+        return 'poly', params['degree'], _gamma(params['gamma'], X), params['coef0']
+    if kernel == 'sigmoid':
+        return 'sigmoid', _gamma(params['gamma'], X), params['coef0']
+    return None
+
+
+def _kernel_matrix(key, X: numpy.ndarray) -> numpy.ndarray:
+    kernel = key[0]
+    if kernel == 'linear':
+        return linear_kernel(X)
+    if kernel == 'rbf':
+        return rbf_kernel(X, gamma=key[1])
+    if kernel == 'poly':
+        return polynomial_kernel(X, degree=key[1], gamma=key[2], coef0=key[3])
+    if kernel == 'sigmoid':
+        return sigmoid_kernel(X, gamma=key[1], coef0=key[2])
+    raise ValueError('Unknown kernel %s' % kernel)
+
+
+def _fit_and_score(estimator: EstimatorMixin, params: Mapping, X: numpy.ndarray, y: numpy.ndarray,
+                   train: numpy.ndarray, test: numpy.ndarray, precomputed: bool) -> float:
+    model = clone(estimator).set_params(**params)
+    if precomputed:
+        model.set_params(kernel='precomputed')
+        model.fit(X[numpy.ix_(train, train)], y[train])
+        predicted = model.predict(X[numpy.ix_(test, train)])
+    else:
+        model.fit(X[train], y[train])
+        predicted = model.predict(X[test])
+    return float(numpy.mean(predicted == y[test]))
+
+
+class _CandidateSearch:
+    """ Cross-validated search over parameter grid with fit or time budget
+
+    search is one of 'grid' (every candidate), 'random' (sampled candidates) or 'halving' (successive halving,
+    candidates are evaluated on growing subsets of samples and only best 1 / factor of them advance).
+    Search stops evaluating new candidates once max_fits or max_time (seconds) is exhausted and best candidate
+    found so far is refitted on all samples.
+
+    Folds are split once per subset and shared by all candidates. Kernel matrices of SVC are computed once per
+    kernel configuration (gamma is resolved on all samples) and reused by every candidate and fold, so candidates
+    which differ only in C cost no kernel evaluations. Cache holds at most KERNEL_CACHE_BYTES of matrices and evicts
+    least recently used kernel configuration.
+    """
+
+    KERNEL_CACHE_BYTES = 1 << 30  # max total size of cached kernel matrices, least recently used are evicted
+
+    def __init__(self, estimator: EstimatorMixin, param_grid: Union[Mapping, Sequence[Mapping]],
+                 search: str = 'grid', max_fits: int = None, max_time: float = None, n_iter: int = None,
+                 cv: int = 5, factor: int = 3, n_jobs: int = -1, random_state: int = 0) -> None:
+        super().__init__()
 
-        return values
+        if search not in ('grid', 'random', 'halving'):
+            raise ValueError('Search must be one of grid, random or halving.')
+
+        self._estimator = estimator
+        self._param_grid = param_grid
+        self._search = search
+        self._max_fits = max_fits
+        self._max_time = max_time
+        self._n_iter = n_iter
+        self._cv = cv
+        self._factor = factor
+        self._n_jobs = n_jobs
+        self._random_state = random_state
+
+        self._deadline = None
+        self._kernels = OrderedDict()
+        self._folds = dict()
+
+        self.n_fits_ = 0
+        self.best_params_ = None
+        self.best_score_ = None
+        self.best_estimator_ = None
+
+    def _candidates(self) -> Sequence[Mapping]:
+        if self._search == 'random':
+            n_iter = self._n_iter
+            if n_iter is None:
+                n_iter = self._max_fits // self._cv if self._max_fits is not None else 10
+            return list(ParameterSampler(self._param_grid, max(1, n_iter), random_state=self._random_state))
+        return list(ParameterGrid(self._param_grid))
+
+    def _exhausted(self, n_fits: int) -> bool:
+        if self._max_fits is not None and self.n_fits_ + n_fits > self._max_fits:
+            return True
+        if self._deadline is not None and time.monotonic() > self._deadline:
+            return True
+        return False
+
+    def _split(self, y: numpy.ndarray, indices: numpy.ndarray):
+        """ Folds for subset of samples, indices are relative to whole set """
+        key = len(indices)
+        if key not in self._folds:
+            n_splits = max(2, min(self._cv, numpy.min(numpy.unique(y[indices], return_counts=True)[1])))
+            splitter = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=self._random_state)
+            self._folds[key] = tuple((indices[train], indices[test])
+                                     for train, test in splitter.split(numpy.zeros(len(indices)), y[indices]))
+        return self._folds[key]
+
+    def _kernel(self, params: Mapping, X: numpy.ndarray):
+        """ Cached kernel matrix over all samples or None, matrix larger than whole cache is not computed """
+        nbytes = len(X) ** 2 * numpy.dtype(numpy.float64).itemsize
+        if not isinstance(self._estimator, SVC) or nbytes > self.KERNEL_CACHE_BYTES:
+            return None
+        key = _kernel_key(dict(self._estimator.get_params(), **params), X)
+        if key is None:
+            return None
+        if key in self._kernels:
+            self._kernels.move_to_end(key)
+            return self._kernels[key]
+        while self._kernels and nbytes + sum(kernel.nbytes for kernel in self._kernels.values()) > \
+                self.KERNEL_CACHE_BYTES:
+            self._kernels.popitem(last=False)
+        self._kernels[key] = _kernel_matrix(key, X)
+        return self._kernels[key]
+
+    def _evaluate(self, X: numpy.ndarray, y: numpy.ndarray, indices: numpy.ndarray,
+                  candidates: Sequence[Mapping]) -> Sequence[float]:
+        """ Mean fold score of candidates, candidates which did not fit into budget are scored by nan """
+        folds = self._split(y, indices)
+        scores = [numpy.nan] * len(candidates)
+        budget = concurrency.split(self._n_jobs)
+        chunk = budget.workers
+
+        with budget.parallel() as parallel:
+            for begin in range(0, len(candidates), chunk):
+                if self._exhausted(len(folds)):
+                    _logger.info('Search budget exhausted after %d fits.' % self.n_fits_)
+                    break
+                end = min(begin + chunk, len(candidates))
+                if self._max_fits is not None:
+                    end = min(end, begin + (self._max_fits - self.n_fits_) // len(folds))
+
+                tasks = list()
+                for params in candidates[begin:end]:
+                    kernel = self._kernel(params, X)
+                    data = X if kernel is None else kernel
+                    tasks.extend(budget.delayed(_fit_and_score)(self._estimator, params, data, y, train, test,
+                                                                kernel is not None) for train, test in folds)
+                results = parallel(tasks)
+                self.n_fits_ += len(tasks)
+
+                for i in range(end - begin):
+                    scores[begin + i] = float(numpy.mean(results[i * len(folds):(i + 1) * len(folds)]))
+        return scores
+
+    def _subset(self, y: numpy.ndarray, n_samples: int) -> numpy.ndarray:
+        """ Class stratified subset of sample indices """
+        if n_samples >= len(y):
+            return numpy.arange(len(y))
+        order = numpy.random.RandomState(self._random_state).permutation(len(y))
+        # interleave classes, so every prefix of order is stratified
+        rank = numpy.empty(len(y))
+        for label in numpy.unique(y):
+            members = order[y[order] == label]
+            rank[members] = numpy.arange(len(members)) / len(members)
+        return numpy.sort(order[numpy.argsort(rank[order], kind='stable')][:n_samples])
+
+    def _halving(self, X: numpy.ndarray, y: numpy.ndarray, candidates: Sequence[Mapping]) -> Sequence[float]:
+        n_rounds = max(1, math.ceil(math.log(len(candidates), self._factor))) if len(candidates) > 1 else 1
+        n_classes = len(numpy.unique(y))
+        min_samples = max(len(y) // self._factor ** (n_rounds - 1), 2 * self._cv * n_classes)
+
+        remaining = list(range(len(candidates)))
+        scores = [numpy.nan] * len(candidates)
+        for iteration in range(n_rounds):
+            indices = self._subset(y, min_samples * self._factor ** iteration
+                                   if iteration < n_rounds - 1 else len(y))
+            round_scores = self._evaluate(X, y, indices, [candidates[i] for i in remaining])
+            evaluated = [(score, i) for score, i in zip(round_scores, remaining) if not numpy.isnan(score)]
+            if not evaluated:
+                break
+            for score, i in evaluated:
+                scores[i] = score
+            evaluated.sort(key=lambda pair: -pair[0])
+            remaining = [i for score, i in evaluated[:max(1, math.ceil(len(evaluated) / self._factor))]]
+            if len(remaining) == 1:
+                break
+
+        # only survivors of last round compete, earlier scores were measured on fewer samples
+        return [scores[i] if i in remaining else numpy.nan for i in range(len(candidates))]
+
+    def fit(self, X: Any, y: Any):
+        X = numpy.asarray(X, dtype=numpy.float64)
+        y = numpy.asarray(y)
+
+        candidates = self._candidates()
+        self._deadline = None if self._max_time is None else time.monotonic() + self._max_time
+        self._kernels.clear()
+        self._folds.clear()
+        self.n_fits_ = 0
+
+        # kernel matrices and refit run in this process while workers are idle, so they use whole budget
+        with concurrency.limit_threads(concurrency.cpu_budget(self._n_jobs)):
+            if self._search == 'halving':
+                scores = self._halving(X, y, candidates)
+            else:
+                scores = self._evaluate(X, y, numpy.arange(len(y)), candidates)
+            self._kernels.clear()
+
+        if all(numpy.isnan(score) for score in scores):
+            # budget is smaller than one candidate, fall back to first one
+            best = 0
+        else:
+            best = int(numpy.nanargmax(scores))
+
+        self.best_params_ = candidates[best]
+        self.best_score_ = scores[best]
+        with concurrency.limit_threads(concurrency.cpu_budget(self._n_jobs)):
+            self.best_estimator_ = clone(self._estimator).set_params(**self.best_params_).fit(X, y)
+
+        _logger.info('Search %s evaluated %d fits, best parameters %s with score %s.' % (
+            self._search, self.n_fits_, self.best_params_, self.best_score_))
+        return self
 
 
 # Supervised Estimator
-def _BestEstimatorFactory(X: Any, y: Any, estimator: EstimatorMixin = SVC(), **kwargs) -> PredictStrategy:
-    """ Be sure that y argument can be encoded and take note that it will be output of estimator """
+def _BestEstimatorFactory(X: Any, y: Any, estimator: EstimatorMixin = SVC(),
+                          param_grid: Union[Mapping, Sequence[Mapping]] = None, search: str = 'grid',
+                          max_fits: int = None, max_time: float = None, n_jobs: int = -1,
+                          **kwargs) -> PredictStrategy:
+    """ Be sure that y argument can be encoded and take note that it will be output of estimator
+
+    Parameter grid is param_grid (mapping or sequence of mappings for conditional grids) or remaining kwargs.
+    See _CandidateSearch for search, max_fits and max_time.
+    """
     encoder = _ObjectEncoder()
     encoder.fit(y)
     encoded_y = encoder.transform(y)
 
-    grid_search = GridSearchCV(estimator=estimator, param_grid=kwargs, n_jobs=-1)
-    grid_search.fit(X, encoded_y)
+    search = _CandidateSearch(estimator, kwargs if param_grid is None else param_grid, search=search,
+                              max_fits=max_fits, max_time=max_time, n_jobs=n_jobs)
+    search.fit(X, encoded_y)
 
-    return _Estimator(grid_search.best_estimator_, encoder)
+    return _Estimator(search.best_estimator_, encoder)
 
 
 SVMClassifier = partial(
     _BestEstimatorFactory,
     estimator=SVC(),
-    kernel=['sigmoid', 'rbf', 'poly', 'linear'],
-    C=list(range(1, 100, 10)),
-    degree=list(range(3, 10))
+    # degree is used only by poly kernel
+    param_grid=[
+        {'kernel': ['poly'], 'C': list(range(1, 100, 10)), 'degree': list(range(3, 10))},
+        {'kernel': ['sigmoid', 'rbf', 'linear'], 'C': list(range(1, 100, 10))}
+    ]
 )
 
 TreeClassifier = partial(
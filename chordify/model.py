@@ -0,0 +1,437 @@
+""" Versioned model format and NumPy predictors for learned strategies
+
+Model file starts with magic bytes, format version and JSON header, followed by raw arrays aligned to 64 bytes.
+Arrays can be loaded with numpy memory mapping, so processes which load same model share one physical copy.
+Class labels are stored as chord strings. Nothing is pickled and scikit-learn is not needed for loading.
+
+Fitted SVC, KNN, decision tree and random forest are compiled into NumPy predictors: kernel SVC keeps support vectors
+with coefficients of all class pairs in one matrix, linear SVC collapses them into weights of pairs, tree is stored
+as flat arrays of nodes and forest stacks flat arrays of its trees.
+"""
+import json
+import os
+import struct
+from abc import abstractmethod, ABC
+from typing import Mapping, Tuple, Any, Sequence
+
+import numpy
+
+from .chord_recognition import _TemplatePredictStrategy
+from .notation import Chord
+
+MAGIC = b'CHORDIFY'
+VERSION = 1
+
+_PREAMBLE = struct.Struct('<II')  # version, header length
+_ALIGNMENT = 64
+
+
+def _align(offset: int) -> int:
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+def write(path: str, kind: str, params: Mapping, arrays: Mapping[str, numpy.ndarray]):
+    """ Write model of kind with JSON serializable params and arrays to path """
+    arrays = {name: numpy.ascontiguousarray(array) for name, array in arrays.items()}
+
+    layout = dict()
+    offset = 0
+    for name, array in arrays.items():
+        if array.dtype.hasobject:
+            raise ValueError('Array %s has object dtype, which cannot be stored.' % name)
+        layout[name] = {'dtype': array.dtype.str, 'shape': array.shape, 'offset': offset}
+        offset = _align(offset + array.nbytes)
+
+    header = json.dumps({'kind': kind, 'params': params, 'arrays': layout}).encode('utf8')
+    data_start = _align(len(MAGIC) + _PREAMBLE.size + len(header))
+
+    with open(path, 'wb') as file:
+        file.write(MAGIC)
+        file.write(_PREAMBLE.pack(VERSION, len(header)))
+        file.write(header)
+        for name, array in arrays.items():
+            file.write(b'\0' * (data_start + layout[name]['offset'] - file.tell()))
+            file.write(array.tobytes())
+
+
+def read(path: str, mmap_mode: str = 'r') -> Tuple[str, dict, Mapping[str, numpy.ndarray]]:
+    """ Read model from path and returns kind, params and arrays, arrays are memory mapped unless mmap_mode is None """
+    with open(path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError('File %s is not chordify model.' % path)
+        version, header_length = _PREAMBLE.unpack(file.read(_PREAMBLE.size))
+        if version != VERSION:
+            raise ValueError('Unsupported model version %d, expected %d.' % (version, VERSION))
+        header = json.loads(file.read(header_length).decode('utf8'))
+        data_start = _align(len(MAGIC) + _PREAMBLE.size + header_length)
+
+        arrays = dict()
+        for name, spec in header['arrays'].items():
+            dtype, shape = numpy.dtype(spec['dtype']), tuple(spec['shape'])
+            offset = data_start + spec['offset']
+            if mmap_mode is None or 0 in shape:
+                file.seek(offset)
+                arrays[name] = numpy.fromfile(file, dtype, int(numpy.prod(shape))).reshape(shape)
+            else:
+                arrays[name] = numpy.memmap(path, dtype, mmap_mode, offset, shape)
+
+    return header['kind'], header['params'], arrays
+
+
+def _labels(strings: numpy.ndarray) -> Sequence[Chord]:
+    return tuple(Chord(str(string)) for string in strings)
+
+
+def _kernel(kernel: str, X: numpy.ndarray, vectors: numpy.ndarray, norms: numpy.ndarray, gamma: float, degree: int,
+            coef0: float) -> numpy.ndarray:
+    if kernel == 'rbf':
+        distances = (X ** 2).sum(axis=1)[:, None] - 2 * X @ vectors.T + norms[None, :]
+        return numpy.exp(-gamma * numpy.maximum(distances, 0))
+    if kernel == 'poly':
+        return (gamma * X @ vectors.T + coef0) ** degree
+    if kernel == 'sigmoid':
+        return numpy.tanh(gamma * X @ vectors.T + coef0)
+    raise ValueError('Unknown kernel %s' % kernel)
+
+
+class _Model:
+    """ Predict strategy evaluated by NumPy, subclasses implement _predict which returns indices of labels """
+
+    KIND = None
+
+    def __init__(self, params: Mapping, arrays: Mapping[str, numpy.ndarray]) -> None:
+        super().__init__()
+
+        self._params = dict(params)
+        self._arrays = arrays
+        self._classes = numpy.asarray(arrays['classes'])
+        self._lookup = numpy.empty(len(arrays['labels']), dtype=object)
+        self._lookup[:] = _labels(arrays['labels'])
+
+    @abstractmethod
+    def _predict(self, X: numpy.ndarray) -> numpy.ndarray:
+        ...
+
+    def predict(self, frame: Any, *args) -> Any:
+        X = numpy.asarray(frame, dtype=numpy.float64).reshape(1, -1)
+        return self._lookup[self._predict(X)[0]]
+
+    def predict_batch(self, frames: Any) -> Any:
+        X = numpy.asarray(frames, dtype=numpy.float64)
+        return tuple(self._lookup[self._predict(X.reshape(len(X), -1))])
+
+    def export(self) -> Tuple[str, dict, Mapping[str, numpy.ndarray]]:
+        return self.KIND, self._params, self._arrays
+
+
+class _OneVsOneModel(_Model, ABC):
+    """ Classifier which votes by decision of every pair of classes """
+
+    def __init__(self, params: Mapping, arrays: Mapping[str, numpy.ndarray]) -> None:
+        super().__init__(params, arrays)
+
+        pairs = numpy.asarray(arrays['pairs'])
+        self._intercept = arrays['intercept']
+        # votes of positive and negative decisions, (n_pairs, n_classes)
+        self._positive = numpy.eye(len(self._classes), dtype=numpy.int64)[pairs[:, 0]]
+        self._negative = numpy.eye(len(self._classes), dtype=numpy.int64)[pairs[:, 1]]
+
+    @abstractmethod
+    def _decision(self, X: numpy.ndarray) -> numpy.ndarray:
+        """ Decision without intercept, (n_samples, n_pairs) """
+
+    def _predict(self, X: numpy.ndarray) -> numpy.ndarray:
+        positive = (self._decision(X) + self._intercept) > 0
+        votes = positive @ self._positive + ~positive @ self._negative
+        return self._classes[numpy.argmax(votes, axis=1)]
+
+
+class _SVCModel(_OneVsOneModel):
+    """ Support vector classifier, decision is kernel matrix times coefficients of all pairs """
+
+    KIND = 'svc'
+
+    def __init__(self, params: Mapping, arrays: Mapping[str, numpy.ndarray]) -> None:
+        super().__init__(params, arrays)
+
+        self._kernel_params = (params['kernel'], params['gamma'], params['degree'], params['coef0'])
+        self._support_vectors = arrays['support_vectors']
+        self._norms = arrays['norms']
+        self._coef = arrays['coef']
+
+    def _decision(self, X: numpy.ndarray) -> numpy.ndarray:
+        kernel, gamma, degree, coef0 = self._kernel_params
+        return _kernel(kernel, X, self._support_vectors, self._norms, gamma, degree, coef0) @ self._coef
+
+
+class _LinearSVCModel(_OneVsOneModel):
+    """ Support vector classifier with linear kernel, support vectors are collapsed into weights of pairs """
+
+    KIND = 'linear_svc'
+
+    def __init__(self, params: Mapping, arrays: Mapping[str, numpy.ndarray]) -> None:
+        super().__init__(params, arrays)
+
+        self._weights = arrays['weights']
+
+    def _decision(self, X: numpy.ndarray) -> numpy.ndarray:
+        return X @ self._weights
+
+
+class _KNNModel(_Model):
+    """ K nearest neighbors by euclidean distance """
+
+    KIND = 'knn'
+
+    def __init__(self, params: Mapping, arrays: Mapping[str, numpy.ndarray]) -> None:
+        super().__init__(params, arrays)
+
+        self._n_neighbors = params['n_neighbors']
+        self._weights = params['weights']
+        self._fit_X = arrays['fit_X']
+        self._norms = arrays['norms']
+        self._fit_y = arrays['fit_y']
+
+    def _predict(self, X: numpy.ndarray) -> numpy.ndarray:
+        distances = numpy.maximum((X ** 2).sum(axis=1)[:, None] - 2 * X @ self._fit_X.T + self._norms[None, :], 0)
+        k = min(self._n_neighbors, distances.shape[1])
+        neighbors = numpy.argpartition(distances, k - 1, axis=1)[:, :k]
+
+        if self._weights == 'distance':
+            distances = numpy.sqrt(numpy.take_along_axis(distances, neighbors, axis=1))
+            exact = distances == 0
+            with numpy.errstate(divide='ignore'):
+                weights = numpy.where(exact.any(axis=1)[:, None], exact, 1 / distances)
+        else:
+            weights = numpy.ones(neighbors.shape)
+
+        votes = numpy.zeros((len(X), len(self._classes)))
+        numpy.add.at(votes, (numpy.arange(len(X))[:, None], self._fit_y[neighbors]), weights)
+        return self._classes[numpy.argmax(votes, axis=1)]
+
+
+class _TreeModel(_Model):
+    """ Decision tree stored as flat arrays of nodes """
+
+    KIND = 'tree'
+
+    def __init__(self, params: Mapping, arrays: Mapping[str, numpy.ndarray]) -> None:
+        super().__init__(params, arrays)
+
+        self._depth = params['depth']
+        self._left = arrays['left']
+        self._right = arrays['right']
+        self._feature = arrays['feature']
+        self._threshold = arrays['threshold']
+        self._leaf_class = arrays['leaf_class']
+
+    def _predict(self, X: numpy.ndarray) -> numpy.ndarray:
+        # trees are fitted on float32 features
+        X = X.astype(numpy.float32)
+        rows = numpy.arange(len(X))
+        node = numpy.zeros(len(X), dtype=numpy.int64)
+        for _ in range(self._depth):
+            left = self._left[node]
+            leaf = left == -1
+            go_left = X[rows, numpy.where(leaf, 0, self._feature[node])] <= self._threshold[node]
+            node = numpy.where(leaf, node, numpy.where(go_left, left, self._right[node]))
+        return self._classes[self._leaf_class[node]]
+
+
+class _ForestModel(_Model):
+    """ Random forest, nodes of all trees are stored in flat arrays and class probabilities of trees are averaged """
+
+    KIND = 'forest'
+
+    def __init__(self, params: Mapping, arrays: Mapping[str, numpy.ndarray]) -> None:
+        super().__init__(params, arrays)
+
+        self._depth = params['depth']
+        self._roots = numpy.asarray(arrays['roots'])
+        self._threshold = arrays['threshold']
+        self._probability = arrays['probability']
+        # leaves point to themselves, so samples which reached leaf stay there until deepest leaf is reached
+        leaf = numpy.asarray(arrays['left']) == -1
+        nodes = numpy.arange(len(leaf))
+        self._left = numpy.where(leaf, nodes, arrays['left'])
+        self._right = numpy.where(leaf, nodes, arrays['right'])
+        self._feature = numpy.where(leaf, 0, arrays['feature'])
+
+    def _predict(self, X: numpy.ndarray) -> numpy.ndarray:
+        # trees are fitted on float32 features, all trees descend at once, (n_samples, n_trees)
+        X = X.astype(numpy.float32)
+        rows = numpy.arange(len(X))[:, None]
+        node = numpy.repeat(self._roots[None, :], len(X), axis=0)
+        for _ in range(self._depth):
+            go_left = X[rows, self._feature[node]] <= self._threshold[node]
+            node = numpy.where(go_left, self._left[node], self._right[node])
+
+        # probabilities are summed in order of trees as scikit-learn does, so ties are broken the same way
+        probability = numpy.zeros((len(X), self._probability.shape[1]))
+        for tree in range(node.shape[1]):
+            probability += self._probability[node[:, tree]]
+        probability /= node.shape[1]
+        return self._classes[numpy.argmax(probability, axis=1)]
+
+
+def _template_model(params: Mapping, arrays: Mapping[str, numpy.ndarray]) -> _TemplatePredictStrategy:
+    return _TemplatePredictStrategy(_labels(arrays['labels']))
+
+
+_MODELS = {
+    _SVCModel.KIND: _SVCModel,
+    _LinearSVCModel.KIND: _LinearSVCModel,
+    _KNNModel.KIND: _KNNModel,
+    _TreeModel.KIND: _TreeModel,
+    _ForestModel.KIND: _ForestModel,
+    'templates': _template_model
+}
+
+
+def _export_svc(estimator, labels: numpy.ndarray) -> Tuple[str, dict, Mapping[str, numpy.ndarray]]:
+    """ Export fitted scikit-learn SVC """
+    dual_coef = numpy.asarray(estimator.dual_coef_, dtype=numpy.float64)
+    intercept = numpy.asarray(estimator.intercept_, dtype=numpy.float64)
+    if len(estimator.classes_) == 2:
+        # scikit-learn flips sign of binary problems
+        dual_coef, intercept = -dual_coef, -intercept
+
+    kernel = estimator.kernel
+    if kernel not in ('linear', 'rbf', 'poly', 'sigmoid'):
+        raise NotImplementedError('Kernel %s cannot be exported.' % kernel)
+
+    # coefficients of support vectors for every pair of classes, (n_support_vectors, n_pairs)
+    n_classes = len(estimator.classes_)
+    starts = numpy.concatenate(([0], numpy.cumsum(estimator.n_support_)))
+    pairs = numpy.asarray([(i, j) for i in range(n_classes) for j in range(i + 1, n_classes)], dtype=numpy.int64)
+    coef = numpy.zeros((len(estimator.support_vectors_), len(pairs)))
+    for pair, (i, j) in enumerate(pairs):
+        coef[starts[i]:starts[i + 1], pair] = dual_coef[j - 1, starts[i]:starts[i + 1]]
+        coef[starts[j]:starts[j + 1], pair] = dual_coef[i, starts[j]:starts[j + 1]]
+
+    support_vectors = numpy.asarray(estimator.support_vectors_, dtype=numpy.float64)
+    arrays = {
+        'intercept': intercept,
+        'pairs': pairs,
+        'classes': numpy.asarray(estimator.classes_, dtype=numpy.int64),
+        'labels': labels
+    }
+
+    if kernel == 'linear':
+        return _LinearSVCModel.KIND, {}, dict(arrays, weights=support_vectors.T @ coef)
+
+    return _SVCModel.KIND, {
+        'kernel': kernel,
+        'gamma': float(estimator._gamma),
+        'degree': int(estimator.degree),
+        'coef0': float(estimator.coef0)
+    }, dict(arrays, support_vectors=support_vectors, norms=(support_vectors ** 2).sum(axis=1), coef=coef)
+
+
+def _export_knn(estimator, labels: numpy.ndarray) -> Tuple[str, dict, Mapping[str, numpy.ndarray]]:
+    """ Export fitted scikit-learn KNeighborsClassifier """
+    euclidean = estimator.metric == 'euclidean' or (estimator.metric == 'minkowski' and estimator.p == 2)
+    if not euclidean or estimator.weights not in ('uniform', 'distance'):
+        raise NotImplementedError('Only euclidean metric with uniform or distance weights can be exported.')
+
+    fit_X = numpy.asarray(estimator._fit_X, dtype=numpy.float64)
+    return _KNNModel.KIND, {
+        'n_neighbors': int(estimator.n_neighbors),
+        'weights': estimator.weights
+    }, {
+        'fit_X': fit_X,
+        'norms': (fit_X ** 2).sum(axis=1),
+        'fit_y': numpy.asarray(estimator._y, dtype=numpy.int64),
+        'classes': numpy.asarray(estimator.classes_, dtype=numpy.int64),
+        'labels': labels
+    }
+
+
+def _export_tree(estimator, labels: numpy.ndarray) -> Tuple[str, dict, Mapping[str, numpy.ndarray]]:
+    """ Export fitted scikit-learn DecisionTreeClassifier """
+    tree = estimator.tree_
+    return _TreeModel.KIND, {
+        'depth': int(tree.max_depth)
+    }, {
+        'left': numpy.asarray(tree.children_left, dtype=numpy.int64),
+        'right': numpy.asarray(tree.children_right, dtype=numpy.int64),
+        'feature': numpy.asarray(tree.feature, dtype=numpy.int64),
+        'threshold': numpy.asarray(tree.threshold, dtype=numpy.float64),
+        'leaf_class': numpy.argmax(tree.value[:, 0, :], axis=1).astype(numpy.int64),
+        'classes': numpy.asarray(estimator.classes_, dtype=numpy.int64),
+        'labels': labels
+    }
+
+
+def _export_forest(estimator, labels: numpy.ndarray) -> Tuple[str, dict, Mapping[str, numpy.ndarray]]:
+    """ Export fitted scikit-learn RandomForestClassifier, child indices of every tree are offset by its first
+    node """
+    trees = [tree.tree_ for tree in estimator.estimators_]
+    roots = numpy.concatenate(([0], numpy.cumsum([tree.node_count for tree in trees])[:-1])).astype(numpy.int64)
+
+    def children(children, root):
+        children = numpy.asarray(children, dtype=numpy.int64)
+        return numpy.where(children == -1, -1, children + root)
+
+    # leaf probabilities as DecisionTreeClassifier.predict_proba computes them
+    values = numpy.concatenate([tree.value[:, 0, :] for tree in trees]).astype(numpy.float64)
+    totals = values.sum(axis=1, keepdims=True)
+    return _ForestModel.KIND, {
+        'depth': int(max(tree.max_depth for tree in trees))
+    }, {
+        'roots': roots,
+        'left': numpy.concatenate([children(tree.children_left, root) for tree, root in zip(trees, roots)]),
+        'right': numpy.concatenate([children(tree.children_right, root) for tree, root in zip(trees, roots)]),
+        'feature': numpy.concatenate([tree.feature for tree in trees]).astype(numpy.int64),
+        'threshold': numpy.concatenate([tree.threshold for tree in trees]).astype(numpy.float64),
+        'probability': values / numpy.where(totals == 0, 1, totals),
+        'classes': numpy.asarray(estimator.classes_, dtype=numpy.int64),
+        'labels': labels
+    }
+
+
+def export_estimator(estimator, labels: numpy.ndarray) -> Tuple[str, dict, Mapping[str, numpy.ndarray]]:
+    """ Returns kind, params and arrays of fitted scikit-learn estimator, whose classes are indices of labels """
+    # scikit-learn is needed only to export, so it is not imported by loading
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.neighbors import KNeighborsClassifier
+    from sklearn.svm import SVC
+    from sklearn.tree import DecisionTreeClassifier
+
+    for estimator_class, export_function in ((SVC, _export_svc), (KNeighborsClassifier, _export_knn),
+                                             (DecisionTreeClassifier, _export_tree),
+                                             (RandomForestClassifier, _export_forest)):
+        if isinstance(estimator, estimator_class):
+            return export_function(estimator, labels)
+    raise NotImplementedError('Estimator %s cannot be exported.' % estimator.__class__.__name__)
+
+
+def export(strategy) -> Tuple[str, dict, Mapping[str, numpy.ndarray]]:
+    """ Returns kind, params and arrays of predict strategy """
+    if hasattr(strategy, 'export'):
+        return strategy.export()
+    if hasattr(strategy, 'templates'):
+        return 'templates', {}, {'labels': numpy.asarray([str(template) for template in strategy.templates])}
+    raise NotImplementedError('Strategy %s cannot be exported.' % strategy.__class__.__name__)
+
+
+def compile_strategy(strategy):
+    """ Compile predict strategy into NumPy predictor, which does not need scikit-learn """
+    kind, params, arrays = export(strategy)
+    return _MODELS[kind](params, arrays)
+
+
+def save(path: str, strategy):
+    """ Save predict strategy to path """
+    write(path, *export(strategy))
+
+
+def load(path: str, mmap_mode: str = 'r'):
+    """ Load predict strategy from path """
+    if not os.path.isfile(path):
+        raise FileNotFoundError('Model %s does not exist.' % path)
+
+    kind, params, arrays = read(path, mmap_mode)
+    if kind not in _MODELS:
+        raise ValueError('Unknown model kind %s.' % kind)
+    return _MODELS[kind](params, arrays)
@@ -0,0 +1,197 @@
+""" Push based online chord recognition
+
+Audio blocks of any size are pushed into recognizer, which returns chord changes as soon as they are known.
+Samples are pushed into incremental CQT of extraction strategy, which resamples every octave once and transforms
+frame once lookahead of half of longest filter is available, so every sample is resampled and every frame transformed
+only once. Silence gate does not apply. Chroma is smoothed by causal exponential moving average and change of chord
+is reported when new chord wins for hold time, so every change is reported at most lookahead + block + hold after its
+audio arrived.
+
+Usage: python -m chordify.online FILE.wav [--block SECONDS] latency benchmark, file is pushed in real time sized blocks
+"""
+import argparse
+import math
+import sys
+import time
+from collections import ChainMap
+from typing import List, Tuple, Sequence
+
+import numpy
+
+from ._lazy import lazy_import
+from .app import default_config
+from .audio_processing import _CQTExtractionStrategy, ChromaStrategy, CQTExtractionStrategyFactory
+from .chord_recognition import PredictStrategy, _ChordRecognizerFactory, predict_frames
+
+signal = lazy_import('scipy.signal')
+
+
+class _OnlineRecognizer:
+
+    def __init__(self, extraction_strategy: _CQTExtractionStrategy, chroma_strategy: ChromaStrategy,
+                 predict_strategy: PredictStrategy, sampling_frequency: int, hop_length: int, block: float,
+                 smoothing: float, hold: float, no_chord: bool = False) -> None:
+        super().__init__()
+
+        if not chroma_strategy.frame_local:
+            raise ValueError("Chroma strategy of online recognition must be frame local.")
+
+        self.extraction_strategy = extraction_strategy
+        self.chroma_strategy = chroma_strategy
+        self.predict_strategy = predict_strategy
+        self.no_chord = no_chord
+        self._sr = sampling_frequency
+        self._hop_length = hop_length
+        # lookahead of filter bank of stream varies slightly with tuning, stream updates it once tuning is resolved
+        self._lookahead = extraction_strategy.stream(0.).lookahead
+        self._block_frames = max(1, int(round(block * sampling_frequency / hop_length)))
+        self._hold_frames = max(1, int(round(hold * sampling_frequency / hop_length)))
+        self._decay = math.exp(-hop_length / (sampling_frequency * smoothing)) if smoothing > 0 else 0.
+        self.reset()
+
+    @property
+    def latency(self) -> float:
+        """ Upper bound of seconds between arrival of audio and report of chord change, without processing time """
+        return (self._lookahead + (self._block_frames + self._hold_frames) * self._hop_length) / self._sr
+
+    def reset(self):
+        self._buffer = numpy.zeros(0, dtype=numpy.float32)  # samples not pushed into stream yet
+        self._stream = None
+        self._pending = numpy.zeros((self.extraction_strategy._n_bins, 0), dtype=numpy.float32)
+        self._next_frame = 0
+        self._smoothed = None
+        self._chord = None
+        self._candidate = None
+        self._candidate_frame = 0
+        self._candidate_count = 0
+
+    def _smooth(self, chroma: numpy.ndarray) -> numpy.ndarray:
+        if self._smoothed is None:
+            self._smoothed = chroma[:, 0]
+        smoothed, _ = signal.lfilter([1. - self._decay], [1., -self._decay], chroma, axis=1,
+                                     zi=(self._decay * self._smoothed)[:, None])
+        self._smoothed = smoothed[:, -1]
+        return smoothed
+
+    def _changes(self, chords: Sequence[object]) -> List[Tuple[float, object]]:
+        changes = list()
+        for frame, chord in enumerate(chords, self._next_frame):
+            label = str(chord)
+            if label == str(self._chord):
+                self._candidate = None
+                continue
+            if self._candidate is not None and label == str(self._candidate):
+                self._candidate_count += 1
+            else:
+                self._candidate, self._candidate_frame, self._candidate_count = chord, frame, 1
+            if self._candidate_count >= self._hold_frames:
+                self._chord = self._candidate
+                self._candidate = None
+                changes.append((self._candidate_frame * self._hop_length / self._sr, self._chord))
+        return changes
+
+    def _process(self, bins: numpy.ndarray) -> List[Tuple[float, object]]:
+        """ Chord changes of bins of next frames """
+        chroma = self.chroma_strategy.run(bins)
+        smoothed = self._smooth(chroma)
+        if self.no_chord:
+            # silent frames stay no chord after smoothing
+            smoothed[:, ~chroma.any(axis=0)] = 0
+        changes = self._changes(predict_frames(self.predict_strategy, smoothed.T, no_chord=self.no_chord))
+        self._next_frame += bins.shape[1]
+        return changes
+
+    def _extract(self, samples: numpy.ndarray, final: bool):
+        """ Pushes buffered samples into stream once they complete block of pending frames, as frames are processed
+        a block at a time and resampling is slow for small pushes. Stream starts once first block and its lookahead
+        are buffered. """
+        self._buffer = numpy.concatenate((self._buffer, samples))
+        missing = (self._block_frames - self._pending.shape[1]) * self._hop_length
+        if not final and len(self._buffer) < missing + (self._lookahead if self._stream is None else 0):
+            return
+        if self._stream is None:
+            # tuning of stream is resolved from its first block
+            self._stream = self.extraction_strategy.stream(self.extraction_strategy.tuning(self._buffer))
+            self._lookahead = self._stream.lookahead
+        samples, self._buffer = self._buffer, self._buffer[:0]
+        self._pending = numpy.concatenate((self._pending, self._stream.push(samples, final)), axis=1)
+
+    def push(self, samples: numpy.ndarray) -> List[Tuple[float, object]]:
+        """ Appends samples and returns chord changes as start times and chords """
+        self._extract(numpy.asarray(samples, dtype=numpy.float32).reshape(-1), False)
+
+        changes = list()
+        while self._pending.shape[1] >= self._block_frames:
+            bins, self._pending = self._pending[:, :self._block_frames], self._pending[:, self._block_frames:]
+            changes.extend(self._process(bins))
+        return changes
+
+    def flush(self) -> List[Tuple[float, object]]:
+        """ Computes remaining frames at end of stream and returns chord changes """
+        if self._stream is None and not len(self._buffer):
+            return list()
+        self._extract(numpy.zeros(0, dtype=numpy.float32), True)
+        bins, self._pending = self._pending, self._pending[:, :0]
+        return self._process(bins) if bins.shape[1] else list()
+
+
+def OnlineRecognizerFactory(config: dict = None) -> _OnlineRecognizer:
+    """ Online recognizer of CQT extraction, chroma and predict strategy of config """
+    config = dict(ChainMap(config or {}, default_config))
+    recognizer = _ChordRecognizerFactory(config)
+    return _OnlineRecognizer(CQTExtractionStrategyFactory(config),
+                             config['CHROMA_STRATEGY_FACTORY'](config),
+                             recognizer.strategy,
+                             config['SAMPLING_FREQUENCY'],
+                             config['HOP_LENGTH'],
+                             config['ONLINE_BLOCK'],
+                             config['ONLINE_SMOOTHING'],
+                             config['ONLINE_HOLD'],
+                             recognizer.no_chord)
+
+
+def benchmark(y: numpy.ndarray, recognizer: _OnlineRecognizer, sampling_frequency: int, block: float) -> dict:
+    """ Pushes y in blocks of block seconds as if they arrived in real time. Delay of change is time between arrival
+    of its first audio and its report, processing which falls behind real time delays following blocks. """
+    block_samples = max(1, int(block * sampling_frequency))
+    clock, delays, processing = 0., list(), list()
+    for start in range(0, len(y), block_samples):
+        samples = y[start:start + block_samples]
+        begin = time.perf_counter()
+        changes = recognizer.push(samples)
+        processing.append(time.perf_counter() - begin)
+        # block is available when its last sample arrives
+        clock = max(clock, (start + len(samples)) / sampling_frequency) + processing[-1]
+        delays.extend(clock - change_time for change_time, _ in changes)
+
+    return {
+        'changes': len(delays),
+        'delay_p50': float(numpy.percentile(delays, 50)) if delays else None,
+        'delay_p99': float(numpy.percentile(delays, 99)) if delays else None,
+        'processing_p50': float(numpy.percentile(processing, 50)),
+        'processing_p99': float(numpy.percentile(processing, 99)),
+        'real_time_factor': sum(processing) / (len(y) / sampling_frequency),
+        'latency_bound': recognizer.latency
+    }
+
+
+def main(argv: Sequence[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Latency benchmark of online chord recognition')
+    parser.add_argument('file', help='audio file')
+    parser.add_argument('--block', type=float, default=0.02, help='seconds of audio pushed at once')
+    args = parser.parse_args(argv)
+
+    config = dict(default_config)
+    recognizer = OnlineRecognizerFactory(config)
+    y, _ = lazy_import('librosa').load(args.file, sr=config['SAMPLING_FREQUENCY'])
+    # first push initializes extraction
+    recognizer.push(y[:config['SAMPLING_FREQUENCY']])
+    recognizer.reset()
+
+    for name, value in benchmark(y, recognizer, config['SAMPLING_FREQUENCY'], args.block).items():
+        print('%-16s %s' % (name, '%.4f' % value if isinstance(value, float) else value))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+""" Accuracy versus speed sweep of pipeline parameters
+
+Usage: python -m chordify.sweep CORPUS_DIR [--grid GRID.json] [--target ACCURACY] [--output RESULTS.json]
+
+Corpus directory contains audio files with reference .lab files of same name. Every configuration of grid transcribes
+whole corpus, its accuracy is majmin chord symbol recall of chordify.evaluation over whole corpus, and its runtime
+excludes decoding of audio, which is shared by all configurations.
+Report lists Pareto frontier, configurations for which no other configuration is both faster and more accurate.
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from collections import ChainMap
+from itertools import product
+from typing import Mapping, Sequence, Tuple, NamedTuple, List, Any, Iterable
+
+import numpy
+
+from . import audio_processing, evaluation
+from .app import TranscriptBuilder, default_config
+from .audio_processing import LoadStrategy, _load_strategy_factory
+from .format import get_formatter, to_segments
+
+_AUDIO_EXTENSIONS = ('.wav', '.flac', '.ogg', '.mp3')
+_C1 = 32.70319566257483
+
+DEFAULT_GRID = {
+    'HOP_LENGTH': (512, 1024, 2048),
+    'BINS_PER_OCTAVE': (12, 24, 36),
+    'MIN_FREQ': (_C1, 2 * _C1),
+    'CHROMA_STRATEGY_FACTORY': ('DefaultChromaStrategyFactory', 'SmoothingChromaStrategyFactory'),
+    'SEGMENTATION_STRATEGY_FACTORY': ('DefaultSegmentationStrategyFactory', 'BeatSegmentationStrategyFactory',
+                                      'HCDFSegmentationStrategyFactory')
+}
+
+
+class Result(NamedTuple):
+    params: Mapping[str, Any]
+    accuracy: float
+    seconds: float
+
+
+class _CachedLoadStrategy(LoadStrategy):
+    """ Audio is decoded once for all configurations of sweep """
+
+    def __init__(self, cache: dict, sampling_frequency: int) -> None:
+        super().__init__()
+        self._cache = cache
+        self._sr = sampling_frequency
+
+    def run(self, absolute_path: str) -> numpy.ndarray:
+        key = (absolute_path, self._sr)
+        if key not in self._cache:
+            self._cache[key] = audio_processing.librosa.load(absolute_path, sr=self._sr)[0]
+        return self._cache[key]
+
+
+def corpus(directory: str) -> List[Tuple[str, str]]:
+    """ Audio files of directory with their reference .lab files """
+    pairs = list()
+    for name in sorted(os.listdir(directory)):
+        stem, extension = os.path.splitext(name)
+        if extension.lower() in _AUDIO_EXTENSIONS and os.path.exists(os.path.join(directory, stem + '.lab')):
+            pairs.append((os.path.join(directory, name), os.path.join(directory, stem + '.lab')))
+    return pairs
+
+
+def configurations(grid: Mapping[str, Sequence]) -> Iterable[dict]:
+    """ Every combination of grid values. N_OCTAVES and N_BINS follow MIN_FREQ and BINS_PER_OCTAVE, so highest
+    frequency stays as in default config. """
+    names = tuple(grid)
+    for values in product(*(grid[name] for name in names)):
+        params = dict(zip(names, values))
+        config = ChainMap(params, default_config)
+        n_octaves = default_config['N_OCTAVES'] - int(round(math.log2(config['MIN_FREQ'] / default_config['MIN_FREQ'])))
+        params.setdefault('N_OCTAVES', n_octaves)
+        params.setdefault('N_BINS', config['BINS_PER_OCTAVE'] * params['N_OCTAVES'])
+        yield params
+
+
+def _config(params: Mapping[str, Any], cache: dict) -> dict:
+    """ Resolves strategy factory names of params into factories of audio processing module """
+    config = {name: getattr(audio_processing, value) if name.endswith('_FACTORY') and isinstance(value, str) else value
+              for name, value in params.items()}
+    config['LOAD_STRATEGY_FACTORY'] = _load_strategy_factory(
+        lambda c: _CachedLoadStrategy(cache, c['SAMPLING_FREQUENCY']))
+    return config
+
+
+def evaluate(params: Mapping[str, Any], pairs: Sequence[Tuple[str, str]], cache: dict = None) -> Result:
+    """ Transcribes corpus with configuration and returns its accuracy and runtime """
+    cache = dict() if cache is None else cache
+    config = _config(params, cache)
+    transcript = TranscriptBuilder(config).build()
+
+    # decode audio before timing
+    for audio_path, _ in pairs:
+        _CachedLoadStrategy(cache, ChainMap(config, default_config)['SAMPLING_FREQUENCY']).run(audio_path)
+
+    seconds, scores = 0., list()
+    for audio_path, lab_path in pairs:
+        begin = time.perf_counter()
+        chord_sequence = transcript.from_audio(audio_path)
+        seconds += time.perf_counter() - begin
+
+        with open(lab_path) as file:
+            reference = get_formatter(lab_path).load_arrays(file)
+        segments = tuple(to_segments(chord_sequence))
+        predicted = (numpy.array([s[0] for s in segments]), numpy.array([s[1] for s in segments]),
+                     [s[2] for s in segments])
+        scores.append(evaluation.compare(reference, predicted))
+
+    return Result(dict(params), evaluation.total(scores).recall()['majmin'], seconds)
+
+
+def sweep(pairs: Sequence[Tuple[str, str]], grid: Mapping[str, Sequence] = None) -> List[Result]:
+    """ Evaluates every configuration of grid on corpus """
+    cache = dict()
+    return [evaluate(params, pairs, cache) for params in configurations(DEFAULT_GRID if grid is None else grid)]
+
+
+def pareto_frontier(results: Iterable[Result]) -> List[Result]:
+    """ Results which are not dominated by faster and at least as accurate result, ordered by runtime """
+    frontier = list()
+    for result in sorted(results, key=lambda r: (r.seconds, -r.accuracy)):
+        if not frontier or result.accuracy > frontier[-1].accuracy:
+            frontier.append(result)
+    return frontier
+
+
+def cheapest(results: Iterable[Result], target: float) -> Result:
+    """ Fastest result with accuracy of at least target or None """
+    return next((result for result in pareto_frontier(results) if result.accuracy >= target), None)
+
+
+def main(argv: Sequence[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Accuracy versus speed sweep of pipeline parameters')
+    parser.add_argument('corpus', help='directory of audio files and reference .lab files')
+    parser.add_argument('--grid', help='JSON file with lists of values of config keys')
+    parser.add_argument('--target', type=float, help='accuracy which cheapest configuration must reach')
+    parser.add_argument('--output', help='JSON file with results of all configurations')
+    args = parser.parse_args(argv)
+
+    pairs = corpus(args.corpus)
+    if not pairs:
+        print('No audio files with reference .lab files in %s' % args.corpus)
+        return 1
+
+    grid = None
+    if args.grid is not None:
+        with open(args.grid) as file:
+            grid = json.load(file)
+
+    results = sweep(pairs, grid)
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump([result._asdict() for result in results], file, indent=2)
+
+    print('Pareto frontier of %d configurations on %d files:' % (len(results), len(pairs)))
+    for result in pareto_frontier(results):
+        print('  %.4f %9.3f s  %s' % (result.accuracy, result.seconds, json.dumps(result.params)))
+
+    if args.target is not None:
+        result = cheapest(results, args.target)
+        if result is None:
+            print('No configuration reaches accuracy %.4f' % args.target)
+            return 1
+        print('Cheapest configuration with accuracy %.4f: %s' % (args.target, json.dumps(result.params)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
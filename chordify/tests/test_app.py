@@ -1,4 +1,6 @@
 import os
+import subprocess
+import sys
 import tempfile
 import unittest
 from itertools import chain, cycle
@@ -169,5 +171,16 @@ class TestLearnerTranscriptInteraction(unittest.TestCase):
             self.assertIsInstance(row[1], Chord)
 
 
+class TestImports(unittest.TestCase):
+    HEAVY_MODULES = ('sklearn', 'lark', 'joblib', 'numba', 'librosa.core', 'scipy.signal._signaltools')
+
+    def test_lazy_imports(self):
+        code = 'import sys, chordify.app; print(" ".join(m for m in %r if m in sys.modules))' % (self.HEAVY_MODULES,)
+        output = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, universal_newlines=True,
+                                check=True).stdout
+
+        self.assertEqual(output.strip(), '')
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,247 @@
+import unittest
+import unittest.mock
+
+import numpy
+
+from chordify.app import default_config
+from chordify.audio_processing import CQTExtractionStrategyFactory, _AudioProcessingFactory, minimal_sampling, \
+    librosa, _cqt_filter_bank
+
+
+def _chords(sampling_frequency, seconds, *pitches):
+    """ Sine chords of midi pitches, every chord lasts seconds """
+    t = numpy.arange(int(seconds * sampling_frequency)) / sampling_frequency
+    return numpy.concatenate([sum(numpy.sin(2 * numpy.pi * 440. * 2 ** ((p - 69) / 12.) * t) for p in chord)
+                              for chord in pitches]).astype(numpy.float32) / 4
+
+
+class TestCQT(unittest.TestCase):
+    def test_same_as_librosa(self):
+        strategy = CQTExtractionStrategyFactory(default_config)
+        y = _chords(default_config['SAMPLING_FREQUENCY'], 1., (60, 64, 67), (57, 60, 64))
+
+        expected = numpy.abs(librosa.cqt(y, sr=default_config['SAMPLING_FREQUENCY'],
+                                         hop_length=default_config['HOP_LENGTH'],
+                                         fmin=default_config['MIN_FREQ'],
+                                         n_bins=default_config['N_BINS'],
+                                         bins_per_octave=default_config['BINS_PER_OCTAVE']))
+        bins = strategy.run(y)
+
+        self.assertEqual(bins.shape, expected.shape)
+        numpy.testing.assert_allclose(bins, expected, atol=1e-5 * expected.max())
+
+    def test_same_as_librosa_configurations(self):
+        # filter bank is cached from librosa internals, which are checked against public cqt on other resolutions
+        for sr, hop_length, bins_per_octave, n_octaves, tuning in ((22050, 512, 12, 7, 0.), (22050, 1024, 24, 6, 0.),
+                                                                    (44100, 256, 36, 6, 0.), (16000, 512, 48, 5, 0.25),
+                                                                    (22050, 4096, 36, 7, -0.3)):
+            with self.subTest(sr=sr, hop_length=hop_length, bins_per_octave=bins_per_octave):
+                config = dict(default_config, SAMPLING_FREQUENCY=sr, HOP_LENGTH=hop_length, TUNING=tuning,
+                              BINS_PER_OCTAVE=bins_per_octave, N_BINS=bins_per_octave * n_octaves)
+                strategy = CQTExtractionStrategyFactory(config)
+                y = _chords(sr, 1., (60, 64, 67), (57, 60, 64))
+
+                expected = numpy.abs(librosa.cqt(y, sr=sr, hop_length=hop_length, fmin=config['MIN_FREQ'],
+                                                 n_bins=config['N_BINS'], bins_per_octave=bins_per_octave,
+                                                 tuning=tuning))
+                bins, = strategy.run_batch([y])
+
+                self.assertEqual(bins.shape, expected.shape)
+                numpy.testing.assert_allclose(bins, expected, atol=1e-5 * expected.max())
+                numpy.testing.assert_allclose(strategy.run(y), expected, atol=1e-5 * expected.max())
+
+                low, high = slice(0, bins_per_octave), slice(bins_per_octave, None)
+                stream = strategy.stream(tuning)
+                pushed = [stream.push(y[start:start + 5513]) for start in range(0, len(y), 5513)]
+                streamed = numpy.concatenate(pushed + [stream.push(y[:0], final=True)], axis=1)
+                numpy.testing.assert_allclose(streamed[low], expected[low], atol=5e-3 * expected.max())
+                numpy.testing.assert_allclose(streamed[high], expected[high], atol=1e-4 * expected.max())
+
+    def test_batch_same_as_single(self):
+        strategy = CQTExtractionStrategyFactory(default_config)
+        random = numpy.random.RandomState(0)
+        ys = [random.uniform(-0.5, 0.5, length).astype(numpy.float32) for length in (300, 5000, 12345, 22100)]
+
+        for bins, y in zip(strategy.run_batch(ys), ys):
+            numpy.testing.assert_allclose(bins, strategy.run(y), rtol=1e-5, atol=1e-7)
+
+
+class TestTuning(unittest.TestCase):
+    def setUp(self):
+        sr = default_config['SAMPLING_FREQUENCY']
+        # A4 sharp by 0.3 of bin
+        self.y = numpy.sin(2 * numpy.pi * 440. * 2 ** (0.3 / default_config['BINS_PER_OCTAVE']) *
+                           numpy.arange(2 * sr) / sr).astype(numpy.float32)
+
+    def test_fixed(self):
+        strategy = CQTExtractionStrategyFactory(dict(default_config, TUNING=0.25))
+        with unittest.mock.patch.object(strategy, '_estimate_tuning') as estimate:
+            self.assertEqual(strategy.tuning(self.y), 0.25)
+        estimate.assert_not_called()
+
+    def test_excerpt(self):
+        strategy = CQTExtractionStrategyFactory(dict(default_config, TUNING='excerpt', TUNING_EXCERPT=1.))
+        self.assertAlmostEqual(strategy.tuning(self.y), 0.3, delta=0.05)
+
+    def test_cache(self):
+        strategy = CQTExtractionStrategyFactory(dict(default_config, TUNING='cache'))
+        tuning = strategy.tuning(self.y)
+        with unittest.mock.patch.object(strategy, '_estimate_tuning') as estimate:
+            self.assertEqual(strategy.tuning(self.y.copy()), tuning)
+            strategy.tuning(self.y[1:])
+        estimate.assert_called_once()
+
+    def test_batch_builds_one_bank(self):
+        strategy = CQTExtractionStrategyFactory(dict(default_config, TUNING='excerpt', TUNING_EXCERPT=1.))
+        sr = default_config['SAMPLING_FREQUENCY']
+        # clips of distinct tunings
+        ys = [numpy.sin(2 * numpy.pi * 440. * 2 ** (detune / default_config['BINS_PER_OCTAVE']) *
+                        numpy.arange(sr) / sr).astype(numpy.float32) for detune in numpy.linspace(-0.3, 0.3, 8)]
+        _cqt_filter_bank.cache_clear()
+
+        strategy.run_batch(ys)
+
+        self.assertEqual(_cqt_filter_bank.cache_info().misses, 1)
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, CQTExtractionStrategyFactory, dict(default_config, TUNING='guess'))
+
+    def test_tuned_bins(self):
+        strategy = CQTExtractionStrategyFactory(default_config)
+        a4 = int(round(default_config['BINS_PER_OCTAVE'] * numpy.log2(440. / default_config['MIN_FREQ'])))
+
+        untuned, tuned = strategy.run(self.y, 0.)[:, 20], strategy.run(self.y, 0.3)[:, 20]
+        self.assertEqual(tuned.argmax(), a4)
+        self.assertGreater(tuned[a4] / tuned[a4 + 1], untuned[a4] / untuned[a4 + 1])
+
+
+class TestBlocks(unittest.TestCase):
+    def test_cqt_blocks_same_as_whole(self):
+        strategy = CQTExtractionStrategyFactory(default_config)
+        y = numpy.random.RandomState(0).uniform(-0.5, 0.5, 10 * default_config['SAMPLING_FREQUENCY'])
+
+        blocks = tuple(strategy.run_blocks(y, first_block=1., max_block=4.))
+        bins = strategy.run(y)
+
+        self.assertEqual(len(blocks), 4)
+        self.assertAlmostEqual(blocks[1][0], blocks[0][1].shape[1] * default_config['HOP_LENGTH'] /
+                               default_config['SAMPLING_FREQUENCY'])
+        numpy.testing.assert_allclose(numpy.concatenate([b for _, b in blocks], axis=1), bins,
+                                      atol=1e-5 * bins.max())
+
+    def test_cqt_windows_same_as_whole(self):
+        strategy = CQTExtractionStrategyFactory(default_config)
+        y = numpy.random.RandomState(0).uniform(-0.5, 0.5, 10 * default_config['SAMPLING_FREQUENCY'])
+        windows = ((0, 5), (100, 130), (140, 150), (420, 431))
+
+        bins = strategy.run(y)
+        for (start, stop), window in zip(windows, strategy.run_windows(y, windows)):
+            numpy.testing.assert_allclose(window, bins[:, start:stop], atol=1e-5 * bins.max())
+
+    def test_cqt_windows_half_margin_low_bins(self):
+        strategy = CQTExtractionStrategyFactory(default_config)
+        y = numpy.random.RandomState(1).uniform(-0.5, 0.5, 10 * default_config['SAMPLING_FREQUENCY'])
+        windows = ((100, 130), (140, 150), (300, 310))
+
+        # lowest octave has longest filters, which reach into neighbouring pieces if margin is below half of them
+        low = slice(0, default_config['BINS_PER_OCTAVE'])
+        bins = strategy.run(y)[low]
+        for (start, stop), window in zip(windows, strategy.run_windows(y, windows, margin=0.5)):
+            numpy.testing.assert_allclose(window[low], bins[:, start:stop], atol=5e-3 * bins.max())
+
+    def test_cqt_stream_same_as_whole(self):
+        strategy = CQTExtractionStrategyFactory(default_config)
+        y = numpy.random.RandomState(2).uniform(-0.5, 0.5, 10 * default_config['SAMPLING_FREQUENCY'])
+
+        # frames reach half of longest filter as run_windows of margin 0.5, which truncates lowest octave most
+        low, high = slice(0, default_config['BINS_PER_OCTAVE']), slice(default_config['BINS_PER_OCTAVE'], None)
+        bins = strategy.run(y)
+        for block in (441, 5513):
+            stream = strategy.stream(0.)
+            pushed = [stream.push(y[start:start + block]) for start in range(0, len(y), block)]
+            streamed = numpy.concatenate(pushed + [stream.push(y[:0], final=True)], axis=1)
+            numpy.testing.assert_allclose(streamed[low], bins[low], atol=5e-3 * bins.max())
+            numpy.testing.assert_allclose(streamed[high], bins[high], atol=1e-4 * bins.max())
+
+    def test_frames_of_run(self):
+        strategy = CQTExtractionStrategyFactory(default_config)
+        y = numpy.random.RandomState(3).uniform(-0.5, 0.5, 5 * default_config['SAMPLING_FREQUENCY'])
+
+        numpy.testing.assert_allclose(strategy.run(y, 0., 100, 130), strategy.run(y, 0.)[:, 100:130], rtol=1e-5)
+
+
+class TestAdaptiveResolution(unittest.TestCase):
+    def test_fine_frames_around_change(self):
+        config = dict(default_config, ADAPTIVE_RESOLUTION=4)
+        y = _chords(config['SAMPLING_FREQUENCY'], 3., (60, 64, 67), (67, 71, 74))
+        processing = _AudioProcessingFactory(config)
+        full = processing.chroma_strategy.run(processing.extraction_strategy.run(y))
+
+        chroma, times = processing.process_samples(y)
+        frames = numpy.round(numpy.asarray(times) * config['SAMPLING_FREQUENCY'] / config['HOP_LENGTH']).astype(int)
+
+        # fine windows see only their own samples
+        self.assertGreaterEqual(processing._margin, 0.5)
+        self.assertTrue(numpy.all(numpy.diff(frames) > 0))
+        self.assertLess(len(frames), full.shape[1] // 2)
+        # change at 3 seconds is in fine resolution
+        change = int(3. * config['SAMPLING_FREQUENCY'] / config['HOP_LENGTH'])
+        self.assertTrue(set(range(change - 2, change + 3)) <= set(frames.tolist()))
+        numpy.testing.assert_array_equal(chroma.argmax(axis=0), full[:, frames].argmax(axis=0))
+
+
+class TestMinimalSampling(unittest.TestCase):
+    def test_frame_times_kept(self):
+        self.assertEqual(minimal_sampling(default_config), (11050, 256))
+        self.assertEqual(minimal_sampling(dict(default_config, SAMPLING_FREQUENCY=44100, HOP_LENGTH=1024)),
+                         (11025, 256))
+        # hop length must stay multiple of 2 ** (octaves - 1)
+        self.assertEqual(minimal_sampling(dict(default_config, HOP_LENGTH=64)), (22100, 64))
+        # highest bin is above Nyquist frequency of half sampling frequency
+        self.assertEqual(minimal_sampling(dict(default_config, N_BINS=36 * 8, N_OCTAVES=8)), (22100, 512))
+
+    def test_same_chroma(self):
+        config = dict(default_config, AUTO_SAMPLING_FREQUENCY=True)
+        y = _chords(config['SAMPLING_FREQUENCY'], 2., (60, 64, 67), (57, 60, 64))
+        full, minimal = _AudioProcessingFactory(default_config), _AudioProcessingFactory(config)
+
+        expected = full.chroma_strategy.run(full.extraction_strategy.run(y))
+        chroma = minimal.chroma_strategy.run(minimal.extraction_strategy.run(
+            librosa.resample(y, orig_sr=config['SAMPLING_FREQUENCY'], target_sr=11050)))
+
+        self.assertEqual(chroma.shape, expected.shape)
+        numpy.testing.assert_array_equal(chroma.argmax(axis=0), expected.argmax(axis=0))
+        numpy.testing.assert_allclose(chroma, expected, atol=0.05)
+
+
+class TestSilenceGate(unittest.TestCase):
+    def test_silent_frames_skipped(self):
+        config = dict(default_config, SILENCE_THRESHOLD=-60.)
+        sr, hop = config['SAMPLING_FREQUENCY'], config['HOP_LENGTH']
+        tone = _chords(sr, 2., (60, 64, 67))
+        y = numpy.concatenate([numpy.zeros(3 * sr, numpy.float32), tone, numpy.zeros(3 * sr, numpy.float32)])
+        gated, strategy = CQTExtractionStrategyFactory(config), CQTExtractionStrategyFactory(default_config)
+
+        windows = gated.sounding(y)
+        self.assertEqual(len(windows), 1)
+        start, stop = windows[0]
+        self.assertLess(abs(start * hop / sr - 3.), 0.05)
+        self.assertLess(abs(stop * hop / sr - 5.), 0.05)
+
+        bins, expected = gated.run(y), strategy.run(y)
+        self.assertEqual(bins.shape, expected.shape)
+        self.assertFalse(bins[:, :start].any() or bins[:, stop:].any())
+        numpy.testing.assert_allclose(bins[:, start:stop], expected[:, start:stop], atol=1e-5 * expected.max())
+
+    def test_short_pause_kept(self):
+        config = dict(default_config, SILENCE_THRESHOLD=-60., SILENCE_MIN_DURATION=0.5)
+        sr = config['SAMPLING_FREQUENCY']
+        tone = _chords(sr, 1., (60, 64, 67))
+        y = numpy.concatenate([tone, numpy.zeros(int(0.2 * sr), numpy.float32), tone])
+
+        self.assertIsNone(CQTExtractionStrategyFactory(config).sounding(y))
+        self.assertIsNone(CQTExtractionStrategyFactory(default_config).sounding(y))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import unittest
+import unittest.mock
+
+import numpy
+
+from chordify.app import _binary_templates
+from chordify.chord_recognition import TemplateBankPredictStrategyFactory, TemplatePredictStrategyFactory, \
+    BatchPredictStrategy, _ChordRecognizer, _MemoizedPredictStrategy, _ChordRecognizerFactory, memoization_report
+from chordify.notation import Chord
+
+
+class TestTemplateBank(unittest.TestCase):
+    def test_transpositions(self):
+        strategy = TemplateBankPredictStrategyFactory()(None)
+
+        self.assertEqual(len(strategy.templates), 17 * 12)
+        for chord in strategy.templates:
+            root, quality = str(chord).split(':')
+            numpy.testing.assert_array_equal(chord._vector, Chord('%s:%s' % (root, quality))._vector)
+
+    def test_same_as_templates(self):
+        frames = numpy.random.RandomState(0).uniform(0, 1, (500, 12))
+        bank = TemplateBankPredictStrategyFactory(('maj', 'min'))(None)
+        templates = TemplatePredictStrategyFactory(_binary_templates())(None)
+
+        self.assertIsInstance(bank, BatchPredictStrategy)
+        self.assertEqual([str(chord) for chord in bank.predict_batch(frames)],
+                         [str(chord) for chord in templates.predict_batch(frames)])
+        self.assertEqual(str(bank.predict(frames[0])), str(templates.predict(frames[0])))
+
+    def test_top_k(self):
+        frames = numpy.random.RandomState(1).uniform(0, 1, (50, 12))
+        strategy = TemplateBankPredictStrategyFactory()(None)
+
+        chords, scores = strategy.top_k(frames, 5)
+
+        self.assertEqual(chords.shape, (50, 5))
+        self.assertTrue(numpy.all(numpy.diff(scores, axis=1) <= 0))
+        self.assertEqual([str(chord) for chord in chords[:, 0]],
+                         [str(chord) for chord in strategy.predict_batch(frames)])
+
+        for frame, frame_scores in zip(frames, scores):
+            vectors = numpy.array([template @ numpy.eye(12) for template in strategy.templates])
+            expected = numpy.sort(vectors @ frame / numpy.linalg.norm(vectors, axis=1))[::-1][:5]
+            numpy.testing.assert_allclose(frame_scores, expected)
+
+
+class TestNoChord(unittest.TestCase):
+    def test_silent_frames(self):
+        frames = numpy.random.RandomState(2).uniform(0, 1, (20, 12))
+        frames[5:12] = 0
+        strategy = TemplateBankPredictStrategyFactory(('maj', 'min'))(None)
+
+        with unittest.mock.patch.object(strategy, 'predict_batch', wraps=strategy.predict_batch) as predict_batch:
+            chords = [str(chord) for _, chord in _ChordRecognizer(strategy, no_chord=True).apply(
+                tuple((float(t), frame) for t, frame in enumerate(frames)))]
+
+        self.assertEqual(chords[5:12], ['N'] * 7)
+        self.assertEqual(len(predict_batch.call_args[0][0]), 13)
+        self.assertEqual(chords[:5] + chords[12:], [str(chord) for chord in strategy.predict_batch(frames)[:5] +
+                                                    strategy.predict_batch(frames)[12:]])
+
+    def test_silent_frames_predicted_without_gate(self):
+        frames = numpy.random.RandomState(2).uniform(0, 1, (20, 12))
+        frames[5:12] = 0
+        strategy = TemplateBankPredictStrategyFactory(('maj', 'min'))(None)
+
+        chords = [str(chord) for _, chord in _ChordRecognizer(strategy).apply(
+            tuple((float(t), frame) for t, frame in enumerate(frames)))]
+
+        self.assertEqual(chords, [str(chord) for chord in strategy.predict_batch(frames)])
+        self.assertNotIn('N', chords)
+
+    def test_config(self):
+        config = {'PREDICT_STRATEGY_FACTORY': TemplateBankPredictStrategyFactory()}
+
+        self.assertFalse(_ChordRecognizerFactory(config).no_chord)
+        self.assertFalse(_ChordRecognizerFactory(dict(config, SILENCE_THRESHOLD=None)).no_chord)
+        self.assertTrue(_ChordRecognizerFactory(dict(config, SILENCE_THRESHOLD=-60.)).no_chord)
+
+
+class TestMemoization(unittest.TestCase):
+    def test_similar_frames_predicted_once(self):
+        frames = numpy.repeat(numpy.random.RandomState(3).uniform(0, 1, (10, 12)), 20, axis=0)
+        frames += numpy.random.RandomState(4).uniform(0, 1e-3, frames.shape)
+        strategy = TemplateBankPredictStrategyFactory(('maj', 'min'))(None)
+        memoized = _MemoizedPredictStrategy(strategy, 8)
+
+        with unittest.mock.patch.object(strategy, 'predict_batch', wraps=strategy.predict_batch) as predict_batch:
+            chords = memoized.predict_batch(frames)
+            memoized.predict_batch(frames)
+
+        self.assertEqual(predict_batch.call_count, 1)
+        self.assertLessEqual(len(predict_batch.call_args[0][0]), 10)
+        self.assertGreater(memoized.hit_rate, 0.97)
+        self.assertEqual(len(chords), len(frames))
+        self.assertEqual(str(memoized.predict(frames[0])), str(chords[0]))
+
+    def test_bounded(self):
+        memoized = _MemoizedPredictStrategy(TemplateBankPredictStrategyFactory()(None), 32, size=50)
+        memoized.predict_batch(numpy.random.RandomState(5).uniform(0, 1, (500, 12)))
+
+        self.assertEqual(len(memoized._cache), 50)
+        with self.assertRaises(ValueError):
+            _MemoizedPredictStrategy(memoized.strategy, 64)
+
+    def test_report(self):
+        frames = numpy.random.RandomState(6).uniform(0, 1, (300, 12))
+        report = memoization_report(TemplateBankPredictStrategyFactory(('maj', 'min'))(None), frames, (2, 32))
+
+        self.assertEqual([level for level, _, _ in report], [2, 32])
+        # coarser quantization gives more hits and less agreement
+        self.assertGreater(report[0][1], report[1][1])
+        self.assertLess(report[0][2], report[1][2])
+        self.assertGreater(report[1][2], 0.9)
+
+    def test_config(self):
+        recognizer = _ChordRecognizerFactory({'PREDICT_STRATEGY_FACTORY': TemplateBankPredictStrategyFactory(),
+                                              'PREDICT_CACHE_LEVELS': 8})
+
+        self.assertIsInstance(recognizer.strategy, _MemoizedPredictStrategy)
+        with self.assertRaises(ValueError):
+            _ChordRecognizerFactory({'PREDICT_STRATEGY_FACTORY': TemplateBankPredictStrategyFactory(),
+                                     'PREDICT_CACHE_LEVELS': 8, 'KEY_AWARE': True})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import pickle
+import subprocess
+import sys
+import threading
+import unittest
+import unittest.mock
+
+from chordify import concurrency
+
+
+def _threads():
+    """ Thread limits of native thread pools of worker """
+    from threadpoolctl import threadpool_info
+    return {info['num_threads'] for info in threadpool_info()}
+
+
+class TestBudget(unittest.TestCase):
+    def test_cpu_budget(self):
+        with unittest.mock.patch('joblib.cpu_count', return_value=64):
+            self.assertEqual(concurrency.cpu_budget(), 64)
+            self.assertEqual(concurrency.cpu_budget(16), 16)
+            self.assertEqual(concurrency.cpu_budget(-1), 64)
+            self.assertEqual(concurrency.cpu_budget(-4), 61)
+            self.assertEqual(concurrency.cpu_budget(-100), 1)
+
+    def test_split(self):
+        with unittest.mock.patch('joblib.cpu_count', return_value=64):
+            self.assertEqual(concurrency.split(), (64, 1))
+            self.assertEqual(concurrency.split(64, 4), (4, 16))
+            self.assertEqual(concurrency.split(10, 3), (3, 3))
+            # workers are capped by budget
+            self.assertEqual(concurrency.split(2, 8), (2, 1))
+
+    def test_limited_worker(self):
+        budget = concurrency.Budget(2, 1)
+        function = budget.delayed(_threads)()[0]
+
+        self.assertEqual(pickle.loads(pickle.dumps(function))(), {1})
+        self.assertEqual(budget.parallel()(budget.delayed(_threads)() for _ in range(2)), [{1}, {1}])
+
+    def test_executor_limits_only_tasks(self):
+        # libraries are limited while task runs and limits of process are restored after task
+        script = '''if True:
+            import sklearn.ensemble
+            from threadpoolctl import threadpool_info
+            from chordify import concurrency
+
+            def threads():
+                return sorted({info['num_threads'] for info in threadpool_info()})
+
+            default = threads()
+            with concurrency.Budget(1, 2).executor() as executor:
+                print(executor.submit(threads).result(), threads() == default)
+            '''
+        output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.dirname(__file__)))).stdout
+        self.assertEqual(output.strip(), '[2] True')
+
+    def test_executor_restores_limits_after_concurrent_tasks(self):
+        started, release = threading.Barrier(3), threading.Event()
+
+        def task():
+            started.wait(10.)
+            release.wait(10.)
+
+        with concurrency.Budget(2, 1).executor() as executor:
+            futures = [executor.submit(task) for _ in range(2)]
+            started.wait(10.)
+            # tasks started while other task ran apply limits again
+            self.assertEqual(len(concurrency._task_limiters), 2)
+            release.set()
+            for future in futures:
+                future.result()
+
+        self.assertEqual(concurrency._running_tasks, 0)
+        self.assertEqual(concurrency._task_limiters, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+
+import numpy
+
+from chordify import dataset
+from chordify.format import get_formatter
+
+_TRANSCRIPTIONS = (
+    ('first', ((0.0, 1.5, 'C:maj'), (1.5, 2.25, 'A:min'))),
+    ('empty', ()),
+    ('second', ((0.0, 0.5, 'A:min'), (0.5, 3.0, 'G:maj'), (3.0, 4.0, 'N')))
+)
+
+
+class TestDataset(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'corpus.npz')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_write_read(self):
+        dataset.write(self.path, _TRANSCRIPTIONS)
+
+        corpus = dataset.read(self.path)
+
+        self.assertEqual(corpus.tracks.tolist(), ['first', 'empty', 'second'])
+        self.assertEqual(corpus.vocabulary.tolist(), ['A:min', 'C:maj', 'G:maj', 'N'])
+        numpy.testing.assert_array_equal(corpus.track, [0, 0, 2, 2, 2])
+        numpy.testing.assert_array_equal(corpus.chord, [1, 0, 0, 2, 3])
+        for track_id, segments in _TRANSCRIPTIONS:
+            self.assertEqual(tuple(corpus.segments(track_id)), segments)
+        with self.assertRaises(KeyError):
+            corpus.segments('missing')
+
+    def test_to_dataframe(self):
+        dataset.write(self.path, _TRANSCRIPTIONS, compressed=True)
+
+        frame = dataset.read(self.path).to_dataframe()
+
+        self.assertEqual(len(frame), 5)
+        self.assertEqual(frame.groupby('chord', observed=True)['track'].count()['A:min'], 2)
+        self.assertAlmostEqual((frame.stop - frame.start)[frame.track == 'second'].sum(), 4.0)
+
+    def test_from_files(self):
+        files = list()
+        for track_id, segments in _TRANSCRIPTIONS:
+            files.append(os.path.join(self.directory.name, track_id + '.lab'))
+            with open(files[-1], 'w') as file:
+                get_formatter(files[-1]).dump(segments, file)
+
+        dataset.from_files(self.path, files)
+
+        corpus = dataset.read(self.path)
+        self.assertEqual(tuple(corpus.segments('second')), _TRANSCRIPTIONS[2][1])
+
+    def test_errors(self):
+        with dataset.writer(self.path) as writer:
+            with self.assertRaises(ValueError):
+                writer.add('wrong', ((2.0, 1.0, 'C:maj'),))
+            writer.add('first', ())
+            with self.assertRaises(ValueError):
+                writer.add('first', ())
+
+
+if __name__ == '__main__':
+    unittest.main()
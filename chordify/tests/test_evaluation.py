@@ -0,0 +1,60 @@
+import unittest
+
+import numpy
+
+from chordify import dataset, evaluation
+from chordify.notation import Chord
+
+
+def _timeline(*segments):
+    return numpy.array([s[0] for s in segments]), numpy.array([s[1] for s in segments]), [s[2] for s in segments]
+
+
+class TestEvaluation(unittest.TestCase):
+    def test_compare(self):
+        reference = _timeline((0., 2., 'C:maj7'), (2., 4., 'A:min'), (4., 5., 'N'), (5., 6., 'G:sus4'))
+        estimated = _timeline((0., 1., 'C:maj'), (1., 3., 'A:maj'), (3., 4.5, 'A:min7'), (4.5, 5.5, 'N'))
+
+        recall = evaluation.compare(reference, estimated).recall()
+
+        # root: C 1 s, A 2 s, N 0.5 s of 6 s; majmin: sus4 is excluded, sevenths reduce to triads; full: only N
+        self.assertAlmostEqual(recall['root'], 3.5 / 6)
+        self.assertAlmostEqual(recall['majmin'], 2.5 / 5)
+        self.assertAlmostEqual(recall['full'], 0.5 / 6)
+
+    def test_uncovered_and_empty(self):
+        reference = _timeline((0., 2., 'C:maj'))
+
+        self.assertEqual(evaluation.compare(reference, _timeline()).recall()['root'], 0.)
+        self.assertAlmostEqual(evaluation.compare(reference, _timeline((1., 2., 'C:maj'))).recall()['root'], 0.5)
+        self.assertEqual(evaluation.compare(_timeline(), reference).recall()['root'], 0.)
+
+    def test_total_and_datasets(self):
+        import os
+        import tempfile
+
+        tracks = [('first', ((0., 1., 'C:maj'), (1., 3., 'G:maj'))), ('second', ((0., 4., 'E:min'),))]
+        estimates = [('second', ((0., 2., 'E:min'), (2., 4., 'E:maj'))), ('first', ((0., 3., 'C:maj'),))]
+        with tempfile.TemporaryDirectory() as directory:
+            dataset.write(os.path.join(directory, 'reference.npz'), tracks)
+            dataset.write(os.path.join(directory, 'estimated.npz'), estimates)
+            scores = evaluation.compare_datasets(dataset.read(os.path.join(directory, 'reference.npz')),
+                                                 dataset.read(os.path.join(directory, 'estimated.npz')))
+
+        self.assertAlmostEqual(scores['first'].recall()['majmin'], 1 / 3)
+        self.assertAlmostEqual(scores['second'].recall()['majmin'], 1 / 2)
+        self.assertAlmostEqual(evaluation.total(scores.values()).recall()['majmin'], 3 / 7)
+        self.assertAlmostEqual(evaluation.total(scores.values()).recall()['root'], 5 / 7)
+
+
+class TestChordEquality(unittest.TestCase):
+    def test_pitch_content(self):
+        self.assertEqual(Chord('C:maj'), Chord('C'))
+        self.assertEqual(Chord('C#:min'), Chord('Db:min'))
+        self.assertNotEqual(Chord('C:maj'), Chord('C:min'))
+        self.assertNotEqual(Chord('C:maj'), 'C:maj')
+        self.assertEqual(len({Chord('C:maj'), Chord('C'), Chord('A:min')}), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import io
+import unittest
+
+import numpy
+
+from chordify.format import get_formatter, register_formatter, to_segments, Format, _LabFormat, _FORMATTERS
+from chordify.notation import Chord
+
+_SEGMENTS = ((0.0, 1.5, 'C:maj'), (1.5, 2.25, 'A:min/5'), (2.25, 4.0, 'N'))
+
+
+class TestLabFormat(unittest.TestCase):
+    def test_encode_decode(self):
+        formatter = get_formatter('song.lab')
+
+        string = formatter.encode(_SEGMENTS)
+
+        self.assertEqual(string, '0.0 1.5 C:maj\n1.5 2.25 A:min/5\n2.25 4.0 N')
+        self.assertEqual(tuple(formatter.decode(string)), _SEGMENTS)
+
+    def test_stream(self):
+        formatter = get_formatter('song.lab', precision=2)
+        file = io.StringIO()
+
+        formatter.dump(_SEGMENTS, file)
+        file.seek(0)
+
+        self.assertEqual(file.getvalue().splitlines()[0], '0.00 1.50 C:maj')
+        self.assertEqual(tuple(formatter.iter_load(file)), _SEGMENTS)
+
+    def test_load_arrays(self):
+        file = io.StringIO('0.0\t1.5\tC:maj\n\n1.5 2.25  A:min/5\n')
+
+        starts, stops, labels = _LabFormat().load_arrays(file)
+
+        numpy.testing.assert_array_equal(starts, [0.0, 1.5])
+        numpy.testing.assert_array_equal(stops, [1.5, 2.25])
+        self.assertEqual(labels, ['C:maj', 'A:min/5'])
+
+    def test_load_arrays_validates_lines(self):
+        # same number of tokens as two valid lines
+        string = '0 1 C:maj 2\n3 G:maj\n'
+
+        with self.assertRaises(ValueError):
+            tuple(_LabFormat().iter_load(io.StringIO(string)))
+        with self.assertRaises(ValueError):
+            _LabFormat().load_arrays(io.StringIO(string))
+
+    def test_load_arrays_short_line_before_blank_line(self):
+        # blank line completes four tokens of short line
+        string = '0 1\n\n2 3 C:maj\n'
+
+        with self.assertRaisesRegex(ValueError, 'Line "0 1" is not start, stop and label.'):
+            tuple(_LabFormat().iter_load(io.StringIO(string)))
+        with self.assertRaisesRegex(ValueError, 'Line "0 1" is not start, stop and label.'):
+            _LabFormat().load_arrays(io.StringIO(string))
+
+    def test_decode_errors(self):
+        with self.assertRaises(ValueError):
+            get_formatter('song.lab').decode('0.0 1.0')
+        with self.assertRaises(ValueError):
+            get_formatter('song.lab').decode('2.0 1.0 C:maj')
+
+    def test_to_segments(self):
+        transcription = ((1.5, Chord('C:maj')), (2.25, Chord('A:min/5')))
+        self.assertEqual(tuple(to_segments(transcription)), _SEGMENTS[:2])
+
+
+class TestRegistry(unittest.TestCase):
+    def test_jsonl(self):
+        formatter = get_formatter('song.JSONL')
+        self.assertEqual(tuple(formatter.decode(formatter.encode(_SEGMENTS))), _SEGMENTS)
+
+    def test_register(self):
+        class _UpperFormat(Format):
+            def encode(self, iterable):
+                return str(iterable).upper()
+
+            def decode(self, string):
+                return string.lower()
+
+        register_formatter('.upper', _UpperFormat)
+        self.addCleanup(_FORMATTERS.pop, '.upper')
+
+        self.assertIsInstance(get_formatter('song.upper'), _UpperFormat)
+        self.assertIsInstance(get_formatter('song.txt', default='.lab'), _LabFormat)
+        with self.assertRaises(NotImplementedError):
+            get_formatter('song.txt')
+
+
+if __name__ == '__main__':
+    unittest.main()
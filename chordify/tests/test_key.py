@@ -0,0 +1,80 @@
+import unittest
+
+import numpy
+
+from chordify import key
+from chordify.app import BinaryTemplatePredictStrategyFactory
+from chordify.chord_recognition import TemplateBankPredictStrategyFactory, _ChordRecognizerFactory
+
+
+def _progression(pitches, frames_per_chord=20, repeats=10, seed=0):
+    """ (T, 12) noisy chroma of chords given by pitch classes """
+    random = numpy.random.RandomState(seed)
+    frames = random.uniform(0, 0.2, (len(pitches) * frames_per_chord * repeats, 12))
+    for i, chord in enumerate(pitches * repeats):
+        frames[i * frames_per_chord:(i + 1) * frames_per_chord, list(chord)] += 1
+    return frames
+
+
+# I IV V vi of G major and all major chords of chromatic scale
+_G_MAJOR = [(7, 11, 2), (0, 4, 7), (2, 6, 9), (4, 7, 11)]
+_CHROMATIC = [(root, (root + 4) % 12, (root + 7) % 12) for root in range(12)]
+
+
+class TestEstimate(unittest.TestCase):
+    def test_key(self):
+        estimated = key.estimate(_progression(_G_MAJOR))
+
+        self.assertEqual(str(estimated), 'G:maj')
+        self.assertGreater(estimated.confidence, 0.9)
+
+    def test_no_key(self):
+        self.assertLess(key.estimate(_progression(_CHROMATIC)).confidence, 0.6)
+        self.assertEqual(key.estimate(numpy.zeros((100, 12))).confidence, 0.)
+
+    def test_minor_scale(self):
+        # harmonic minor, dominant of A minor is E major
+        self.assertEqual(numpy.flatnonzero(key.Key(9, True, 1., 1.).scale).tolist(), [0, 2, 4, 5, 7, 8, 9, 11])
+
+
+class TestKeyAwarePredictStrategy(unittest.TestCase):
+    def test_candidates(self):
+        strategy = key._KeyAwarePredictStrategy(TemplateBankPredictStrategyFactory(('maj', 'min'))(None))
+        candidates = strategy.candidates(key.Key(7, False, 1., 1.))
+
+        self.assertEqual(sorted(str(strategy._chords[i]) for i in candidates),
+                         ['A:min', 'B:min', 'C:maj', 'D:maj', 'E:min', 'G:maj'])
+
+    def test_same_as_whole_vocabulary_in_key(self):
+        frames = _progression(_G_MAJOR)
+        strategy = TemplateBankPredictStrategyFactory()(None)
+
+        self.assertEqual([str(chord) for chord in key._KeyAwarePredictStrategy(strategy).predict_batch(frames)],
+                         [str(chord) for chord in strategy.predict_batch(frames)])
+
+    def test_fallback(self):
+        frames = _progression(_CHROMATIC)
+        strategy = BinaryTemplatePredictStrategyFactory(None)
+
+        self.assertEqual([str(chord) for chord in key._KeyAwarePredictStrategy(strategy).predict_batch(frames)],
+                         [str(chord) for chord in strategy.predict_batch(frames)])
+
+    def test_template_matrix(self):
+        bank = TemplateBankPredictStrategyFactory(('maj', 'min'))(None)
+        binary = BinaryTemplatePredictStrategyFactory(None)
+
+        for strategy in (bank, binary):
+            frames = _progression(_G_MAJOR)
+            best = numpy.argmax(frames @ strategy.template_matrix().T, axis=1)
+            self.assertEqual([str(strategy.templates[i]) for i in best],
+                             [str(chord) for chord in strategy.predict_batch(frames)])
+
+    def test_config(self):
+        recognizer = _ChordRecognizerFactory({'PREDICT_STRATEGY_FACTORY': BinaryTemplatePredictStrategyFactory,
+                                              'KEY_AWARE': True})
+
+        self.assertIsInstance(recognizer.strategy, key._KeyAwarePredictStrategy)
+
+
+if __name__ == '__main__':
+    unittest.main()
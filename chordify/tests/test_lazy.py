@@ -0,0 +1,52 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+from chordify._lazy import lazy_import
+
+
+class TestLazyImport(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with open(os.path.join(directory, 'chordify_slow_module.py'), 'w') as file:
+            file.write('import time\ntime.sleep(0.2)\nvalue = 1\n')
+        sys.path.insert(0, directory)
+        self.addCleanup(sys.path.remove, directory)
+        self.addCleanup(sys.modules.pop, 'chordify_slow_module', None)
+
+    def test_loaded_on_attribute_access(self):
+        module = lazy_import('chordify_slow_module')
+
+        self.assertNotIn('chordify_slow_module', sys.modules)
+        self.assertEqual(module.value, 1)
+        self.assertIs(lazy_import('chordify_slow_module'), sys.modules['chordify_slow_module'])
+
+    def test_concurrent_first_access(self):
+        module = lazy_import('chordify_slow_module')
+        values = list()
+
+        def access():
+            try:
+                values.append(module.value)
+            except AttributeError as e:
+                values.append(e)
+        threads = [threading.Thread(target=access) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # threads which access module while it is executed wait for complete module
+        self.assertEqual(values, [1] * 4)
+
+    def test_missing_module(self):
+        with self.assertRaises(ModuleNotFoundError):
+            lazy_import('chordify_missing_module')
+
+
+if __name__ == '__main__':
+    unittest.main()
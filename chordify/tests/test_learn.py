@@ -0,0 +1,210 @@
+import os
+import tempfile
+import unittest
+
+import numpy
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import ParameterGrid
+from sklearn.naive_bayes import GaussianNB
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.svm import SVC
+from sklearn.tree import DecisionTreeClassifier
+
+from chordify import model
+from chordify.app import _LearnedStrategy, LearnerBuilder, _binary_templates
+from chordify.chord_recognition import _ChordRecognizer, TemplatePredictStrategyFactory, BatchPredictStrategy
+from chordify.learn import _CandidateSearch, _BestEstimatorFactory, _fit_and_score, _kernel_key, _kernel_matrix, \
+    SVMClassifier
+from chordify.notation import Chord
+
+
+def _samples(labels=('C:maj', 'A:min', 'G:maj'), n=30, seed=0):
+    random = numpy.random.RandomState(seed)
+    X, y = list(), list()
+    for label in labels:
+        vector = numpy.asarray(Chord(label)._vector, dtype=float)
+        for _ in range(n):
+            X.append(vector + random.uniform(0, 0.4, 12))
+            y.append(label)
+    return numpy.asarray(X), y
+
+
+class TestCandidateSearch(unittest.TestCase):
+    def test_conditional_grid(self):
+        grid = SVMClassifier.keywords['param_grid']
+        candidates = _CandidateSearch(SVC(), grid)._candidates()
+
+        self.assertEqual(len(candidates), 10 * 7 + 3 * 10)
+        for params in candidates:
+            self.assertEqual('degree' in params, params['kernel'] == 'poly')
+
+    def test_precomputed_kernel_scores_match(self):
+        X, y = _samples()
+        y = numpy.asarray(y)
+        train, test = numpy.arange(0, 90, 2), numpy.arange(1, 90, 2)
+
+        for params in ({'kernel': 'rbf', 'C': 10, 'gamma': 0.5},
+                       {'kernel': 'poly', 'C': 1, 'degree': 3, 'gamma': 0.1},
+                       {'kernel': 'sigmoid', 'C': 1, 'gamma': 0.01},
+                       {'kernel': 'linear', 'C': 1}):
+            kernel = _kernel_matrix(_kernel_key(dict(SVC().get_params(), **params), X), X)
+            direct = _fit_and_score(SVC(), params, X, y, train, test, False)
+            cached = _fit_and_score(SVC(), params, kernel, y, train, test, True)
+            self.assertAlmostEqual(direct, cached)
+
+    def test_kernel_cache_bounded(self):
+        X, _ = _samples()
+        search = _CandidateSearch(SVC(), {})
+        search.KERNEL_CACHE_BYTES = 2 * X.shape[0] ** 2 * 8
+
+        for gamma in (0.1, 0.2, 0.3):
+            self.assertIsNotNone(search._kernel({'kernel': 'rbf', 'gamma': gamma}, X))
+        search._kernel({'kernel': 'rbf', 'gamma': 0.2}, X)
+        search._kernel({'kernel': 'rbf', 'gamma': 0.4}, X)
+
+        # least recently used kernel is evicted
+        self.assertEqual([key[1] for key in search._kernels], [0.2, 0.4])
+        # matrix larger than whole cache is not cached
+        self.assertIsNone(search._kernel({'kernel': 'rbf', 'gamma': 0.5}, X.repeat(2, axis=0)))
+
+    def test_fit_budget(self):
+        X, y = _samples()
+        search = _CandidateSearch(SVC(), SVMClassifier.keywords['param_grid'], max_fits=23, n_jobs=1)
+        search.fit(X, y)
+
+        self.assertLessEqual(search.n_fits_, 23)
+        self.assertIsNotNone(search.best_estimator_)
+
+    def test_search_strategies(self):
+        X, y = _samples()
+
+        for search in ('grid', 'random', 'halving'):
+            estimator = SVMClassifier(X, [Chord(label) for label in y], search=search, n_jobs=1)
+            self.assertEqual(str(estimator.predict(X[0])), 'C:maj')
+            self.assertEqual(str(estimator.predict(X[-1])), 'G:maj')
+
+    def test_bad_search(self):
+        X, y = _samples()
+        with self.assertRaises(ValueError):
+            _BestEstimatorFactory(X, y, search='exhaustive', C=[1])
+
+
+class TestBatchPrediction(unittest.TestCase):
+    def test_estimator_batch(self):
+        X, y = _samples(('C:maj', 'A:min', 'G:maj', 'E:min'))
+        strategy = _LearnedStrategy(_BestEstimatorFactory(X, [Chord(label) for label in y], SVC(), C=[1], n_jobs=1),
+                                    tempfile.gettempdir())
+
+        self.assertIsInstance(strategy, BatchPredictStrategy)
+        batch = strategy.predict_batch(X)
+        self.assertEqual(len(batch), len(X))
+        for frame, chord in zip(X, batch):
+            self.assertIs(strategy.predict(frame), chord)
+
+    def test_template_batch(self):
+        X, y = _samples(('C:maj', 'A:min', 'G:maj', 'E:min'))
+        strategy = TemplatePredictStrategyFactory(_binary_templates())(None)
+
+        batch = strategy.predict_batch(X)
+        self.assertEqual([str(chord) for chord in batch], y)
+        for frame, chord in zip(X, batch):
+            self.assertIs(strategy.predict(frame), chord)
+
+    def test_recognizer_single_call(self):
+        X, y = _samples()
+        strategy = _BestEstimatorFactory(X, y, SVC(), C=[1], n_jobs=1)
+        calls = list()
+        predict = strategy._estimator.predict
+        strategy._estimator.predict = lambda frames: calls.append(len(frames)) or predict(frames)
+
+        result = _ChordRecognizer(strategy).apply(tuple((float(t), frame) for t, frame in enumerate(X)))
+
+        self.assertEqual(calls, [len(X)])
+        self.assertEqual([chord for _, chord in result], y)
+
+
+class TestModelFormat(unittest.TestCase):
+    MODEL_FILENAME = 'model.chordify'
+    MODEL_SAVE_DIR = tempfile.gettempdir()
+
+    def tearDown(self) -> None:
+        if os.path.exists(os.path.join(self.MODEL_SAVE_DIR, self.MODEL_FILENAME)):
+            os.remove(os.path.join(self.MODEL_SAVE_DIR, self.MODEL_FILENAME))
+
+    def test_save_load(self):
+        X, y = _samples(('C:maj', 'A:min', 'G:maj', 'E:min'))
+
+        for kernel in ('rbf', 'linear', 'poly', 'sigmoid'):
+            strategy = _LearnedStrategy(_BestEstimatorFactory(X, y, SVC(), kernel=[kernel], C=[1], n_jobs=1),
+                                        self.MODEL_SAVE_DIR)
+            strategy.save(self.MODEL_FILENAME)
+            loaded = LearnerBuilder().setModelOutputDir(self.MODEL_SAVE_DIR).build().load(self.MODEL_FILENAME)
+
+            self.assertIsInstance(loaded._predict_strategy._arrays['intercept'], numpy.memmap)
+            for frame in X:
+                self.assertEqual(str(strategy.predict(frame)), str(loaded.predict(frame)))
+            self.assertEqual([str(chord) for chord in strategy.predict_batch(X)],
+                             [str(chord) for chord in loaded.predict_batch(X)])
+
+    def test_binary_save_load(self):
+        X, y = _samples(('C:maj', 'A:min'))
+        path = os.path.join(self.MODEL_SAVE_DIR, self.MODEL_FILENAME)
+
+        strategy = _BestEstimatorFactory(X, y, SVC(), kernel=['rbf'], C=[1], n_jobs=1)
+        model.save(path, strategy)
+        loaded = model.load(path, mmap_mode=None)
+
+        self.assertNotIsInstance(loaded._arrays['intercept'], numpy.memmap)
+        for frame in X:
+            self.assertEqual(str(strategy.predict(frame)), str(loaded.predict(frame)))
+
+    def test_forest_save_load(self):
+        X, y = _samples(('C:maj', 'A:min', 'G:maj', 'E:min'))
+        path = os.path.join(self.MODEL_SAVE_DIR, self.MODEL_FILENAME)
+
+        strategy = _BestEstimatorFactory(X, y, RandomForestClassifier(random_state=0), n_estimators=[10],
+                                         max_depth=[6], n_jobs=1)
+        model.save(path, strategy)
+        loaded = model.load(path)
+
+        for frame in X:
+            self.assertEqual(str(strategy.predict(frame)), str(loaded.predict(frame)))
+
+    def test_compile(self):
+        X, y = _samples(('C:maj', 'A:min', 'G:maj', 'E:min', 'F:maj'), seed=1)
+        noise = numpy.random.RandomState(2).uniform(0, 1, (200, 12))
+
+        for estimator, grid in ((SVC(), {'kernel': ['linear', 'rbf', 'poly'], 'C': [1]}),
+                                (KNeighborsClassifier(), {'n_neighbors': [7], 'weights': ['uniform', 'distance']}),
+                                (DecisionTreeClassifier(random_state=0), {'max_depth': [4]}),
+                                (RandomForestClassifier(random_state=0), {'n_estimators': [10], 'max_depth': [6]})):
+            for params in ParameterGrid(grid):
+                strategy = _BestEstimatorFactory(X, y, estimator, param_grid={k: [v] for k, v in params.items()},
+                                                 n_jobs=1)
+                compiled = model.compile_strategy(strategy)
+
+                self.assertIsInstance(compiled, model._Model)
+                for frames in (X, noise):
+                    self.assertEqual([str(chord) for chord in strategy.predict_batch(frames)],
+                                     [str(chord) for chord in compiled.predict_batch(frames)], params)
+
+    def test_export_unsupported_estimator(self):
+        X, y = _samples()
+        estimator = GaussianNB().fit(X, numpy.arange(len(y)) % 3)
+
+        with self.assertRaisesRegex(NotImplementedError, 'GaussianNB'):
+            model.export_estimator(estimator, numpy.asarray(['C:maj', 'A:min', 'G:maj']))
+
+    def test_version(self):
+        path = os.path.join(self.MODEL_SAVE_DIR, self.MODEL_FILENAME)
+        model.write(path, 'svc', {}, {'labels': numpy.asarray(['C:maj'])})
+        with open(path, 'r+b') as file:
+            file.seek(len(model.MAGIC))
+            file.write(b'\xff')
+
+        with self.assertRaises(ValueError):
+            model.read(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
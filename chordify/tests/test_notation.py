@@ -1,9 +1,11 @@
 import unittest
+from itertools import product
 
 import numpy
 from lark.exceptions import UnexpectedInput
 
-from chordify.notation import parse, _Vector, Chord
+from chordify import _grammar
+from chordify.notation import parse, _Vector, Chord, _SHORTHANDS
 
 
 class TestNotation(unittest.TestCase):
@@ -84,6 +86,20 @@ class TestNotation(unittest.TestCase):
         self.assertEqual(parse('C:maj(*3,*1)/bb9'), ('C', ('5',), 'bb9'))
         self.assertEqual(parse('C:maj(*3,*1)/bb9'), ('C', ('5',), 'bb9'))
 
+    def test_fast_path_matches_grammar(self):
+        roots = ('C', 'Db', 'F#', 'Abb', 'B#b')
+        shorthands = ('',) + tuple(':' + shorthand for shorthand in _SHORTHANDS)
+        basses = ('', '/3', '/b7', '/#11', '/10', '/bb9')
+
+        for root, shorthand, bass in product(roots, shorthands, basses):
+            label = root + shorthand + bass
+            self.assertEqual(parse(label), _grammar.parse(label), label)
+
+    def test_fast_path_rejects(self):
+        for label in ('A:', 'A/05', 'A:min/005', 'A:mi', 'A:min/', 'a:min', 'A:min/A', 'A:maj7 '):
+            with self.assertRaises(UnexpectedInput):
+                parse(label)
+
 
 class TestVector(unittest.TestCase):
     def test_dot(self):
@@ -130,6 +146,18 @@ class TestChord(unittest.TestCase):
         numpy.testing.assert_array_equal(Chord("B:maj(*1)")._vector, [0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 0, 0])
         numpy.testing.assert_array_equal(Chord("B:maj(*1,6)")._vector, [0, 0, 0, 1, 0, 0, 1, 0, 1, 0, 0, 0])
 
+    def test_compound_intervals(self):
+        # 9, 11 and 13 are 2, 4 and 6 of next octave
+        numpy.testing.assert_array_equal(Chord("C:(9)")._vector, Chord("C:(2)")._vector)
+        numpy.testing.assert_array_equal(Chord("C:maj(b9,#11,13)")._vector, [1, 1, 0, 0, 1, 0, 1, 1, 0, 1, 0, 0])
+        numpy.testing.assert_array_equal(Chord("C:9")._vector, [1, 0, 1, 0, 1, 0, 0, 1, 0, 0, 1, 0])
+        numpy.testing.assert_array_equal(Chord("A:min9")._vector, [1, 0, 0, 0, 1, 0, 0, 1, 0, 1, 0, 1])
+
+    def test_no_chord(self):
+        numpy.testing.assert_array_equal(Chord("N")._vector, [0] * 12)
+        self.assertEqual(str(Chord("N")), "N")
+        self.assertEqual(Chord("N") @ numpy.ones(12), 0)
+
     def test_str(self):
         self.assertEqual(str(Chord("A:min(8)/7")), "A:min(8)/7")
         self.assertEqual(str(Chord("A:min")), "A:min")
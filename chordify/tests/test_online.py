@@ -0,0 +1,32 @@
+import unittest
+
+import numpy
+
+from chordify.app import default_config
+from chordify.online import OnlineRecognizerFactory
+
+
+def _triad(frequencies, seconds, sr):
+    t = numpy.arange(int(seconds * sr)) / sr
+    return sum(numpy.sin(2 * numpy.pi * f * t) for f in frequencies) / len(frequencies)
+
+
+class TestOnlineRecognizer(unittest.TestCase):
+    def test_changes(self):
+        sr = default_config['SAMPLING_FREQUENCY']
+        y = numpy.concatenate((_triad((261.63, 329.63, 392.00), 2., sr), _triad((220.00, 261.63, 329.63), 2., sr)))
+        recognizer = OnlineRecognizerFactory()
+
+        changes = list()
+        for start in range(0, len(y), sr // 20):
+            changes.extend((start, change) for change in recognizer.push(y[start:start + sr // 20]))
+        changes.extend((len(y), change) for change in recognizer.flush())
+
+        self.assertEqual([str(chord) for _, (_, chord) in changes[-2:]], ['C:maj', 'A:min'])
+        pushed, (change_time, _) = changes[-1]
+        self.assertAlmostEqual(change_time, 2., delta=0.3)
+        self.assertLessEqual(pushed / sr - change_time, recognizer.latency + 0.05 + 0.3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,23 @@
+import unittest
+
+from chordify.sweep import pareto_frontier, cheapest, configurations, Result
+
+
+class TestSweep(unittest.TestCase):
+    def test_pareto_frontier(self):
+        results = [Result({'a': 1}, 0.5, 1.), Result({'a': 2}, 0.4, 2.), Result({'a': 3}, 0.7, 3.),
+                   Result({'a': 4}, 0.6, 0.5)]
+
+        self.assertEqual([r.params['a'] for r in pareto_frontier(results)], [4, 3])
+        self.assertEqual(cheapest(results, 0.65).params['a'], 3)
+        self.assertIsNone(cheapest(results, 0.9))
+
+    def test_configurations(self):
+        params = list(configurations({'BINS_PER_OCTAVE': (12, 36), 'MIN_FREQ': (32.70319566257483, 65.40639132514966)}))
+
+        self.assertEqual(len(params), 4)
+        self.assertEqual([(p['N_OCTAVES'], p['N_BINS']) for p in params], [(7, 84), (6, 72), (7, 252), (6, 216)])
+
+
+if __name__ == '__main__':
+    unittest.main()
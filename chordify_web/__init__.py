@@ -5,12 +5,14 @@ from flask_session import Session
 from werkzeug.exceptions import NotFound, InternalServerError, Unauthorized
 
 from chordify_web.logging import setup_logging
+from chordify_web.utils import IngestRequest
 
 
 def create_app(test_config=None):
     # create and configure the app
 
     app = Flask(__name__, instance_relative_config=True)
+    app.request_class = IngestRequest
 
     if test_config is None:
         # load the instance config, if it exists, when not testing
@@ -28,11 +30,19 @@ def create_app(test_config=None):
     except OSError:
         pass
 
-    from . import upload, analysis, download
+    from . import upload, analysis, download, batch, admin
 
     app.register_blueprint(upload.bp)
     app.register_blueprint(analysis.bp)
     app.register_blueprint(download.bp)
+    app.register_blueprint(batch.bp)
+    app.register_blueprint(admin.bp)
+
+    from . import janitor, jobs, profiling
+    janitor.init_app(app)
+    profiling.init_app(app)
+    jobs.init_app(app)
+    batch.init_app(app)
 
     @app.route('/')
     def run():
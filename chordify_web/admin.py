@@ -0,0 +1,43 @@
+""" Admin endpoints for diagnosis of running app
+
+Endpoints require ADMIN_TOKEN as bearer token of Authorization header and are not found when ADMIN_TOKEN is not
+configured.
+"""
+import hmac
+import os
+
+from flask import Blueprint, request, jsonify, send_file, current_app as app
+from werkzeug.exceptions import NotFound, Unauthorized
+
+bp = Blueprint('admin', __name__, url_prefix='/admin')
+
+
+@bp.before_request
+def _authorize():
+    token = app.config.get('ADMIN_TOKEN', None)
+    if not token:
+        raise NotFound
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(credentials.encode(), token.encode()):
+        raise Unauthorized
+
+
+@bp.route('/analyses', methods=['GET'])
+def analyses():
+    """ Recent slow analyses, profiler and janitor metrics """
+    profiler = app.extensions['profiler']
+    janitor = app.extensions.get('janitor', None)
+    return jsonify(analyses=profiler.slow(),
+                   slow_seconds=profiler.slow_seconds,
+                   profiler=profiler.metrics,
+                   janitor=janitor.metrics if janitor is not None else None)
+
+
+@bp.route('/analyses/<record_id>/profile', methods=['GET'])
+def profile(record_id):
+    """ Folded stacks of profiled analysis """
+    filepath = app.extensions['profiler'].profile_path(record_id)
+    # profile may be evicted by janitor together with its upload
+    if filepath is None or not os.path.exists(filepath):
+        raise NotFound
+    return send_file(filepath, mimetype='text/plain', as_attachment=True, download_name=record_id + '.folded')
@@ -1,11 +1,22 @@
+import io
+import json
+import logging
 import os
-from typing import Sequence, Tuple
+import tempfile
+import time
+from contextlib import suppress
+from typing import Iterable, Tuple, Iterator, Sequence, Optional
 
 from flask import (
-    Blueprint, current_app as app, session, g, render_template, url_for)
+    Blueprint, current_app as app, session, g, render_template, url_for, Response, stream_with_context)
 from werkzeug.exceptions import NotFound
 
+from chordify.format import get_formatter, to_segments
+from . import profiling
 from .chordify import get_configured_transcript
+from .utils import inflight, touch, process_alive
+
+logger = logging.getLogger(__name__)
 
 bp = Blueprint('analysis', __name__, url_prefix='/analysis')
 
@@ -16,42 +27,183 @@ def _resolve_token(token: str):
     return secret
 
 
-def _format_transcription(iterable: Sequence[Tuple[float, object]]):
-    """ Format transcription as html for render in template """
-    result = '<span><b>start stop chord</b></span>'
-    start = 0.0
-    for row in iterable:
-        result += '<span>%.2f %.2f %s</span><br>' % (start, row[0], row[1])
-        start = row[0]
-    return result
+def _resolve_directory(token: str) -> str:
+    """ Resolve existing directory where audio file is saved or raise NotFound """
+    token_dir = _resolve_token(token)
+    if token_dir:
+        directory = os.path.join(app.config['UPLOAD_DIR'], token_dir)
+        if os.path.exists(directory) and os.path.isdir(directory):
+            return directory
+    raise NotFound
+
+
+def _format_segments(segments: Iterable[Tuple[float, float, str]]):
+    """ Format transcription segments as html for render in template """
+    return '<span><b>start stop chord</b></span>' + ''.join(
+        '<span>%.2f %.2f %s</span><br>' % segment for segment in segments)
+
+
+def _event(event: str, data) -> str:
+    """ Server-sent event with JSON data """
+    return 'event: %s\ndata: %s\n\n' % (event, json.dumps(data))
+
+
+def _lock_path(filepath: str) -> str:
+    return filepath + '.lock'
+
+
+def _holder(filepath: str) -> Optional[Tuple[int, str]]:
+    """ Pid and partial transcription of analysis which holds lock of transcription filepath, None if lock does not
+    exist and pid 0 while lock is being written """
+    try:
+        with open(_lock_path(filepath)) as file:
+            pid, _, partial = file.read().strip().partition(' ')
+    except FileNotFoundError:
+        return None
+    return (int(pid), os.path.join(os.path.dirname(filepath), partial)) if partial else (0, '')
+
 
+def _alive(holder: Optional[Tuple[int, str]]) -> bool:
+    return holder is not None and (holder[0] == 0 or process_alive(holder[0]))
 
-def _save_transcription(directory: str, filename: str, iterable: Sequence[Tuple[float, object]]) -> str:
-    """ Save transcription iterator to a file and returns a relative path """
-    result = ''
-    start = 0.0
-    for row in iterable:
-        result += '%.2f %.2f %s\n' % (start, row[0], row[1])
-        start = row[0]
 
+def running(filepath: str) -> bool:
+    """ Whether analysis of live process holds lock of transcription filepath """
+    return _alive(_holder(filepath))
+
+
+def _acquire(filepath: str, partial: str) -> bool:
+    """ Creates lock of transcription filepath which names pid and partial transcription of analysis, False if running
+    analysis holds it. Lock and partial transcription left by dead process are removed. """
+    while True:
+        try:
+            fd = os.open(_lock_path(filepath), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            holder = _holder(filepath)
+            if _alive(holder):
+                return False
+            if holder is not None:
+                # left by dead process
+                for path in (_lock_path(filepath), holder[1]):
+                    with suppress(FileNotFoundError):
+                        os.remove(path)
+            continue
+        with os.fdopen(fd, 'w') as file:
+            file.write('%d %s' % (os.getpid(), os.path.basename(partial)))
+        return True
+
+
+def _follow(filepath: str, interval: float) -> Iterator[Sequence[Tuple[float, float, str]]]:
+    """ Yields segments of analysis which holds lock of transcription filepath as they are saved into its partial
+    transcription, until analysis ends """
+    formatter = get_formatter(filepath, default='.lab')
+    n_lines = 0
+    while True:
+        holder = _holder(filepath)
+        live = _alive(holder)
+        # partial transcription is renamed to transcription when analysis ends
+        try:
+            with open(holder[1] if live else filepath) as file:
+                text = file.read()
+        except FileNotFoundError:
+            text = ''
+        # last line may be incomplete
+        lines = text[:text.rfind('\n') + 1].splitlines(keepends=True)
+        if len(lines) > n_lines:
+            yield tuple(formatter.load(io.StringIO(''.join(lines[n_lines:]))))
+            n_lines = len(lines)
+        if not live:
+            break
+        time.sleep(interval)
+    if not os.path.exists(filepath):
+        raise RuntimeError('Concurrent analysis of %s failed.' % filepath)
+
+
+def transcribe(directory: str, profile: bool = False) -> Iterator[Sequence[Tuple[float, float, str]]]:
+    """ Transcript audio file of directory, yields segments of blocks as they are recognized. Transcription is
+    saved to a file when complete, so following requests read the file. Analysis is profiled if profile is set.
+    One analysis of directory runs at a time, concurrent requests and jobs follow its partial transcription. """
+    filename = app.config['TRANSCRIPTION_FILE_NAME']
     filepath = os.path.join(directory, filename)
-    with open(filepath, 'w') as file:
-        file.write(result)
-        file.flush()
-        return filepath
+    formatter = get_formatter(filename, default='.lab', precision=2)
+    # janitor does not evict directory during analysis
+    with inflight(directory):
+        fd, partial = tempfile.mkstemp(suffix='.part', prefix=filename + '.', dir=directory)
+        try:
+            if not _acquire(filepath, partial):
+                yield from _follow(filepath, app.config.get('ANALYSIS_FOLLOW_INTERVAL', 0.5))
+                return
+            try:
+                if os.path.exists(filepath):
+                    # finished by concurrent analysis before lock was acquired
+                    with open(filepath) as file:
+                        yield tuple(formatter.load(file))
+                    return
+                with profiling.analysis(directory, profile), os.fdopen(fd, 'w') as file:
+                    fd = None
+                    touch(directory)
+                    transcript = get_configured_transcript()
+                    audio = os.path.join(directory, app.config['AUDIO_FILE_NAME'])
+                    start = 0.0
+                    for chord_sequence in transcript.iter_audio(audio):
+                        segments = tuple(to_segments(chord_sequence, start))
+                        if segments:
+                            start = segments[-1][1]
+                        formatter.dump(segments, file)
+                        file.flush()
+                        yield segments
+                os.replace(partial, filepath)
+            finally:
+                with suppress(FileNotFoundError):
+                    os.remove(_lock_path(filepath))
+        finally:
+            if fd is not None:
+                os.close(fd)
+            with suppress(FileNotFoundError):
+                os.remove(partial)
+
+
+def _stream_transcription(directory: str, download_url: str) -> Iterator[str]:
+    """ Yields events with segments of transcription as they are recognized """
+    filepath = os.path.join(directory, app.config['TRANSCRIPTION_FILE_NAME'])
+    if not os.path.exists(filepath):
+        try:
+            for segments in transcribe(directory, profiling.requested()):
+                yield _event('segments', [(round(a, 2), round(b, 2), label) for a, b, label in segments])
+        except FileNotFoundError:
+            # evicted meanwhile
+            yield _event('failure', 'Audio file not found.')
+            return
+        except Exception as e:
+            logger.exception(e)
+            yield _event('failure', 'Analysis failed.')
+            return
+    else:
+        with open(filepath) as file:
+            yield _event('segments', get_formatter(filepath, default='.lab').load(file))
+    yield _event('done', download_url)
 
 
 @bp.route('/<filename_token>', methods=['GET'])
 def index(filename_token):
-    token_dir = _resolve_token(filename_token)
-    if token_dir:
-        directory = os.path.join(app.config['UPLOAD_DIR'], token_dir)
-        if os.path.exists(directory) and os.path.isdir(directory):
-            filepath = os.path.join(directory, app.config['AUDIO_FILE_NAME'])
-            transcript = get_configured_transcript()
-            iterable = transcript.from_audio(filepath)
-            _save_transcription(directory, app.config['TRANSCRIPTION_FILE_NAME'], iterable)
-            g.transcription_url = url_for('download.index', filename_token=filename_token)
-            g.transcription = _format_transcription(iterable)
-            return render_template("analysis.html")
-    raise NotFound
+    directory = _resolve_directory(filename_token)
+    filepath = os.path.join(directory, app.config['TRANSCRIPTION_FILE_NAME'])
+    g.transcription_url = url_for('download.index', filename_token=filename_token)
+    if os.path.exists(filepath):
+        touch(directory)
+        with open(filepath) as file:
+            g.transcription = _format_segments(get_formatter(filepath, default='.lab').load(file))
+    else:
+        # transcription is streamed by events
+        g.transcription = _format_segments(())
+        g.events_url = url_for('analysis.events', filename_token=filename_token)
+    return render_template("analysis.html")
+
+
+@bp.route('/<filename_token>/events', methods=['GET'])
+def events(filename_token):
+    directory = _resolve_directory(filename_token)
+    download_url = url_for('download.index', filename_token=filename_token)
+    return Response(stream_with_context(_stream_transcription(directory, download_url)),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
@@ -0,0 +1,235 @@
+""" Batch analysis of archives of wav files
+
+Archive is POSTed as multipart file part 'archive' or as raw request body. Tar archives are read as stream member by
+member, zip archives are read from spooled file, because zip directory is at the end of archive. Every member is
+streamed into its own upload directory and analysed by background job, batch directory keeps manifest of members.
+Archive and declared sizes of all its members are limited to BATCH_MAX_BYTES, members larger than
+BATCH_MAX_MEMBER_BYTES are rejected without being read. Members which were not analysed when app stopped are queued
+again when app starts.
+"""
+import json
+import logging
+import lzma
+import os
+import posixpath
+import shutil
+import tarfile
+import tempfile
+import zipfile
+import zlib
+from typing import Iterator, Tuple, IO
+
+from flask import Blueprint, Flask, request, session, url_for, jsonify, send_file, current_app as app
+from werkzeug.exceptions import NotFound
+
+from . import jobs
+from .upload import wav_ingest, _generate_token
+from .utils import random_str, touch
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('batch', __name__, url_prefix='/batch')
+
+_MANIFEST = 'batch.json'
+_CHUNK_SIZE = 1 << 20
+_ZIP_MIMETYPES = ('application/zip', 'application/x-zip-compressed')
+# corrupted archives raise errors of their decompressors, unsupported zip methods and encrypted zip members raise
+# NotImplementedError and RuntimeError
+_ARCHIVE_ERRORS = (tarfile.TarError, zipfile.BadZipFile, zlib.error, lzma.LZMAError, EOFError, OSError,
+                   NotImplementedError, RuntimeError)
+
+
+class _ArchiveTooLarge(Exception):
+    pass
+
+
+class _LimitedReader(object):
+    """ Reader of stream which raises _ArchiveTooLarge once more than max_bytes were read """
+
+    def __init__(self, stream: IO[bytes], max_bytes: int) -> None:
+        super().__init__()
+        self._stream = stream
+        self._max_bytes = max_bytes
+        self._size = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._stream.read(size)
+        self._size += len(data)
+        if self._size > self._max_bytes:
+            raise _ArchiveTooLarge
+        return data
+
+
+def _members(stream: IO[bytes], is_zip: bool) -> Iterator[Tuple[str, int, IO[bytes]]]:
+    """ Yields names, declared sizes and streams of file members of archive """
+    if is_zip:
+        with zipfile.ZipFile(stream) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    with archive.open(info) as member:
+                        yield info.filename, info.file_size, member
+    else:
+        with tarfile.open(fileobj=stream, mode='r|*') as archive:
+            for info in archive:
+                if info.isfile():
+                    yield info.name, info.size, archive.extractfile(info)
+
+
+def _archive(max_bytes: int) -> Tuple[IO[bytes], bool]:
+    """ Returns archive stream of request and whether it is zip archive, archive is limited to max_bytes """
+    if 'archive' in request.files:
+        stream = request.files['archive'].stream
+        if stream.seek(0, os.SEEK_END) > max_bytes:
+            raise _ArchiveTooLarge
+        stream.seek(0)
+        is_zip = zipfile.is_zipfile(stream)
+        stream.seek(0)
+        return stream, is_zip
+    stream = _LimitedReader(request.stream, max_bytes)
+    if request.mimetype in _ZIP_MIMETYPES:
+        spooled = tempfile.SpooledTemporaryFile(max_size=_CHUNK_SIZE)
+        shutil.copyfileobj(stream, spooled, _CHUNK_SIZE)
+        spooled.seek(0)
+        return spooled, True
+    return stream, False
+
+
+def _member_name(name: str) -> str:
+    """ Relative path of member without parent references """
+    return posixpath.join(*(part for part in name.replace('\\', '/').split('/') if part not in ('', '.', '..')))
+
+
+def _resolve_batch(token: str) -> Tuple[str, dict]:
+    """ Resolve batch directory and manifest or raise NotFound """
+    secret = session.get(token, None)
+    if secret:
+        directory = os.path.join(app.config['UPLOAD_DIR'], secret)
+        try:
+            with open(os.path.join(directory, _MANIFEST)) as file:
+                manifest = json.load(file)
+        except FileNotFoundError:
+            raise NotFound
+        touch(directory)
+        return directory, manifest
+    raise NotFound
+
+
+@bp.route('/', methods=['POST'])
+def index():
+    ingest = wav_ingest()
+    max_files = app.config.get('BATCH_MAX_FILES', 500)
+    max_bytes = app.config.get('BATCH_MAX_BYTES', 1 << 32)
+    max_member_bytes = app.config.get('BATCH_MAX_MEMBER_BYTES', app.config.get('UPLOAD_MAX_BYTES', 1 << 30))
+    files, rejected, skipped = list(), list(), 0
+    created = False
+    try:
+        try:
+            stream, is_zip = _archive(max_bytes)
+            total = 0
+            for name, size, member in _members(stream, is_zip):
+                total += size
+                if total > max_bytes:
+                    raise _ArchiveTooLarge
+                if not name.lower().endswith('.wav') or len(files) >= max_files:
+                    skipped += 1
+                    continue
+                if size > max_member_bytes:
+                    rejected.append({'name': _member_name(name),
+                                     'error': 'File is larger than %d bytes.' % max_member_bytes})
+                    continue
+                wav = ingest(None, None, name)
+                for chunk in iter(lambda: member.read(_CHUNK_SIZE), b''):
+                    wav.write(chunk)
+                    if wav.error is not None:
+                        break
+                if wav.finish():
+                    files.append({'name': _member_name(name), 'directory': os.path.basename(wav.directory)})
+                else:
+                    rejected.append({'name': _member_name(name), 'error': wav.error})
+        except _ArchiveTooLarge:
+            return jsonify(error='Archive is larger than %d bytes.' % max_bytes), 413
+        except _ARCHIVE_ERRORS as e:
+            logger.info("Batch archive rejected: %r", e)
+            return jsonify(error='Archive is not valid zip or tar archive: %s' % e), 400
+
+        if not files:
+            return jsonify(error='Archive contains no valid wav file.', rejected=rejected, skipped=skipped), 400
+
+        secret = random_str()
+        directory = os.path.join(app.config['UPLOAD_DIR'], secret)
+        os.makedirs(directory)
+        with open(os.path.join(directory, _MANIFEST), 'w') as file:
+            json.dump({'files': files, 'rejected': rejected, 'skipped': skipped}, file)
+        created = True
+    finally:
+        # members of failed batch, e.g. of invalid archive or disconnected client, are removed with their in-flight
+        # markers
+        if not created:
+            ingest.discard()
+
+    for member in files:
+        jobs.submit_analysis(os.path.join(app.config['UPLOAD_DIR'], member['directory']))
+
+    token = _generate_token(secret)
+    return jsonify(token=token,
+                   files=len(files),
+                   rejected=rejected,
+                   skipped=skipped,
+                   status_url=url_for('batch.status', token=token),
+                   download_url=url_for('batch.download', token=token)), 202
+
+
+@bp.route('/<token>', methods=['GET'])
+def status(token):
+    directory, manifest = _resolve_batch(token)
+    states = [jobs.status(os.path.join(app.config['UPLOAD_DIR'], member['directory'])) for member in manifest['files']]
+    counts = {state: states.count(state) for state in (jobs.PENDING, jobs.RUNNING, jobs.DONE, jobs.FAILED,
+                                                          jobs.MISSING)}
+    return jsonify(total=len(states),
+                   progress=(len(states) - counts[jobs.PENDING] - counts[jobs.RUNNING]) / len(states),
+                   files=[{'name': member['name'], 'status': state}
+                          for member, state in zip(manifest['files'], states)],
+                   rejected=manifest['rejected'],
+                   **counts)
+
+
+@bp.route('/<token>/download', methods=['GET'])
+def download(token):
+    """ Zip archive of finished transcriptions, named by members of uploaded archive """
+    directory, manifest = _resolve_batch(token)
+    buffer = tempfile.SpooledTemporaryFile(max_size=_CHUNK_SIZE)
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for member in manifest['files']:
+            filepath = os.path.join(app.config['UPLOAD_DIR'], member['directory'],
+                                    app.config['TRANSCRIPTION_FILE_NAME'])
+            if os.path.exists(filepath):
+                archive.write(filepath, os.path.splitext(member['name'])[0] + '.lab')
+    buffer.seek(0)
+    return send_file(buffer, mimetype='application/zip', as_attachment=True, download_name='transcriptions.zip')
+
+
+def _pending(upload_dir: str) -> Iterator[str]:
+    """ Yields directories of batch members whose analysis is pending """
+    for entry in os.scandir(upload_dir):
+        try:
+            with open(os.path.join(entry.path, _MANIFEST)) as file:
+                manifest = json.load(file)
+        except (FileNotFoundError, NotADirectoryError, ValueError):
+            continue
+        for member in manifest['files']:
+            directory = os.path.join(upload_dir, member['directory'])
+            if jobs.status(directory) == jobs.PENDING:
+                yield directory
+
+
+def init_app(flask_app: Flask):
+    """ Queues analyses of batch members which were pending when app stopped, analysis which another process of app
+    runs meanwhile is followed, not repeated """
+    if not os.path.isdir(flask_app.config['UPLOAD_DIR']):
+        return
+    with flask_app.app_context():
+        pending = list(_pending(flask_app.config['UPLOAD_DIR']))
+        for directory in pending:
+            jobs.submit_analysis(directory)
+    if pending:
+        logger.info("Queued %d pending batch analyses", len(pending))
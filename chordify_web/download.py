@@ -4,6 +4,8 @@ from flask import (
     Blueprint, send_from_directory, current_app as app, session)
 from werkzeug.exceptions import NotFound
 
+from .utils import touch
+
 bp = Blueprint('download', __name__, url_prefix='/download')
 
 
@@ -19,5 +21,9 @@ def index(filename_token):
     if token_dir:
         directory = os.path.join(app.config['UPLOAD_DIR'], token_dir)
         filename = app.config['TRANSCRIPTION_FILE_NAME']
+        try:
+            touch(directory)
+        except FileNotFoundError:
+            raise NotFound
         return send_from_directory(directory, filename, as_attachment=True)
     raise NotFound
@@ -0,0 +1,129 @@
+""" Background eviction of upload directories
+
+Every upload is one entry, directory in UPLOAD_DIR. Entries older than UPLOAD_TTL seconds are evicted, then least
+recently accessed entries are evicted until total size fits UPLOAD_QUOTA_BYTES. Access time is modification time of
+entry, which is touched by analysis and download. Entries with in-flight operations are never evicted.
+"""
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Optional, Dict, List, NamedTuple
+
+from flask import Flask
+
+from .utils import is_inflight
+
+logger = logging.getLogger(__name__)
+
+_TRASH_PREFIX = '.evicted-'
+
+
+class _Entry(NamedTuple):
+    path: str
+    size: int
+    accessed: float
+
+
+def _entry(path: str) -> _Entry:
+    size = sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file(follow_symlinks=False))
+    return _Entry(path, size, os.stat(path).st_mtime)
+
+
+class _Janitor(threading.Thread):
+    """ Daemon thread which sweeps upload directory every interval seconds """
+
+    def __init__(self, upload_dir: str, quota_bytes: Optional[int] = None, ttl: Optional[float] = None,
+                 interval: float = 60.) -> None:
+        super().__init__(name='upload-janitor', daemon=True)
+        self.upload_dir = upload_dir
+        self.quota_bytes = quota_bytes
+        self.ttl = ttl
+        self.interval = interval
+        self.metrics: Dict[str, float] = {
+            'sweeps': 0, 'entries': 0, 'used_bytes': 0, 'evicted_entries': 0, 'reclaimed_bytes': 0,
+            'skipped_inflight': 0, 'last_sweep_seconds': 0.
+        }
+        self._stopped = threading.Event()
+
+    def _scan(self) -> List[_Entry]:
+        entries = list()
+        for entry in os.scandir(self.upload_dir):
+            if entry.is_dir(follow_symlinks=False):
+                try:
+                    if entry.name.startswith(_TRASH_PREFIX):
+                        # left by interrupted eviction
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                    else:
+                        entries.append(_entry(entry.path))
+                except FileNotFoundError:
+                    pass
+        return entries
+
+    def _evict(self, entry: _Entry) -> bool:
+        """ Entry is renamed first, so concurrent requests do not see partially removed entry. Markers are checked
+        after rename, operation which marked entry before rename keeps it and later operations do not find it. """
+        trash = os.path.join(self.upload_dir, _TRASH_PREFIX + os.path.basename(entry.path))
+        try:
+            os.rename(entry.path, trash)
+        except FileNotFoundError:
+            return False
+        if is_inflight(trash):
+            os.rename(trash, entry.path)
+            self.metrics['skipped_inflight'] += 1
+            return False
+        shutil.rmtree(trash, ignore_errors=True)
+        self.metrics['evicted_entries'] += 1
+        self.metrics['reclaimed_bytes'] += entry.size
+        return True
+
+    def sweep(self, now: float = None) -> int:
+        """ Evicts expired and least recently accessed entries over quota, returns reclaimed bytes """
+        begin = time.perf_counter()
+        now = time.time() if now is None else now
+        entries = sorted(self._scan(), key=lambda e: e.accessed)
+        used = sum(entry.size for entry in entries)
+        reclaimed = 0
+
+        for entry in entries:
+            expired = self.ttl is not None and now - entry.accessed > self.ttl
+            over_quota = self.quota_bytes is not None and used > self.quota_bytes
+            if not expired and not over_quota:
+                continue
+            if self._evict(entry):
+                used -= entry.size
+                reclaimed += entry.size
+
+        self.metrics['sweeps'] += 1
+        self.metrics['entries'] = len(entries)
+        self.metrics['used_bytes'] = used
+        self.metrics['last_sweep_seconds'] = time.perf_counter() - begin
+        if reclaimed:
+            logger.info("Janitor reclaimed %d bytes, %d bytes used, metrics %s", reclaimed, used, self.metrics)
+        if self.quota_bytes is not None and used > self.quota_bytes:
+            logger.warning("Upload directory uses %d bytes over quota %d bytes.", used, self.quota_bytes)
+        return reclaimed
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.exception(e)
+
+    def stop(self):
+        self._stopped.set()
+
+
+def init_app(app: Flask) -> Optional[_Janitor]:
+    """ Starts janitor of app upload directory if quota or ttl is configured """
+    quota_bytes = app.config.get('UPLOAD_QUOTA_BYTES', None)
+    ttl = app.config.get('UPLOAD_TTL', None)
+    if quota_bytes is None and ttl is None:
+        return None
+
+    janitor = _Janitor(app.config['UPLOAD_DIR'], quota_bytes, ttl, app.config.get('JANITOR_INTERVAL', 60.))
+    app.extensions['janitor'] = janitor
+    janitor.start()
+    return janitor
@@ -0,0 +1,64 @@
+""" Background analysis jobs
+
+Jobs run in thread pool of ANALYSIS_WORKERS threads inside app context. State of job is kept on file system next to
+audio file, so every process of the app reports same progress.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from flask import Flask, current_app as app
+
+from chordify import concurrency
+from . import profiling
+from .analysis import transcribe, running
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+MISSING = 'missing'
+
+
+def _error_path(directory: str) -> str:
+    return os.path.join(directory, app.config['TRANSCRIPTION_FILE_NAME'] + '.error')
+
+
+def _run(flask_app: Flask, directory: str, profile: bool):
+    with flask_app.app_context():
+        try:
+            for _ in transcribe(directory, profile):
+                pass
+        except Exception as e:
+            logger.exception(e)
+            if os.path.isdir(directory):
+                with open(_error_path(directory), 'w') as file:
+                    file.write(str(e))
+
+
+def submit_analysis(directory: str) -> Future:
+    """ Queues analysis of audio file in directory, profiled if request which queues it asks for profile """
+    return app.extensions['jobs'].submit(_run, app._get_current_object(), directory, profiling.requested())
+
+
+def status(directory: str) -> str:
+    """ State of analysis of audio file in directory """
+    if not os.path.isdir(directory):
+        return MISSING
+    if os.path.exists(os.path.join(directory, app.config['TRANSCRIPTION_FILE_NAME'])):
+        return DONE
+    if os.path.exists(_error_path(directory)):
+        return FAILED
+    if running(os.path.join(directory, app.config['TRANSCRIPTION_FILE_NAME'])):
+        return RUNNING
+    return PENDING
+
+
+def init_app(flask_app: Flask) -> ThreadPoolExecutor:
+    # workers share CPUs of N_JOBS, native thread pools of every worker are limited to its share
+    budget = concurrency.split(flask_app.config.get('N_JOBS'), flask_app.config.get('ANALYSIS_WORKERS', 2))
+    executor = budget.executor(thread_name_prefix='analysis')
+    flask_app.extensions['jobs'] = executor
+    return executor
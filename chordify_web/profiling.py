@@ -0,0 +1,154 @@
+""" Opt-in sampling profiler of analyses
+
+Every analysis records its duration. Analysis is profiled when PROFILE_ANALYSIS is set or when request which starts
+it carries ADMIN_TOKEN as value of PROFILE_HEADER, at most one profile every PROFILE_MIN_INTERVAL seconds. Header is
+ignored when ADMIN_TOKEN is not configured. Profiler thread samples stack of
+analysing thread every PROFILE_INTERVAL seconds, so analysis itself is not instrumented. Profile is saved in upload
+directory of analysis as folded stacks (one 'frame;frame;frame count' line per stack), which flame graph tools and
+speedscope read, so it is evicted by janitor together with its upload. Records are kept in memory of process.
+"""
+import hmac
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Optional, Dict, List
+
+from flask import Flask, current_app as app, request, has_request_context
+
+logger = logging.getLogger(__name__)
+
+
+def _frame_name(frame) -> str:
+    # qualified name of code is available since Python 3.11
+    code = frame.f_code
+    return '%s:%s' % (frame.f_globals.get('__name__', '?'), getattr(code, 'co_qualname', code.co_name))
+
+
+class _Sampler(threading.Thread):
+    """ Daemon thread which counts stacks of thread every interval seconds """
+
+    def __init__(self, thread_id: int, interval: float) -> None:
+        super().__init__(name='profile-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = list()
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self) -> Counter:
+        self._stopped.set()
+        self.join()
+        return self.stacks
+
+
+class _Profiler:
+    """ Rate limited profiler of analyses and records of recent analyses """
+
+    def __init__(self, file_name: str, interval: float = 0.005, min_interval: float = 60.,
+                 slow_seconds: float = 0., records: int = 100) -> None:
+        super().__init__()
+        self.file_name = file_name
+        self.interval = interval
+        self.min_interval = min_interval
+        self.slow_seconds = slow_seconds
+        self.records = deque(maxlen=records)
+        self.metrics: Dict[str, float] = {'analyses': 0, 'profiled': 0, 'rate_limited': 0}
+        self._last_profile = None
+        self._lock = threading.Lock()
+
+    def _acquire(self) -> bool:
+        """ Whether profile may start now """
+        with self._lock:
+            now = time.monotonic()
+            if self._last_profile is not None and now - self._last_profile < self.min_interval:
+                self.metrics['rate_limited'] += 1
+                return False
+            self._last_profile = now
+            return True
+
+    def _save(self, directory: str, stacks: Counter) -> Optional[str]:
+        filepath = os.path.join(directory, self.file_name)
+        try:
+            with open(filepath, 'w') as file:
+                for stack, count in stacks.most_common():
+                    file.write('%s %d\n' % (stack, count))
+        except OSError as e:
+            # upload was evicted meanwhile
+            logger.warning("Profile of %s was not saved: %s", directory, e)
+            return None
+        return filepath
+
+    @contextmanager
+    def analysis(self, directory: str, profile: bool = False):
+        """ Records duration of analysis of directory in calling thread, profiles it if requested and rate allows """
+        sampler = None
+        if profile and self._acquire():
+            sampler = _Sampler(threading.get_ident(), self.interval)
+            sampler.start()
+        begin, started = time.perf_counter(), time.time()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - begin
+            profile_path = self._save(directory, sampler.stop()) if sampler is not None else None
+            record = {'id': uuid.uuid4().hex, 'directory': os.path.basename(directory), 'started': started,
+                      'seconds': seconds, 'profile': profile_path is not None}
+            with self._lock:
+                self.metrics['analyses'] += 1
+                self.metrics['profiled'] += sampler is not None
+                self.records.append(record)
+            if profile_path is not None:
+                logger.info("Analysis of %s took %.3f s, profile saved to %s", directory, seconds, profile_path)
+
+    def slow(self) -> List[dict]:
+        """ Recent analyses at least slow_seconds long, most recent first """
+        with self._lock:
+            return [record for record in reversed(self.records) if record['seconds'] >= self.slow_seconds]
+
+    def profile_path(self, record_id: str) -> Optional[str]:
+        """ Path of profile of record, None if record has no profile """
+        with self._lock:
+            record = next((record for record in self.records if record['id'] == record_id), None)
+        if record is None or not record['profile']:
+            return None
+        return os.path.join(app.config['UPLOAD_DIR'], record['directory'], self.file_name)
+
+
+def requested() -> bool:
+    """ Whether analysis started by current request is profiled """
+    if app.config.get('PROFILE_ANALYSIS', False):
+        return True
+    token = app.config.get('ADMIN_TOKEN', None)
+    if not token or not has_request_context():
+        return False
+    header = request.headers.get(app.config.get('PROFILE_HEADER', 'X-Chordify-Profile'), '')
+    return hmac.compare_digest(header.encode(), token.encode())
+
+
+def analysis(directory: str, profile: bool = False):
+    """ Context of analysis of directory, see _Profiler.analysis """
+    return app.extensions['profiler'].analysis(directory, profile)
+
+
+def init_app(flask_app: Flask) -> _Profiler:
+    profiler = _Profiler(flask_app.config.get('PROFILE_FILE_NAME', 'profile.folded'),
+                         flask_app.config.get('PROFILE_INTERVAL', 0.005),
+                         flask_app.config.get('PROFILE_MIN_INTERVAL', 60.),
+                         flask_app.config.get('PROFILE_SLOW_SECONDS', 0.),
+                         flask_app.config.get('PROFILE_RECORDS', 100))
+    flask_app.extensions['profiler'] = profiler
+    return profiler
@@ -0,0 +1,40 @@
+window.onload = function () {
+
+    let analysis = document.getElementById('analysis');
+    let download = document.getElementById('download');
+    let url = analysis.dataset.events;
+
+    if (!url) {
+        return;
+    }
+
+    function appendSegment(segment) {
+        let span = document.createElement('span');
+        span.textContent = segment[0].toFixed(2) + ' ' + segment[1].toFixed(2) + ' ' + segment[2];
+        analysis.appendChild(span);
+        analysis.appendChild(document.createElement('br'));
+    }
+
+    let source = new EventSource(url);
+
+    source.addEventListener('segments', function (e) {
+        JSON.parse(e.data).forEach(appendSegment);
+    });
+
+    source.addEventListener('done', function (e) {
+        source.close();
+        download.setAttribute('href', JSON.parse(e.data));
+        download.style.display = 'inline';
+    });
+
+    source.addEventListener('failure', function (e) {
+        source.close();
+        alert("Error : " + JSON.parse(e.data));
+    });
+
+    source.onerror = function (e) {
+        // connection lost, browser would reconnect and start analysis again
+        source.close();
+    };
+
+};
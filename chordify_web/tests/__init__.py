@@ -0,0 +1,26 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from chordify_web import create_app
+
+
+def create_test_app(test_case: unittest.TestCase, **config):
+    """ App of tests config whose upload and session directories are removed after test case """
+    directory = tempfile.mkdtemp()
+    test_case.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+    os.makedirs(directory + '/upload')
+    app = create_app(dict({
+        'TESTING': True,
+        'SECRET_KEY': 'test',
+        'SESSION_TYPE': 'filesystem',
+        'SESSION_FILE_DIR': directory + '/session',
+        'UPLOAD_DIR': directory + '/upload',
+        'AUDIO_FILE_NAME': 'audio.wav',
+        'TRANSCRIPTION_FILE_NAME': 'transcription.lab',
+    }, **config))
+    test_case.addCleanup(app.extensions['jobs'].shutdown, wait=True)
+    if 'janitor' in app.extensions:
+        test_case.addCleanup(app.extensions['janitor'].stop)
+    return app
@@ -0,0 +1,148 @@
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import unittest.mock
+
+from chordify_web import analysis, jobs
+from chordify_web.tests import create_test_app
+from chordify_web.tests.test_ingest import _wav
+
+
+class _Transcript:
+    """ Transcript of two blocks, second block is recognized once released """
+
+    def __init__(self, fail: bool = False) -> None:
+        self.released = threading.Event()
+        self.fail = fail
+
+    def iter_audio(self, path):
+        yield [(1.0, 'C:maj')]
+        self.released.wait(10.)
+        if self.fail:
+            raise ValueError('Broken audio file.')
+        yield [(2.0, 'G:maj')]
+
+
+class TestTranscribe(unittest.TestCase):
+    def setUp(self):
+        self.app = create_test_app(self, ANALYSIS_FOLLOW_INTERVAL=0.01)
+        self.directory = tempfile.mkdtemp(dir=self.app.config['UPLOAD_DIR'])
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.filepath = os.path.join(self.directory, self.app.config['TRANSCRIPTION_FILE_NAME'])
+
+    def _patch(self, transcript):
+        patcher = unittest.mock.patch.object(analysis, 'get_configured_transcript', return_value=transcript)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _start(self, results: list) -> threading.Thread:
+        """ Thread which transcribes directory and appends segments or error to results """
+        def run():
+            with self.app.app_context():
+                try:
+                    results.extend(analysis.transcribe(self.directory))
+                except Exception as e:
+                    results.append(e)
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.addCleanup(thread.join, 10.)
+        return thread
+
+    def _wait_for_first_block(self):
+        for _ in range(1000):
+            holder = analysis._holder(self.filepath)
+            if holder is not None and holder[0] and os.path.getsize(holder[1]):
+                return
+            time.sleep(0.01)
+        self.fail('First block was not saved.')
+
+    def test_transcribe(self):
+        transcript = _Transcript()
+        transcript.released.set()
+        self._patch(transcript)
+
+        with self.app.app_context():
+            self.assertEqual(list(analysis.transcribe(self.directory)),
+                             [((0., 1., 'C:maj'),), ((1., 2., 'G:maj'),)])
+        self.assertEqual(sorted(os.listdir(self.directory)), [os.path.basename(self.filepath)])
+
+    def test_concurrent_follows_running(self):
+        transcript = _Transcript()
+        self._patch(transcript)
+        owner = list()
+        thread = self._start(owner)
+        self._wait_for_first_block()
+
+        with self.app.app_context():
+            follower = analysis.transcribe(self.directory)
+            self.assertEqual(next(follower), ((0., 1., 'C:maj'),))
+            self.assertEqual(jobs.status(self.directory), jobs.RUNNING)
+            transcript.released.set()
+            self.assertEqual([segment for segments in follower for segment in segments], [(1., 2., 'G:maj')])
+        thread.join()
+
+        self.assertEqual(owner, [((0., 1., 'C:maj'),), ((1., 2., 'G:maj'),)])
+        self.assertEqual(sorted(os.listdir(self.directory)), [os.path.basename(self.filepath)])
+        # only owner analyses audio
+        self.assertEqual(analysis.get_configured_transcript.call_count, 1)
+
+    def test_concurrent_failure(self):
+        transcript = _Transcript(fail=True)
+        self._patch(transcript)
+        owner = list()
+        thread = self._start(owner)
+        self._wait_for_first_block()
+
+        with self.app.app_context():
+            follower = analysis.transcribe(self.directory)
+            next(follower)
+            transcript.released.set()
+            self.assertRaises(RuntimeError, list, follower)
+        thread.join()
+        self.assertIsInstance(owner[-1], ValueError)
+
+    def test_stale_lock(self):
+        process = subprocess.Popen([sys.executable, '-c', ''])
+        process.wait()
+        stale = self.filepath + '.stale.part'
+        open(stale, 'w').close()
+        with open(self.filepath + '.lock', 'w') as file:
+            file.write('%d %s' % (process.pid, os.path.basename(stale)))
+        transcript = _Transcript()
+        transcript.released.set()
+        self._patch(transcript)
+
+        self.assertFalse(analysis.running(self.filepath))
+        with self.app.app_context():
+            self.assertEqual(len(list(analysis.transcribe(self.directory))), 2)
+        self.assertEqual(sorted(os.listdir(self.directory)), [os.path.basename(self.filepath)])
+
+
+class TestEvents(unittest.TestCase):
+    def test_events(self):
+        app = create_test_app(self)
+        client = app.test_client()
+        transcript = _Transcript()
+        transcript.released.set()
+        response = client.post('/upload/', data={'file': (io.BytesIO(_wav()), 'a.wav')},
+                               content_type='multipart/form-data')
+        token = response.headers['Location'].rstrip('/').rsplit('/', 1)[-1]
+
+        with unittest.mock.patch.object(analysis, 'get_configured_transcript', return_value=transcript):
+            events = client.get('/analysis/%s/events' % token).get_data(as_text=True)
+        self.assertEqual(events.count('event: segments'), 2)
+        self.assertIn('event: done', events)
+
+        # second request reads saved transcription
+        events = client.get('/analysis/%s/events' % token).get_data(as_text=True)
+        self.assertIn('[[0.0, 1.0, "C:maj"], [1.0, 2.0, "G:maj"]]', events)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import io
+import json
+import os
+import tarfile
+import time
+import unittest
+import unittest.mock
+import zipfile
+
+from chordify_web import analysis, jobs
+from chordify_web.tests import create_test_app
+from chordify_web.tests.test_ingest import _wav
+
+
+class _Transcript:
+    def iter_audio(self, path):
+        yield [(1.0, 'C:maj')]
+
+
+def _tar(members, mode='w') -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode=mode) as archive:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def _zip(members) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members:
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+_MEMBERS = (('songs/a.wav', _wav()), ('songs/../b.WAV', _wav()), ('notes.txt', b'text'), ('bad.wav', b'not wav'))
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        patcher = unittest.mock.patch.object(analysis, 'get_configured_transcript', return_value=_Transcript())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.app = create_test_app(self)
+        self.client = self.app.test_client()
+
+    def _entries(self):
+        return sorted(os.listdir(self.app.config['UPLOAD_DIR']))
+
+    def _wait(self, status_url):
+        for _ in range(500):
+            status = self.client.get(status_url).json
+            if status['progress'] == 1.:
+                return status
+            time.sleep(0.01)
+        self.fail('Batch was not analysed.')
+
+    def _check(self, response):
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json['files'], 2)
+        self.assertEqual(response.json['skipped'], 1)
+        self.assertEqual([member['name'] for member in response.json['rejected']], ['bad.wav'])
+
+        status = self._wait(response.json['status_url'])
+        self.assertEqual(status[jobs.DONE], 2)
+        self.assertEqual([member['name'] for member in status['files']], ['songs/a.wav', 'songs/b.WAV'])
+
+        download = self.client.get(response.json['download_url'])
+        with zipfile.ZipFile(io.BytesIO(download.data)) as archive:
+            self.assertEqual(sorted(archive.namelist()), ['songs/a.lab', 'songs/b.lab'])
+            self.assertEqual(archive.read('songs/a.lab'), b'0.00 1.00 C:maj\n')
+        download.close()
+
+    def test_tar(self):
+        for mode in ('w', 'w:gz'):
+            self._check(self.client.post('/batch/', data=_tar(_MEMBERS, mode), content_type='application/x-tar'))
+
+    def test_zip(self):
+        self._check(self.client.post('/batch/', data=_zip(_MEMBERS), content_type='application/zip'))
+
+    def test_multipart(self):
+        self._check(self.client.post('/batch/', data={'archive': (io.BytesIO(_zip(_MEMBERS)), 'songs.zip')},
+                                     content_type='multipart/form-data'))
+
+    def test_invalid_archive(self):
+        # truncated tar fails after first member was streamed, zip raises zlib error of corrupted member
+        data, zipped = _tar(_MEMBERS), _zip(_MEMBERS)
+        for body, content_type in ((data[:len(data) // 2], 'application/x-tar'),
+                                   (zipped[:60] + b'\xff' * 8 + zipped[68:], 'application/zip'),
+                                   (b'PK' + b'\0' * 100, 'application/zip')):
+            response = self.client.post('/batch/', data=body, content_type=content_type)
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self._entries(), [])
+
+    def test_no_wav(self):
+        response = self.client.post('/batch/', data=_tar((('notes.txt', b'text'),)), content_type='application/x-tar')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self._entries(), [])
+
+    def test_archive_too_large(self):
+        self.app.config['BATCH_MAX_BYTES'] = 3 * len(_wav()) // 2
+        for body, content_type in ((_tar(_MEMBERS), 'application/x-tar'), (_zip(_MEMBERS), 'application/zip')):
+            response = self.client.post('/batch/', data=body, content_type=content_type)
+            self.assertEqual(response.status_code, 413)
+        self.assertEqual(self._entries(), [])
+
+    def test_member_too_large(self):
+        self.app.config['BATCH_MAX_MEMBER_BYTES'] = len(_wav()) - 1
+        response = self.client.post('/batch/', data=_tar(_MEMBERS[:2] + (('small.wav', _wav(seconds=0.1)),)),
+                                    content_type='application/x-tar')
+
+        self.assertEqual(response.json['files'], 1)
+        self.assertEqual(response.json['rejected'][0]['error'], 'File is larger than %d bytes.' % (len(_wav()) - 1))
+
+
+class TestPendingJobs(unittest.TestCase):
+    def test_requeued_on_start(self):
+        app = create_test_app(self)
+        upload_dir = app.config['UPLOAD_DIR']
+        # batch whose member was queued but not analysed when app stopped
+        for name, data in (('member', _wav()), ('done', _wav())):
+            os.makedirs(os.path.join(upload_dir, name))
+            with open(os.path.join(upload_dir, name, app.config['AUDIO_FILE_NAME']), 'wb') as file:
+                file.write(data)
+        with open(os.path.join(upload_dir, 'done', app.config['TRANSCRIPTION_FILE_NAME']), 'w') as file:
+            file.write('0.00 1.00 G:maj')
+        os.makedirs(os.path.join(upload_dir, 'batch'))
+        with open(os.path.join(upload_dir, 'batch', 'batch.json'), 'w') as file:
+            json.dump({'files': [{'name': 'a.wav', 'directory': 'member'}, {'name': 'b.wav', 'directory': 'done'}],
+                       'rejected': [], 'skipped': 0}, file)
+
+        with unittest.mock.patch.object(analysis, 'get_configured_transcript', return_value=_Transcript()) as build:
+            restarted = create_test_app(self, UPLOAD_DIR=upload_dir)
+            restarted.extensions['jobs'].shutdown(wait=True)
+
+        build.assert_called_once()
+        with restarted.app_context():
+            self.assertEqual(jobs.status(os.path.join(upload_dir, 'member')), jobs.DONE)
+
+
+if __name__ == '__main__':
+    unittest.main()
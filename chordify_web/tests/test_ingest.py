@@ -0,0 +1,170 @@
+import hashlib
+import io
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import wave
+
+from chordify_web.tests import create_test_app
+from chordify_web.utils import WavIngest, is_inflight
+
+
+def _wav(sample_rate=44100, seconds=0.5, channels=1) -> bytes:
+    """ Wav file of silence written by wave module """
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(b'\0' * int(sample_rate * seconds) * 2 * channels)
+    return buffer.getvalue()
+
+
+def _chunk(chunk_id: bytes, data: bytes) -> bytes:
+    return chunk_id + struct.pack('<I', len(data)) + data + b'\0' * (len(data) & 1)
+
+
+def _fmt(wave_format=1, channels=1, sample_rate=44100) -> bytes:
+    return _chunk(b'fmt ', struct.pack('<HHIIHH', wave_format, channels, sample_rate, sample_rate * 2 * channels,
+                                       2 * channels, 16))
+
+
+def _riff(*chunks: bytes) -> bytes:
+    body = b'WAVE' + b''.join(chunks)
+    return b'RIFF' + struct.pack('<I', len(body)) + body
+
+
+class TestWavIngest(unittest.TestCase):
+    def setUp(self):
+        self.upload_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.upload_dir)
+        self.ingest = WavIngest(self.upload_dir, 'audio.wav', max_bytes=1 << 20, max_duration=10.)
+
+    def _stream(self, data: bytes, chunk_size: int = 7):
+        """ Stream of data written in small chunks, so header is parsed from partial chunks """
+        stream = self.ingest(None, None, 'audio.wav')
+        for start in range(0, len(data), chunk_size):
+            stream.write(data[start:start + chunk_size])
+        return stream
+
+    def test_valid(self):
+        data = _wav()
+        stream = self._stream(data)
+
+        self.assertTrue(stream.finish())
+        self.assertEqual(stream.sample_rate, 44100)
+        self.assertAlmostEqual(stream.duration, 0.5)
+        self.assertEqual(stream.hexdigest(), hashlib.sha256(data).hexdigest())
+        with open(stream.filepath, 'rb') as file:
+            self.assertEqual(file.read(), data)
+        self.assertEqual(os.listdir(stream.directory), ['audio.wav'])
+
+    def test_chunks_before_data(self):
+        data = _riff(_chunk(b'LIST', b'odd'), _fmt(), _chunk(b'data', b'\0' * 100))
+
+        self.assertTrue(self._stream(data).finish())
+
+    def test_unknown_data_size(self):
+        # streaming encoders write data size 0 and leave it
+        data = _riff(_fmt(), b'data' + struct.pack('<I', 0) + b'\0' * 1000)
+        stream = self._stream(data)
+
+        self.assertTrue(stream.finish())
+        self.assertAlmostEqual(stream.duration, 1000 / 88200.)
+
+    def test_not_riff(self):
+        stream = self._stream(b'OggS' + b'\0' * 100)
+
+        self.assertFalse(stream.finish())
+        self.assertEqual(stream.error, 'File is not valid wav file.')
+        self.assertFalse(os.path.exists(stream.directory))
+
+    def test_truncated_header(self):
+        for data in (_wav()[:10], _wav()[:30], _riff(_fmt())):
+            stream = self._stream(data)
+            self.assertFalse(stream.finish())
+            self.assertEqual(stream.error, 'File is not valid wav file.')
+            self.assertFalse(os.path.exists(stream.directory))
+
+    def test_data_before_format(self):
+        self.assertFalse(self._stream(_riff(_chunk(b'data', b'\0' * 100), _fmt())).finish())
+
+    def test_non_pcm_format(self):
+        # IEEE float and mp3 in wav container
+        for wave_format in (0x0003, 0x0055):
+            stream = self._stream(_riff(_fmt(wave_format), _chunk(b'data', b'\0' * 100)))
+            self.assertFalse(stream.finish())
+            self.assertEqual(stream.error, 'File is not valid wav file.')
+
+    def test_sampling_rate(self):
+        stream = self._stream(_wav(sample_rate=8000))
+
+        self.assertFalse(stream.finish())
+        self.assertEqual(stream.error, 'File has wrong sampling rate ( sampling rate < 22050).')
+
+    def test_oversize_data_chunk(self):
+        # declared size of data is rejected as soon as header arrives
+        data = _riff(_fmt(), b'data' + struct.pack('<I', 20 * 88200)) + b'\0' * 100
+        stream = self._stream(data)
+
+        self.assertEqual(stream.error, 'File is longer than 10 seconds.')
+        self.assertFalse(stream.finish())
+        self.assertFalse(os.path.exists(stream.directory))
+
+    def test_max_bytes(self):
+        stream = self._stream(_riff(_fmt(), b'data' + struct.pack('<I', 0)) + b'\0' * (1 << 20), 1 << 16)
+
+        self.assertEqual(stream.error, 'File is larger than %d bytes.' % (1 << 20))
+        self.assertFalse(stream.finish())
+
+    def test_header_too_long(self):
+        stream = self._stream(_riff(_fmt(), _chunk(b'junk', b'\0' * (1 << 17))), 1 << 12)
+
+        self.assertFalse(stream.finish())
+        self.assertFalse(os.path.exists(stream.directory))
+
+    def test_discard(self):
+        kept, other = self._stream(_wav()), self._stream(_wav())
+
+        self.ingest.discard(keep=kept)
+
+        self.assertEqual(os.listdir(self.upload_dir), [os.path.basename(kept.directory)])
+
+    def test_inflight_marker(self):
+        stream, removed = self._stream(_wav()), self._stream(_wav())
+        self.assertTrue(is_inflight(stream.directory))
+
+        self.assertTrue(stream.finish())
+        self.assertFalse(is_inflight(stream.directory))
+
+        # directory removed while file was streamed, e.g. by janitor
+        shutil.rmtree(removed.directory)
+        removed.discard()
+
+
+class TestUpload(unittest.TestCase):
+    def setUp(self):
+        self.app = create_test_app(self)
+        self.client = self.app.test_client()
+
+    def test_upload(self):
+        response = self.client.post('/upload/', data={'file': (io.BytesIO(_wav()), 'a.wav')},
+                                    content_type='multipart/form-data')
+
+        self.assertEqual(response.status_code, 302)
+        directory, = os.listdir(self.app.config['UPLOAD_DIR'])
+        self.assertEqual(os.listdir(os.path.join(self.app.config['UPLOAD_DIR'], directory)), ['audio.wav'])
+
+    def test_rejected_files_removed(self):
+        for data in ({'file': (io.BytesIO(b'not wav'), 'a.wav')},
+                     {'file': (io.BytesIO(_wav()), '')},
+                     {'other': (io.BytesIO(_wav()), 'a.wav')}):
+            response = self.client.post('/upload/', data=data, content_type='multipart/form-data')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(os.listdir(self.app.config['UPLOAD_DIR']), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
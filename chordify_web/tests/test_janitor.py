@@ -0,0 +1,121 @@
+import io
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+import unittest.mock
+
+from chordify_web import janitor
+from chordify_web.tests import create_test_app
+from chordify_web.utils import inflight, is_inflight
+from chordify_web.utils.file import _INFLIGHT_PREFIX
+from chordify_web.utils.ingest import _WavIngestStream
+
+
+def _dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, '-c', ''])
+    process.wait()
+    return process.pid
+
+
+class TestJanitor(unittest.TestCase):
+    def setUp(self):
+        self.upload_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.upload_dir)
+
+    def _entry(self, name: str, size: int, accessed: float) -> str:
+        path = os.path.join(self.upload_dir, name)
+        os.makedirs(path)
+        with open(os.path.join(path, 'audio.wav'), 'wb') as file:
+            file.write(b'\0' * size)
+        os.utime(path, (accessed, accessed))
+        return path
+
+    def test_ttl(self):
+        self._entry('old', 10, 1000.)
+        self._entry('new', 10, 1900.)
+
+        reclaimed = janitor._Janitor(self.upload_dir, ttl=500.).sweep(now=2000.)
+
+        self.assertEqual(reclaimed, 10)
+        self.assertEqual(os.listdir(self.upload_dir), ['new'])
+
+    def test_quota_evicts_least_recently_accessed(self):
+        for name, accessed in (('a', 1000.), ('b', 3000.), ('c', 2000.)):
+            self._entry(name, 100, accessed)
+
+        sweeper = janitor._Janitor(self.upload_dir, quota_bytes=150)
+        sweeper.sweep(now=4000.)
+
+        self.assertEqual(os.listdir(self.upload_dir), ['b'])
+        self.assertEqual(sweeper.metrics['evicted_entries'], 2)
+        self.assertEqual(sweeper.metrics['used_bytes'], 100)
+
+    def test_inflight_kept(self):
+        path = self._entry('busy', 10, 1000.)
+        sweeper = janitor._Janitor(self.upload_dir, ttl=0.)
+
+        with inflight(path):
+            sweeper.sweep(now=time.time() + 10.)
+            self.assertTrue(os.path.isdir(path))
+        self.assertEqual(os.listdir(path), ['audio.wav'])
+        self.assertEqual(sweeper.metrics['skipped_inflight'], 1)
+
+        sweeper.sweep(now=time.time() + 10.)
+        self.assertFalse(os.path.exists(path))
+
+    def test_inflight_directory_removed(self):
+        path = self._entry('removed', 10, 1000.)
+
+        # operation which removes its directory, e.g. rejected upload, does not fail on release of marker
+        with inflight(path):
+            shutil.rmtree(path)
+
+    def test_marked_during_eviction_kept(self):
+        path = self._entry('busy', 10, 1000.)
+        sweeper = janitor._Janitor(self.upload_dir, ttl=0.)
+
+        # operation marks entry after janitor selected it, markers are checked after entry was renamed
+        with unittest.mock.patch.object(janitor, 'is_inflight', side_effect=lambda p: not p.endswith('/busy')):
+            sweeper.sweep(now=time.time() + 10.)
+
+        self.assertEqual(os.listdir(self.upload_dir), ['busy'])
+        self.assertEqual(sweeper.metrics['skipped_inflight'], 1)
+
+    def test_stale_marker(self):
+        path = self._entry('stale', 10, 1000.)
+        open(os.path.join(path, '%s%d-marker' % (_INFLIGHT_PREFIX, _dead_pid())), 'w').close()
+
+        self.assertFalse(is_inflight(path))
+        janitor._Janitor(self.upload_dir, ttl=0.).sweep(now=time.time() + 10.)
+        self.assertFalse(os.path.exists(path))
+
+    def test_interrupted_eviction_removed(self):
+        self._entry(janitor._TRASH_PREFIX + 'old', 10, 1000.)
+
+        janitor._Janitor(self.upload_dir).sweep()
+
+        self.assertEqual(os.listdir(self.upload_dir), [])
+
+
+class TestIngestMarkers(unittest.TestCase):
+    def test_failed_upload(self):
+        app = create_test_app(self)
+        header = b'RIFF' + struct.pack('<I', 36 + 1000) + b'WAVE' + \
+            b'fmt ' + struct.pack('<IHHIIHH', 16, 1, 1, 44100, 88200, 2, 16) + b'data' + struct.pack('<I', 1000)
+
+        # file is removed with its marker when request fails after file was streamed, e.g. on full disk
+        with unittest.mock.patch.object(_WavIngestStream, 'finish', side_effect=OSError('No space left on device')):
+            with self.assertRaises(OSError):
+                app.test_client().post('/upload/', data={'file': (io.BytesIO(header + b'\0' * 1000), 'a.wav')},
+                                       content_type='multipart/form-data')
+
+        self.assertEqual(os.listdir(app.config['UPLOAD_DIR']), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+import time
+import types
+import unittest
+
+from chordify_web import profiling
+from chordify_web.tests import create_test_app
+
+
+def _busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_profile(self):
+        profiler = profiling._Profiler('profile.folded', interval=0.001)
+        with profiler.analysis(self.directory, profile=True):
+            _busy(0.1)
+
+        with open(os.path.join(self.directory, 'profile.folded')) as file:
+            stacks = file.read()
+        self.assertIn('test_profiling:_busy', stacks)
+        self.assertTrue(profiler.records[0]['profile'])
+        self.assertEqual(profiler.metrics['profiled'], 1)
+
+    def test_duration_without_profile(self):
+        profiler = profiling._Profiler('profile.folded', slow_seconds=0.05)
+        with profiler.analysis(self.directory):
+            pass
+        with profiler.analysis(self.directory):
+            _busy(0.06)
+
+        self.assertEqual(os.listdir(self.directory), [])
+        self.assertEqual(profiler.metrics['analyses'], 2)
+        self.assertEqual(len(profiler.slow()), 1)
+        self.assertFalse(profiler.slow()[0]['profile'])
+
+    def test_rate_limit(self):
+        profiler = profiling._Profiler('profile.folded', min_interval=60.)
+        for _ in range(3):
+            with profiler.analysis(self.directory, profile=True):
+                pass
+
+        self.assertEqual(profiler.metrics['profiled'], 1)
+        self.assertEqual(profiler.metrics['rate_limited'], 2)
+        self.assertEqual([record['profile'] for record in profiler.records], [True, False, False])
+
+    def test_frame_name_without_qualname(self):
+        frame = types.SimpleNamespace(f_globals={'__name__': 'module'}, f_code=types.SimpleNamespace(co_name='f'))
+        self.assertEqual(profiling._frame_name(frame), 'module:f')
+
+
+class TestRequested(unittest.TestCase):
+    def test_header_needs_admin_token(self):
+        app = create_test_app(self, ADMIN_TOKEN='secret')
+        for headers, expected in (({}, False), ({'X-Chordify-Profile': '1'}, False),
+                                  ({'X-Chordify-Profile': 'secret'}, True)):
+            with app.test_request_context(headers=headers):
+                self.assertEqual(profiling.requested(), expected)
+
+    def test_header_ignored_without_admin_token(self):
+        app = create_test_app(self)
+        with app.test_request_context(headers={'X-Chordify-Profile': 'secret'}):
+            self.assertFalse(profiling.requested())
+
+    def test_profile_analysis(self):
+        app = create_test_app(self, PROFILE_ANALYSIS=True)
+        with app.app_context():
+            self.assertTrue(profiling.requested())
+
+
+class TestAdmin(unittest.TestCase):
+    def setUp(self):
+        self.app = create_test_app(self, ADMIN_TOKEN='secret', PROFILE_INTERVAL=0.001)
+        self.client = self.app.test_client()
+        self.authorization = {'Authorization': 'Bearer secret'}
+
+    def test_not_found_without_token(self):
+        app = create_test_app(self)
+        self.assertEqual(app.test_client().get('/admin/analyses').status_code, 404)
+
+    def test_unauthorized(self):
+        self.assertEqual(self.client.get('/admin/analyses').status_code, 401)
+        self.assertEqual(self.client.get('/admin/analyses', headers={'Authorization': 'Bearer guess'}).status_code,
+                         401)
+
+    def test_analyses_and_profile(self):
+        directory = os.path.join(self.app.config['UPLOAD_DIR'], 'token')
+        os.makedirs(directory)
+        with self.app.app_context(), profiling.analysis(directory, profile=True):
+            _busy(0.05)
+
+        response = self.client.get('/admin/analyses', headers=self.authorization)
+        self.assertEqual(response.status_code, 200)
+        record, = response.json['analyses']
+        self.assertEqual(record['directory'], 'token')
+        self.assertEqual(response.json['profiler']['profiled'], 1)
+
+        response = self.client.get('/admin/analyses/%s/profile' % record['id'], headers=self.authorization)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'_busy', response.data)
+        response.close()
+        self.assertEqual(self.client.get('/admin/analyses/unknown/profile', headers=self.authorization).status_code,
+                         404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,10 @@
 import logging
+import os
 
 from flask import (
     Blueprint, request, flash, redirect, url_for, render_template, current_app as app, session)
 
-from .utils import is_wav_file, check_sampling, random_str, save_music_file, require_mime
+from .utils import random_str, require_mime, WavIngest
 
 logger = logging.getLogger(__name__)
 
@@ -17,32 +18,47 @@ def _generate_token(secret):
     return _token
 
 
+def wav_ingest() -> WavIngest:
+    """ Returns ingest of wav files configured via app config """
+    return WavIngest(
+        app.config["UPLOAD_DIR"],
+        app.config["AUDIO_FILE_NAME"],
+        app.config.get("UPLOAD_MIN_SAMPLING_RATE", 22050),
+        app.config.get("UPLOAD_MAX_BYTES", 1 << 30),
+        app.config.get("UPLOAD_MAX_DURATION", 3600.)
+    )
+
+
 @bp.route('/', methods=['GET', 'POST'])
 @require_mime("multipart/form-data", 'POST')
 def index():
     if request.method == 'POST':
-        # check if the post request has the file part
-
-        if 'file' in request.files:
-            file = request.files['file']
-            # if user does not select file, browser also
-            # submit an empty part without filename
-            if file and file.filename != '':
-                if is_wav_file(file):
-                    if check_sampling(file):
-                        secret, filepath = save_music_file(
-                            file,
-                            app.config["UPLOAD_DIR"],
-                            app.config["AUDIO_FILE_NAME"]
-                        )
+        # uploaded files are streamed into upload directory while request is parsed
+        ingest = request.file_stream_factory = wav_ingest()
+        accepted = None
+        try:
+            # check if the post request has the file part
+            if 'file' in request.files:
+                file = request.files['file']
+                stream = file.stream
+                # if user does not select file, browser also
+                # submit an empty part without filename
+                if file and file.filename != '':
+                    if stream.finish():
+                        accepted = stream
+                        logger.info("Uploaded %s, %d bytes, sha256 %s", stream.directory, stream.size,
+                                    stream.hexdigest())
+                        secret = os.path.basename(stream.directory)
                         return redirect(url_for('analysis.index', filename_token=_generate_token(secret)))
                     else:
-                        flash("File has wrong bitrate ( bitrate > 22050).")
+                        flash(stream.error)
                 else:
-                    flash("File is not valid wav file.")
+                    flash("No selected file.")
             else:
-                flash("No selected file.")
-        else:
-            flash("No file sent.")
-        return render_template("upload_error.html"), 400
+                flash("No file sent.")
+            return render_template("upload_error.html"), 400
+        finally:
+            # files of other parts, files of failed request, e.g. of disconnected client, and their in-flight markers
+            # are removed
+            ingest.discard(keep=accepted)
     return render_template("upload.html")
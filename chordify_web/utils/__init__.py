@@ -1,3 +1,5 @@
 from .decorator import suppress_exception, require_mime
-from .file import is_wav_file, check_sampling, save_music_file
+from .file import is_wav_file, check_sampling, save_music_file, inflight, mark_inflight, unmark_inflight, is_inflight, \
+    touch, process_alive
+from .ingest import IngestRequest, WavIngest
 from .random import random_str
@@ -1,7 +1,8 @@
 import logging
 import os
+import uuid
 import wave
-from contextlib import contextmanager
+from contextlib import contextmanager, suppress
 from shutil import copyfileobj
 from typing import Tuple
 
@@ -57,3 +58,53 @@ def save_music_file(stream, upload_dir: str, filename: str) -> Tuple[str, str]:
     """ Save music file into directory and returns new directory - filepath tuple """
     directory = random_str()
     return directory, _save_file(stream, os.path.join(upload_dir, directory), filename)
+
+
+_INFLIGHT_PREFIX = '.inflight-'
+
+
+def mark_inflight(directory: str) -> str:
+    """ Marks directory as used by running operation and returns marker, janitor never evicts marked directories """
+    marker = os.path.join(directory, '%s%d-%s' % (_INFLIGHT_PREFIX, os.getpid(), uuid.uuid4().hex))
+    open(marker, 'w').close()
+    return marker
+
+
+def unmark_inflight(marker: str):
+    """ Removes marker of mark_inflight, marker of removed directory is ignored """
+    with suppress(FileNotFoundError):
+        os.remove(marker)
+
+
+@contextmanager
+def inflight(directory: str):
+    """ Marks directory as used by running operation, janitor never evicts marked directories """
+    marker = mark_inflight(directory)
+    try:
+        yield directory
+    finally:
+        unmark_inflight(marker)
+
+
+def process_alive(pid: int) -> bool:
+    """ Checks whether process of pid runs """
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def is_inflight(directory: str) -> bool:
+    """ Checks markers of running operations, markers left by dead processes are ignored """
+    for name in os.listdir(directory):
+        if name.startswith(_INFLIGHT_PREFIX) and process_alive(int(name[len(_INFLIGHT_PREFIX):].split('-', 1)[0])):
+            return True
+    return False
+
+
+def touch(directory: str):
+    """ Marks access of directory by its modification time """
+    os.utime(directory)
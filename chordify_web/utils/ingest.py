@@ -0,0 +1,184 @@
+import hashlib
+import logging
+import os
+import struct
+from typing import List, Optional
+
+from flask import Request
+
+from .file import mark_inflight, unmark_inflight
+from .random import random_str
+
+_WAVE_FORMATS = (0x0001, 0xFFFE)  # PCM, extensible
+_MAX_HEADER_SIZE = 1 << 16
+_UNKNOWN_SIZES = (0, 0xFFFFFFFF)  # data size written by streaming encoders
+
+
+class IngestRequest(Request):
+    """ Request which creates streams of uploaded files by file_stream_factory, if view sets one """
+
+    file_stream_factory = None
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.file_stream_factory is not None:
+            return self.file_stream_factory(total_content_length, content_type, filename, content_length)
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+
+class _WavIngestStream(object):
+    """ Writable stream which saves wav file directly into its directory, header is validated, limits are enforced
+    and content hash is computed while data arrive. Rejected file is removed with its directory. """
+
+    def __init__(self, directory: str, filename: str, min_sr: int, max_bytes: int, max_duration: float,
+                 buffer_size: int = 1 << 20) -> None:
+        super().__init__()
+        try:
+            # can throw error if directory exists, this is not expected
+            os.makedirs(directory)
+        except OSError:
+            raise NameError('Directory already exists.')
+
+        self.directory = directory
+        self.filepath = os.path.join(directory, filename)
+        self.error: Optional[str] = None
+        self.size = 0
+        self.sample_rate: Optional[int] = None
+        self.duration: Optional[float] = None
+        self._min_sr = min_sr
+        self._max_bytes = max_bytes
+        self._max_duration = max_duration
+        self._hash = hashlib.sha256()
+        self._header = bytearray()
+        self._byte_rate = None
+        self._data_offset = None
+        self._data_size = None
+        self._marker = mark_inflight(directory)
+        self._file = open(self.filepath, 'wb+', buffering=buffer_size)
+
+    def _release(self):
+        if self._marker is not None:
+            unmark_inflight(self._marker)
+            self._marker = None
+
+    def _reject(self, error: str):
+        logging.getLogger(__name__).log(logging.INFO, error)
+        self.error = error
+        self.discard()
+
+    def _parse_header(self):
+        header = self._header
+        if len(header) >= 12 and (header[:4] != b'RIFF' or header[8:12] != b'WAVE'):
+            return self._reject('File is not valid wav file.')
+
+        offset = 12
+        while offset + 8 <= len(header):
+            chunk_id, chunk_size = bytes(header[offset:offset + 4]), struct.unpack_from('<I', header, offset + 4)[0]
+            if chunk_id == b'data':
+                if self._byte_rate is None:
+                    return self._reject('File is not valid wav file.')
+                self._data_offset, self._data_size = offset + 8, chunk_size
+                self._header = None
+                return None if chunk_size in _UNKNOWN_SIZES else self._check_duration(chunk_size)
+            if offset + 8 + chunk_size > len(header):
+                break
+            if chunk_id == b'fmt ':
+                if chunk_size < 16:
+                    return self._reject('File is not valid wav file.')
+                wave_format, channels, sample_rate, byte_rate = struct.unpack_from('<HHII', header, offset + 8)
+                if wave_format not in _WAVE_FORMATS or channels == 0 or byte_rate == 0:
+                    return self._reject('File is not valid wav file.')
+                if sample_rate < self._min_sr:
+                    return self._reject('File has wrong sampling rate ( sampling rate < %d).' % self._min_sr)
+                self.sample_rate, self._byte_rate = sample_rate, byte_rate
+            offset += 8 + chunk_size + (chunk_size & 1)
+
+        if len(header) > _MAX_HEADER_SIZE:
+            self._reject('File is not valid wav file.')
+
+    def _check_duration(self, data_size: int):
+        self.duration = data_size / self._byte_rate
+        if self.duration > self._max_duration:
+            self._reject('File is longer than %d seconds.' % self._max_duration)
+
+    def write(self, data: bytes) -> int:
+        if self.error is None:
+            self.size += len(data)
+            if self.size > self._max_bytes:
+                self._reject('File is larger than %d bytes.' % self._max_bytes)
+                return len(data)
+            if self._header is not None:
+                self._header += data
+                self._parse_header()
+            if self.error is None:
+                self._hash.update(data)
+                self._file.write(data)
+        return len(data)
+
+    def finish(self) -> bool:
+        """ Validates complete file, flushes it to disk and returns True if file was accepted """
+        if self.error is None and self._data_offset is None:
+            self._reject('File is not valid wav file.')
+        if self.error is None:
+            data_size = self.size - self._data_offset
+            self._check_duration(data_size if self._data_size in _UNKNOWN_SIZES else min(self._data_size, data_size))
+        if self.error is None:
+            self._file.close()
+            self._release()
+        return self.error is None
+
+    def hexdigest(self) -> str:
+        """ SHA-256 of file content """
+        return self._hash.hexdigest()
+
+    def discard(self):
+        """ Removes file and its directory """
+        self._file.close()
+        self._release()
+        try:
+            os.remove(self.filepath)
+            os.rmdir(self.directory)
+        except OSError as e:
+            logging.getLogger(__name__).log(logging.WARNING, e)
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return 0 if self._file.closed else self._file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return 0 if self._file.closed else self._file.tell()
+
+    def read(self, size: int = -1) -> bytes:
+        return b'' if self._file.closed else self._file.read(size)
+
+    def readline(self, size: int = -1) -> bytes:
+        return b'' if self._file.closed else self._file.readline(size)
+
+    def close(self):
+        self._file.close()
+        self._release()
+
+
+class WavIngest(object):
+    """ File stream factory of IngestRequest, every uploaded file is streamed into new random directory of
+    upload directory """
+
+    def __init__(self, upload_dir: str, filename: str, min_sr: int = 22050, max_bytes: int = 1 << 30,
+                 max_duration: float = 3600.) -> None:
+        super().__init__()
+        self._upload_dir = upload_dir
+        self._filename = filename
+        self._min_sr = min_sr
+        self._max_bytes = max_bytes
+        self._max_duration = max_duration
+        self.streams: List[_WavIngestStream] = list()
+
+    def __call__(self, total_content_length, content_type, filename=None, content_length=None) -> _WavIngestStream:
+        stream = _WavIngestStream(os.path.join(self._upload_dir, random_str()), self._filename, self._min_sr,
+                                  self._max_bytes, self._max_duration)
+        self.streams.append(stream)
+        return stream
+
+    def discard(self, keep: _WavIngestStream = None):
+        """ Removes all accepted files except keep """
+        for stream in self.streams:
+            if stream is not keep and stream.error is None:
+                stream.discard()
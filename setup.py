@@ -6,7 +6,9 @@ setup(
     include_package_data=True,
     zip_safe=False,
     install_requires=[
-        'flask', 'werkzeug', 'sklearn', 'numpy', 'librosa', 'scipy', 'pandas', 'PyYAML', 'joblib',
-        'lark-parser'
+        'flask', 'werkzeug', 'scikit-learn', 'numpy', 'scipy', 'soxr', 'pandas', 'PyYAML', 'joblib', 'threadpoolctl',
+        'lark-parser',
+        # CQT filter bank is cached from librosa internals, which are tested only against this release
+        'librosa>=0.11,<0.12'
     ],
 )
\ No newline at end of file